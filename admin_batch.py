@@ -0,0 +1,216 @@
+"""Apply a batch of admin create/update/delete/reorder operations at once.
+
+``POST /admin/batch`` takes ``{"operations": [...]}`` where each operation is
+one of::
+
+    {"op": "create", "type": "link", "title": "...", "url": "...", "icon": "..."}
+    {"op": "update", "type": "gear", "id": 3, "price": "$20"}
+    {"op": "delete", "type": "link", "id": 7}
+    {"op": "reorder", "type": "link", "ids": [4, 2, 9]}
+
+A reorder moves the listed items to the top in that order; the rest keep
+their relative order below them.
+
+``type`` defaults to ``link``. Operations apply in order, but consecutive
+operations of the same kind are coalesced into one multi-row statement, so
+reordering 50 links is a single executemany. Everything runs in the caller's
+transaction; one invalid operation rejects the whole batch before anything
+is written.
+"""
+from itertools import groupby
+
+from sqlalchemy import bindparam, delete, func, insert, select, update
+
+OPS = ('create', 'update', 'delete', 'reorder')
+MAX_OPERATIONS = 1000
+
+
+class BatchError(ValueError):
+    """An invalid operation; nothing in the batch was applied."""
+
+
+class Target:
+    """A model the batch endpoint may change, and the fields it may set"""
+    __slots__ = ('model', 'fields', 'required', 'owned')
+
+    def __init__(self, model, fields, required=None, owned=False):
+        self.model = model
+        self.fields = tuple(fields)
+        self.required = tuple(fields if required is None else required)
+        # Owned rows carry a user_id and may only be changed by that user
+        self.owned = owned
+
+    @property
+    def ordered(self):
+        return 'position' in self.model.__table__.c
+
+
+class BatchResult:
+    """Ids created and touched by a batch, for the response and cache invalidation"""
+    __slots__ = ('created', 'changed', 'images')
+
+    def __init__(self):
+        self.created = []
+        self.changed = {}
+        self.images = []
+
+    def touch(self, kind, ids):
+        self.changed.setdefault(kind, set()).update(ids)
+
+
+def apply(session, targets, operations, user_id):
+    """Validate ``operations`` and write them through ``session`` without committing"""
+    operations = [_validate(targets, number, operation) for number, operation in _enumerate(operations)]
+    _check_ids(session, targets, operations, user_id)
+
+    result = BatchResult()
+    for (op, kind), run in groupby(operations, key=lambda operation: (operation[0], operation[1])):
+        run = [payload for _, _, payload in run]
+        _WRITERS[op](session, targets[kind], kind, run, user_id, result)
+    return result
+
+
+def _enumerate(operations):
+    if not isinstance(operations, list) or not operations:
+        raise BatchError('operations must be a non-empty list')
+    if len(operations) > MAX_OPERATIONS:
+        raise BatchError(f'At most {MAX_OPERATIONS} operations per batch')
+    return enumerate(operations, 1)
+
+
+def _validate(targets, number, operation):
+    """``(op, type, payload)`` for one operation, or BatchError naming it"""
+    if not isinstance(operation, dict):
+        raise BatchError(f'operation {number}: expected an object')
+    operation = dict(operation)
+    op = operation.pop('op', None)
+    kind = operation.pop('type', 'link')
+    if op not in OPS:
+        raise BatchError(f"operation {number}: op must be one of {', '.join(OPS)}")
+    if kind not in targets:
+        raise BatchError(f"operation {number}: type must be one of {', '.join(targets)}")
+    target = targets[kind]
+
+    if op == 'reorder':
+        ids = operation.pop('ids', None)
+        if not target.ordered:
+            raise BatchError(f'operation {number}: {kind} items cannot be reordered')
+        if not isinstance(ids, list) or not ids or not all(_is_id(id) for id in ids) or len(set(ids)) != len(ids):
+            raise BatchError(f'operation {number}: ids must be a list of distinct integer ids')
+        payload = {'ids': ids}
+    elif op == 'delete':
+        payload = {'id': _pop_id(operation, number)}
+    else:
+        payload = {'id': _pop_id(operation, number)} if op == 'update' else {}
+        for name, value in operation.items():
+            if name not in target.fields:
+                raise BatchError(f"operation {number}: unknown field {name!r} for {kind}")
+            if value is not None and not isinstance(value, str):
+                raise BatchError(f'operation {number}: {name} must be a string')
+            if name in target.required and not value:
+                raise BatchError(f'operation {number}: {name} is required')
+            payload[name] = value
+        if op == 'create':
+            missing = [name for name in target.required if name not in payload]
+            if missing:
+                raise BatchError(f"operation {number}: {', '.join(missing)} required")
+        elif len(payload) == 1:
+            raise BatchError(f'operation {number}: nothing to update')
+    if operation and op in ('delete', 'reorder'):
+        raise BatchError(f"operation {number}: unexpected field(s) {', '.join(operation)}")
+    return op, kind, payload
+
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _pop_id(operation, number):
+    id = operation.pop('id', None)
+    if not _is_id(id):
+        raise BatchError(f'operation {number}: id must be an integer')
+    return id
+
+
+def _check_ids(session, targets, operations, user_id):
+    """One SELECT per type: every referenced id must exist, belong to the user and not be deleted earlier"""
+    referenced = {}
+    deleted = set()
+    for op, kind, payload in operations:
+        ids = payload['ids'] if op == 'reorder' else [payload['id']] if 'id' in payload else []
+        for id in ids:
+            if (kind, id) in deleted:
+                raise BatchError(f'{kind} {id} is deleted earlier in the batch')
+            referenced.setdefault(kind, set()).add(id)
+        if op == 'delete':
+            deleted.add((kind, payload['id']))
+    for kind, ids in referenced.items():
+        table = targets[kind].model.__table__
+        statement = select(table.c.id).where(table.c.id.in_(ids))
+        if targets[kind].owned:
+            statement = statement.where(table.c.user_id == user_id)
+        missing = ids - set(session.execute(statement).scalars())
+        if missing:
+            raise BatchError(f"{kind} {', '.join(str(id) for id in sorted(missing))} not found")
+
+
+def _create(session, target, kind, run, user_id, result):
+    table = target.model.__table__
+    rows = [{name: payload.get(name) for name in target.fields} for payload in run]
+    if target.owned:
+        for row in rows:
+            row['user_id'] = user_id
+    if target.ordered:
+        # New rows go on top, the newest first, as before positions existed
+        statement = select(func.min(table.c.position))
+        if target.owned:
+            statement = statement.where(table.c.user_id == user_id)
+        top = session.execute(statement).scalar() or 0
+        for offset, row in enumerate(rows, 1):
+            row['position'] = top - offset
+    # RETURNING the fields too identifies each new row; asking for rows in
+    # parameter order would make SQLite fall back to one INSERT per row
+    returning = insert(table).returning(table.c.id, *(table.c[name] for name in target.fields))
+    created = sorted(session.execute(returning, rows).all(), key=lambda row: row.id)
+    result.created.extend(dict(row._mapping, type=kind) for row in created)
+    result.touch(kind, [row.id for row in created])
+    result.images.extend(row['image'] for row in rows if row.get('image'))
+
+
+def _update(session, target, kind, run, user_id, result):
+    table = target.model.__table__
+    # executemany needs the same columns in every row of a statement
+    groups = {}
+    for payload in run:
+        groups.setdefault(tuple(sorted(name for name in payload if name != 'id')), []).append(payload)
+    for names, group in groups.items():
+        statement = (update(table).where(table.c.id == bindparam('_id'))
+                     .values({name: bindparam(name) for name in names}))
+        session.execute(statement, [dict({name: payload[name] for name in names}, _id=payload['id'])
+                                    for payload in group])
+    result.touch(kind, [payload['id'] for payload in run])
+    result.images.extend(payload['image'] for payload in run if payload.get('image'))
+
+
+def _delete(session, target, kind, run, user_id, result):
+    table = target.model.__table__
+    ids = [payload['id'] for payload in run]
+    session.execute(delete(table).where(table.c.id.in_(ids)))
+    result.touch(kind, ids)
+
+
+def _reorder(session, target, kind, run, user_id, result):
+    """Listed ids get positions 0..n-1 in list order and the unlisted rows follow in their current order;
+    URLs are unchanged, so no ids are touched"""
+    table = target.model.__table__
+    statement = update(table).where(table.c.id == bindparam('_id')).values(position=bindparam('_position'))
+    for payload in run:
+        # Renumbering the rest too keeps a partial list from sharing positions with them
+        rest = select(table.c.id).where(table.c.id.not_in(payload['ids'])).order_by(table.c.position, table.c.id)
+        if target.owned:
+            rest = rest.where(table.c.user_id == user_id)
+        ids = payload['ids'] + list(session.execute(rest).scalars())
+        session.execute(statement, [{'_id': id, '_position': position} for position, id in enumerate(ids)])
+
+
+_WRITERS = {'create': _create, 'update': _update, 'delete': _delete, 'reorder': _reorder}
@@ -1,261 +1,695 @@
-from flask import Flask, render_template, jsonify, request, redirect, url_for, flash, send_from_directory
-from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
+from flask import Flask, Blueprint, Response, current_app, render_template, jsonify, request, redirect, url_for, flash, abort, stream_with_context
+from flask_login import LoginManager, login_user, login_required, logout_user, current_user
+import atexit
+import hmac
+import io
+import logging
 import os
-from datetime import datetime
+import time
+import functools
+from datetime import datetime, timedelta
+import click
+from models import db, User, Link, Gear, ClickEvent, ClickRollup, LinkHealth, Preferences
+import db_profiles
+from click_buffer import ClickBuffer, register_shutdown
+from click_filter import ClickFilter, KEPT, prefetch_purpose
+from click_feed import ClickFeed, FeedFull
+from redirect_cache import RedirectCache
+from tenants import RESERVED, TenantDirectory, validate_username
+from page_cache import PageCache
+import public_api
+import bulk_io
+import migrations
+import admin_batch
+from sqlalchemy.exc import IntegrityError
+from werkzeug.local import LocalProxy
+from werkzeug.middleware.proxy_fix import ProxyFix
+import click_events
+from image_pipeline import ImagePipeline
+from image_proxy import RemoteImageCache
+import asset_pipeline
+import http_caching
+from snapshot_cache import SnapshotCache, UserSnapshot, PreferencesSnapshot, render_theme_css
+import instrumentation
+import login_guard
+import link_health
+import offline
 
-# Initialize Flask app
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-here')
+log = logging.getLogger(__name__)
 
-# Handle Vercel's PostgreSQL URL
-database_url = os.environ.get('DATABASE_URL')
-if database_url and database_url.startswith('postgres://'):
-    database_url = database_url.replace('postgres://', 'postgresql://', 1)
-app.config['SQLALCHEMY_DATABASE_URI'] = database_url or 'sqlite:///linktree.db'
+def load_config():
+    """Read settings from the environment"""
+    # Handle Vercel's PostgreSQL URL
+    database_url = os.environ.get('DATABASE_URL')
+    if database_url and database_url.startswith('postgres://'):
+        database_url = database_url.replace('postgres://', 'postgresql://', 1)
 
-# Add logging for database URL (without sensitive info)
-print(f"Database URL: {database_url[:20]}..." if database_url else "No database URL found")
+    return {
+        'SECRET_KEY': os.environ.get('SECRET_KEY', 'your-secret-key-here'),
+        'SQLALCHEMY_DATABASE_URI': database_url or 'sqlite:///linktree.db',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'MAX_CONTENT_LENGTH': 16 * 1024 * 1024,  # 16MB max file size
+        # Connection pool preset: serverless, single-node or multi-worker (see db_profiles.py)
+        'DB_PROFILE': os.environ.get('DB_PROFILE', 'serverless' if os.environ.get('VERCEL') else 'single-node'),
+        # Reverse proxies in front of the app whose X-Forwarded-For/-Proto to trust (Vercel adds one)
+        'TRUSTED_PROXY_HOPS': int(os.environ.get('TRUSTED_PROXY_HOPS', '1' if os.environ.get('VERCEL') else '0')),
+        'DB_POOL_OVERRIDES': {
+            key: int(os.environ[env])
+            for key, env in (('pool_size', 'DB_POOL_SIZE'), ('max_overflow', 'DB_MAX_OVERFLOW'),
+                             ('pool_recycle', 'DB_POOL_RECYCLE'), ('pool_timeout', 'DB_POOL_TIMEOUT'))
+            if os.environ.get(env)
+        },
+        # Run init_db() on the first request instead of via 'flask init-db'
+        'AUTO_INIT_DB': os.environ.get('AUTO_INIT_DB') == '1',
 
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+        # Click tracking is buffered in memory and flushed in batches
+        'CLICK_FLUSH_INTERVAL': float(os.environ.get('CLICK_FLUSH_INTERVAL', '2.0')),  # seconds
+        'CLICK_FLUSH_SIZE': int(os.environ.get('CLICK_FLUSH_SIZE', '500')),  # distinct targets
+        # How long another worker's link/gear edits can go unnoticed by the redirect cache
+        'REDIRECT_CACHE_TTL': float(os.environ.get('REDIRECT_CACHE_TTL', '60')),  # seconds
+        # Rendered public pages, invalidated per creator by their admin edits
+        'PAGE_CACHE_TTL': float(os.environ.get('PAGE_CACHE_TTL', '60')),  # seconds
+        'PAGE_CACHE_MAX_ENTRIES': int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', '4096')),
+        'PAGE_CACHE_MAX_BYTES': int(os.environ.get('PAGE_CACHE_MAX_BYTES', str(32 * 1024 * 1024))),
+        # Creator whose pages are served at / and /gear (default: the first user)
+        'DEFAULT_TENANT': os.environ.get('DEFAULT_TENANT'),
+        # How long another worker's new users can go unnoticed at /<username>
+        'TENANT_CACHE_TTL': float(os.environ.get('TENANT_CACHE_TTL', '60')),  # seconds
+        # Serialized /api pages; also invalidated whenever buffered clicks are flushed
+        'API_CACHE_TTL': float(os.environ.get('API_CACHE_TTL', '5')),  # seconds
+        # How long another worker's preference edits can go unnoticed
+        'SNAPSHOT_CACHE_TTL': float(os.environ.get('SNAPSHOT_CACHE_TTL', '60')),  # seconds
+        # Responsive gear image variants, sized for the 150px gear thumbnails at 1x-3x
+        'IMAGE_VARIANT_WIDTHS': tuple(int(w) for w in os.environ.get('IMAGE_VARIANT_WIDTHS', '160,320,480').split(',')),
+        # Remote gear images are downloaded once and served from the static cache
+        'REMOTE_IMAGE_MAX_BYTES': int(os.environ.get('REMOTE_IMAGE_MAX_BYTES', str(5 * 1024 * 1024))),
+        'REMOTE_IMAGE_CACHE_BYTES': int(os.environ.get('REMOTE_IMAGE_CACHE_BYTES', str(200 * 1024 * 1024))),
+        'REMOTE_IMAGE_ALLOW_PRIVATE': os.environ.get('REMOTE_IMAGE_ALLOW_PRIVATE') == '1',  # local/dev hosts only
+        # Click analytics: how often raw events are rolled up, and how long each level is kept
+        'CLICK_ROLLUP_INTERVAL': float(os.environ.get('CLICK_ROLLUP_INTERVAL', '60')),  # seconds, 0 disables
+        # Logging and instrumentation
+        'LOG_LEVEL': os.environ.get('LOG_LEVEL', 'INFO').upper(),
+        'SLOW_REQUEST_SECONDS': float(os.environ.get('SLOW_REQUEST_SECONDS', '1.0')),
+        # Adds app and database time to every response; it shows visitors how long queries take
+        'SERVER_TIMING': os.environ.get('SERVER_TIMING') == '1',
+        'METRICS_TOKEN': os.environ.get('METRICS_TOKEN'),  # "Authorization: Bearer <token>" opens /metrics to scrapers
+        'PROFILER_ENABLED': os.environ.get('PROFILER_ENABLED') == '1',  # or toggle at /admin/profiler
+        'PROFILER_INTERVAL': float(os.environ.get('PROFILER_INTERVAL', '0.01')),  # seconds between samples
+        # Password checks run in a small pool so a login storm cannot take every core
+        'LOGIN_HASH_WORKERS': int(os.environ.get('LOGIN_HASH_WORKERS', '2')),
+        'LOGIN_HASH_QUEUE': int(os.environ.get('LOGIN_HASH_QUEUE', '16')),  # waiting checks before 503
+        'LOGIN_HASH_METHOD': os.environ.get('LOGIN_HASH_METHOD', login_guard.DEFAULT_HASH_METHOD),
+        # Token bucket per client IP (every attempt) and per username (failed attempts)
+        'LOGIN_RATE_PER_MINUTE': float(os.environ.get('LOGIN_RATE_PER_MINUTE', '5')),  # 0 disables
+        'LOGIN_RATE_BURST': int(os.environ.get('LOGIN_RATE_BURST', '10')),
+        'RATE_LIMIT_REDIS_URL': os.environ.get('RATE_LIMIT_REDIS_URL'),  # share buckets between workers
+        # Cache-Control per endpoint; unlisted endpoints without their own get CACHE_CONTROL_DEFAULT
+        'CACHE_POLICIES': {
+            'main.index': os.environ.get('CACHE_CONTROL_PAGES', 'public, max-age=60'),
+            'main.gear': os.environ.get('CACHE_CONTROL_PAGES', 'public, max-age=60'),
+            'main.get_links': os.environ.get('CACHE_CONTROL_API', 'public, no-cache'),
+            'main.get_gear_items': os.environ.get('CACHE_CONTROL_API', 'public, no-cache'),
+            'static': os.environ.get('CACHE_CONTROL_STATIC', 'public, max-age=86400'),
+            # Every click must reach us, so the tracking redirects are never cached
+            'main.track_click': 'no-store',
+            'main.track_gear_click': 'no-store',
+            'main.click_beacon': 'no-store',
+            # Offline support: the service worker revalidates these itself
+            'main.targets_manifest': os.environ.get('CACHE_CONTROL_API', 'public, no-cache'),
+            'main.tenant_targets_manifest': os.environ.get('CACHE_CONTROL_API', 'public, no-cache'),
+            'main.service_worker': 'no-cache',
+        },
+        'CACHE_CONTROL_DEFAULT': os.environ.get('CACHE_CONTROL_DEFAULT', 'private, no-store'),
+        # Brotli (if installed) or gzip for text responses of at least this size
+        'COMPRESSION_ENABLED': os.environ.get('COMPRESSION_ENABLED', '1') != '0',
+        'COMPRESSION_MIN_BYTES': int(os.environ.get('COMPRESSION_MIN_BYTES', '1024')),
+        # Bot, prefetch and repeat clicks are counted as filtered_clicks instead of clicks
+        'CLICK_FILTER_BOTS': os.environ.get('CLICK_FILTER_BOTS', '1') != '0',
+        'CLICK_DEDUP_WINDOW': float(os.environ.get('CLICK_DEDUP_WINDOW', '1800')),  # seconds, 0 disables
+        'CLICK_DEDUP_CAPACITY': int(os.environ.get('CLICK_DEDUP_CAPACITY', '100000')),  # distinct clicks per window
+        'CLICK_DEDUP_ERROR_RATE': float(os.environ.get('CLICK_DEDUP_ERROR_RATE', '0.001')),
+        # Live click counts on open admin dashboards
+        'CLICK_FEED_INTERVAL': float(os.environ.get('CLICK_FEED_INTERVAL', '0.25')),  # seconds between pushes
+        'CLICK_FEED_MAX_SUBSCRIBERS': int(os.environ.get('CLICK_FEED_MAX_SUBSCRIBERS', '100')),  # per worker
+        # Of those, streams served by Flask, each holding a worker thread; 0 leaves them to asgi.py
+        'CLICK_FEED_MAX_THREADED': int(os.environ.get('CLICK_FEED_MAX_THREADED', '4')),
+        # Link health checks ('flask check-links' or the dashboard's Check Links button)
+        'LINK_HEALTH_WORKERS': int(os.environ.get('LINK_HEALTH_WORKERS', '16')),
+        'LINK_HEALTH_PER_HOST': int(os.environ.get('LINK_HEALTH_PER_HOST', '2')),  # concurrent requests per host
+        'LINK_HEALTH_TIMEOUT': float(os.environ.get('LINK_HEALTH_TIMEOUT', '5')),  # seconds per request
+        'LINK_HEALTH_ALLOW_PRIVATE': os.environ.get('LINK_HEALTH_ALLOW_PRIVATE') == '1',  # local/dev hosts only
+        # Send tracked clicks straight to the final URL of a link last seen redirecting there
+        'LINK_HEALTH_REWRITE': os.environ.get('LINK_HEALTH_REWRITE') == '1',
+        'CLICK_RETENTION': click_events.retention_from_days(
+            events=int(os.environ.get('CLICK_EVENT_RETENTION_DAYS', '7')),
+            minute=int(os.environ.get('CLICK_MINUTE_RETENTION_DAYS', '2')),
+            hour=int(os.environ.get('CLICK_HOUR_RETENTION_DAYS', '90')),
+        ),
+    }
 
-# Initialize extensions
-db = SQLAlchemy(app)
+# Extensions are created unbound here; each app's caches and workers are its AppState (see create_app())
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'admin_login'
-
-# Database Models
-class User(UserMixin, db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    password_hash = db.Column(db.String(255), nullable=False)
-    links = db.relationship('Link', backref='user', lazy=True)
-
-    def __repr__(self):
-        return f'<User {self.username}>'
-
-class Link(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(100), nullable=False)
-    url = db.Column(db.String(500), nullable=False)
-    icon = db.Column(db.String(1000))
-    clicks = db.Column(db.Integer, default=0)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-
-class Gear(db.Model):
-    """Model for gear items."""
-    id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(100), nullable=False)
-    description = db.Column(db.Text, nullable=False)
-    price = db.Column(db.String(20), nullable=False)
-    url = db.Column(db.String(500), nullable=False)
-    image = db.Column(db.String(500), nullable=False)
-    clicks = db.Column(db.Integer, default=0)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-    def to_dict(self):
-        """Convert gear item to dictionary."""
-        return {
-            'id': self.id,
-            'title': self.title,
-            'description': self.description,
-            'price': self.price,
-            'url': self.url,
-            'image': self.image,
-            'clicks': self.clicks,
-            'created_at': self.created_at.isoformat() if self.created_at else None
-        }
-
-class Preferences(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    site_title = db.Column(db.String(100), default='DC Gaming')
-    site_description = db.Column(db.String(200), default='Your gaming destination')
-    profile_image = db.Column(db.String(500))
-    background_color = db.Column(db.String(7), default='#000000')
-    accent_color = db.Column(db.String(7), default='#E50914')
-    text_color = db.Column(db.String(7), default='#ffffff')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'site_title': self.site_title,
-            'site_description': self.site_description,
-            'profile_image': self.profile_image,
-            'background_color': self.background_color,
-            'accent_color': self.accent_color,
-            'text_color': self.text_color
-        }
+login_manager.login_view = 'main.admin_login'
+
+main = Blueprint('main', __name__, cli_group=None)
+
+def flush_clicks(app, counts, events, filtered=None):
+    """Apply buffered click increments as atomic UPDATEs and insert queued events"""
+    tables = {'link': Link.__table__, 'gear': Gear.__table__}
+    with app.app_context():
+        with db.engine.begin() as conn:
+            if events:
+                conn.execute(ClickEvent.__table__.insert(), events)
+            for kind, table in tables.items():
+                for column, increments in (('clicks', counts), ('filtered_clicks', filtered or {})):
+                    params = [{'target_id': id, 'n': n} for (k, id), n in increments.items() if k == kind]
+                    if not params:
+                        continue
+                    stmt = (
+                        table.update()
+                        .where(table.c.id == db.bindparam('target_id'))
+                        .values({column: db.func.coalesce(table.c[column], 0) + db.bindparam('n')})
+                    )
+                    conn.execute(stmt, params)
+        # Click counts are part of the clicked creators' /api responses
+        targets = [(link_targets if kind == 'link' else gear_targets).peek(id) for kind, id in counts]
+        if any(target is None or target.owner is None for target in targets):
+            api_cache.bump()
+        else:
+            for owner in {target.owner for target in targets}:
+                api_cache.bump(owner)
+        _maybe_rollup_clicks(app)
+
+def _maybe_rollup_clicks(app):
+    """Roll up raw click events from the flusher thread every CLICK_ROLLUP_INTERVAL"""
+    interval = app.config['CLICK_ROLLUP_INTERVAL']
+    state = app_state(app)
+    if not interval or time.monotonic() - state.last_rollup < interval:
+        return
+    state.last_rollup = time.monotonic()
+    try:
+        click_events.rollup(db, ClickEvent, ClickRollup)
+        click_events.prune(db, ClickEvent, ClickRollup, app.config['CLICK_RETENTION'])
+    except Exception:
+        log.exception("Error rolling up click events")
+        db.session.rollback()
+
+metrics = instrumentation.Instrumentation()
+
+def redirect_targets_select(model, kind):
+    """(id, url, owner) for the redirect caches, with checked redirects skipped if LINK_HEALTH_REWRITE is on"""
+    return link_health.redirect_select(model, LinkHealth, kind, current_app.config['LINK_HEALTH_REWRITE'])
+
+def _redirect_cache_for(model, kind):
+    """Build a RedirectCache backed by column-only queries on model"""
+    def load_one(id):
+        row = db.session.execute(redirect_targets_select(model, kind).where(model.id == id)).first()
+        return row[1:] if row is not None else None
+    return RedirectCache(
+        load_all=lambda: db.session.execute(redirect_targets_select(model, kind)).all(),
+        load_one=load_one,
+    )
+
+LINKS_API = public_api.Resource('links', Link, ('id', 'title', 'url', 'icon', 'clicks', 'created_at'),
+                                default_fields=('id', 'title', 'url', 'icon', 'clicks'),
+                                sort_key='position', descending=False)
+GEAR_API = public_api.Resource('gear', Gear, ('id', 'title', 'description', 'price', 'url', 'image',
+                                              'clicks', 'created_at'))
+
+main.add_app_template_global(offline.MAX_BEACON_CLICKS, 'max_beacon_clicks')
+
+@main.app_template_global()
+def localized_image(url):
+    """Our cached copy of a remote image URL, or the URL itself until it is fetched"""
+    return remote_images.local_url(url) or url
+
+@main.after_app_request
+def apply_http_caching(response):
+    """Precompressed static files or on-the-fly compression, then the endpoint's Cache-Control"""
+    if request.endpoint == 'static':
+        response = http_caching.serve_precompressed(response, request, current_app.static_folder)
+    else:
+        response = compressor.compress(response, request)
+    return cache_policies.apply(response, request.endpoint, request.view_args)
+
+def _load_user_snapshot(user_id):
+    row = db.session.execute(db.select(User.id, User.username).where(User.id == user_id)).first()
+    return UserSnapshot(row.id, row.username) if row else None
+
+def _load_preferences_snapshot(user_id):
+    preferences = Preferences.query.filter_by(user_id=user_id).first()
+    return PreferencesSnapshot(preferences.to_dict()) if preferences else None
+
+HEALTH_TARGETS = {'link': Link, 'gear': Gear}
+DEFAULT_THEME_CSS = render_theme_css(None)
+
+class AppState:
+    """One app's caches, buffers and background workers, kept in app.extensions['linktree'].
+
+    Views use them through the module-level proxies below. The ASGI fast paths
+    and background threads run outside an app context, so they hold the state
+    itself (see app_state()).
+    """
+
+    def __init__(self, app):
+        config = app.config
+        self.last_rollup = 0.0
+        self.db_initialized = False
+        self.pool_metrics = db_profiles.PoolMetrics()
+        # The ASGI fast paths' async engine (asgi.py)
+        self.async_pool_metrics = db_profiles.PoolMetrics()
+
+        self.click_buffer = register_shutdown(ClickBuffer(flush_fn=functools.partial(flush_clicks, app)))
+        self.click_buffer.interval = config['CLICK_FLUSH_INTERVAL']
+        self.click_buffer.max_pending = config['CLICK_FLUSH_SIZE']
+        self.click_filter = ClickFilter()
+        self.click_filter.configure(config['CLICK_DEDUP_WINDOW'], config['CLICK_DEDUP_CAPACITY'],
+                                    config['CLICK_DEDUP_ERROR_RATE'], config['CLICK_FILTER_BOTS'],
+                                    config['SECRET_KEY'])
+        self.click_feed = ClickFeed()
+        atexit.register(self.click_feed.stop)
+        self.click_feed.interval = config['CLICK_FEED_INTERVAL']
+        self.click_feed.max_subscribers = config['CLICK_FEED_MAX_SUBSCRIBERS']
+        self.click_feed.max_threaded = config['CLICK_FEED_MAX_THREADED']
+
+        self.link_targets = _redirect_cache_for(Link, 'link')
+        self.gear_targets = _redirect_cache_for(Gear, 'gear')
+        self.link_targets.ttl = self.gear_targets.ttl = config['REDIRECT_CACHE_TTL']
+        # Every /<username> request starts with this lookup
+        self.tenants = TenantDirectory(
+            load_all=lambda: db.session.execute(db.select(User.id, User.username)).all(),
+            load_one=lambda username: db.session.execute(db.select(User.id).where(User.username == username)).scalar(),
+        )
+        self.tenants.ttl = config['TENANT_CACHE_TTL']
+        self.tenants.default = config['DEFAULT_TENANT']
+
+        self.page_cache = PageCache()
+        self.page_cache.ttl = config['PAGE_CACHE_TTL']
+        self.page_cache.max_entries = config['PAGE_CACHE_MAX_ENTRIES']
+        self.page_cache.max_bytes = config['PAGE_CACHE_MAX_BYTES']
+        self.api_cache = PageCache(max_entries=256, max_bytes=8 * 1024 * 1024, ttl=config['API_CACHE_TTL'])
+        self.user_snapshots = SnapshotCache(_load_user_snapshot)
+        self.preference_snapshots = SnapshotCache(_load_preferences_snapshot)
+        self.user_snapshots.ttl = self.preference_snapshots.ttl = config['SNAPSHOT_CACHE_TTL']
+
+        self.password_verifier = login_guard.PasswordVerifier()
+        atexit.register(self.password_verifier.stop)
+        self.password_verifier.configure(config['LOGIN_HASH_WORKERS'], config['LOGIN_HASH_QUEUE'],
+                                         10.0, config['LOGIN_HASH_METHOD'])
+        self.login_limiter = login_guard.RateLimiter()
+        self.login_limiter.per_minute = config['LOGIN_RATE_PER_MINUTE']
+        self.login_limiter.burst = config['LOGIN_RATE_BURST']
+        if config['RATE_LIMIT_REDIS_URL']:
+            self.login_limiter.backend = login_guard.RedisBackend(config['RATE_LIMIT_REDIS_URL'])
+
+        self.cache_policies = http_caching.CachePolicies()
+        self.cache_policies.policies = dict(config['CACHE_POLICIES'])
+        self.cache_policies.default = config['CACHE_CONTROL_DEFAULT']
+        self.compressor = http_caching.Compressor()
+        self.compressor.enabled = config['COMPRESSION_ENABLED']
+        self.compressor.min_size = config['COMPRESSION_MIN_BYTES']
+
+        # Pages rendered before an image's variants existed are re-rendered once they do
+        self.image_pipeline = ImagePipeline(app.static_folder, on_built=lambda path: self.page_cache.bump())
+        self.remote_images = RemoteImageCache(app.static_folder, on_fetched=lambda url: self.page_cache.bump())
+        self.image_pipeline.static_url_path = self.remote_images.static_url_path = app.static_url_path
+        self.image_pipeline.widths = tuple(sorted(config['IMAGE_VARIANT_WIDTHS']))
+        self.remote_images.max_image_bytes = config['REMOTE_IMAGE_MAX_BYTES']
+        self.remote_images.max_total_bytes = config['REMOTE_IMAGE_CACHE_BYTES']
+        self.remote_images.allow_private = config['REMOTE_IMAGE_ALLOW_PRIVATE']
+        # Bundles written by 'flask build-assets'; templates fall back to the CDNs until then
+        self.assets = asset_pipeline.Assets(app.static_folder)
+        self.assets.reload()
+
+        self.link_checker = link_health.LinkChecker()
+        self.link_checker.workers = config['LINK_HEALTH_WORKERS']
+        self.link_checker.per_host = config['LINK_HEALTH_PER_HOST']
+        self.link_checker.timeout = config['LINK_HEALTH_TIMEOUT']
+        self.link_checker.allow_private = config['LINK_HEALTH_ALLOW_PRIVATE']
+        self.health_runs = link_health.BackgroundRuns()
+        atexit.register(self.health_runs.stop)
+
+    def record_click(self, kind, id, owner, client, user_agent, referrer, purpose=None):
+        """Buffer one tracked click, or count it as filtered, and tell owner's open dashboards; returns the verdict"""
+        verdict = self.click_filter.classify(kind, id, client, user_agent, purpose)
+        if verdict == KEPT:
+            self.click_buffer.add(kind, id, event=click_events.make_event(kind, id, referrer, user_agent))
+            self.click_feed.publish(kind, id, owner)
+        else:
+            self.click_buffer.add(kind, id, filtered=True)
+            self.click_feed.publish(kind, id, owner, 'filtered_clicks')
+        return verdict
+
+def app_state(app=None):
+    """The AppState of app, or of the current app"""
+    return (app or current_app).extensions['linktree']
+
+def _state_proxy(name):
+    return LocalProxy(lambda: getattr(current_app.extensions['linktree'], name))
+
+click_buffer = _state_proxy('click_buffer')
+click_filter = _state_proxy('click_filter')
+click_feed = _state_proxy('click_feed')
+link_targets = _state_proxy('link_targets')
+gear_targets = _state_proxy('gear_targets')
+tenants = _state_proxy('tenants')
+page_cache = _state_proxy('page_cache')
+api_cache = _state_proxy('api_cache')
+user_snapshots = _state_proxy('user_snapshots')
+preference_snapshots = _state_proxy('preference_snapshots')
+password_verifier = _state_proxy('password_verifier')
+login_limiter = _state_proxy('login_limiter')
+cache_policies = _state_proxy('cache_policies')
+compressor = _state_proxy('compressor')
+image_pipeline = _state_proxy('image_pipeline')
+remote_images = _state_proxy('remote_images')
+assets = _state_proxy('assets')
+link_checker = _state_proxy('link_checker')
+health_runs = _state_proxy('health_runs')
+pool_metrics = _state_proxy('pool_metrics')
+
+def create_app(config=None):
+    """Application factory. Does no database work; run 'flask init-db' once to set up tables."""
+    app = Flask(__name__)
+    app.config.from_mapping(load_config())
+    if config:
+        app.config.update(config)
+    state = app.extensions['linktree'] = AppState(app)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', db_profiles.engine_options(
+        app.config['SQLALCHEMY_DATABASE_URI'], state.pool_metrics, app.config['DB_PROFILE'],
+        app.config['DB_POOL_OVERRIDES']))
+
+    db.init_app(app)
+    with app.app_context():
+        # Engines are created lazily by SQLAlchemy; this does not connect
+        db_profiles.instrument_engine(db.engine, state.pool_metrics)
+        metrics.init_app(app, db.engine)
+    login_manager.init_app(app)
+    app.add_template_global(state.image_pipeline.lookup, 'responsive_image')
+    app.add_template_global(state.assets.path, 'asset')
+    app.add_template_global(state.assets.preloads, 'asset_preloads')
+    app.add_template_global(state.assets.needs_icon_font, 'needs_icon_font')
+    app.register_blueprint(main)
+    hops = app.config['TRUSTED_PROXY_HOPS']
+    if hops:
+        # request.remote_addr is then the visitor, not the proxy: click dedup and login limits key on it
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
+    return app
 
 # User loader for Flask-Login
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_snapshots.get(int(user_id))
+
+@main.before_app_request
+def auto_init_db():
+    """With AUTO_INIT_DB=1 (e.g. on Vercel), initialize the database on the first request"""
+    state = app_state()
+    if state.db_initialized or not current_app.config['AUTO_INIT_DB']:
+        return
+    state.db_initialized = True
+    init_db()
 
 # Routes
-@app.route('/')
+def owner_required(view):
+    """login_required for the process-wide admin endpoints: only the site owner (the default creator) gets in"""
+    @functools.wraps(view)
+    @login_required
+    def wrapper(*args, **kwargs):
+        if not tenants.is_default(current_user.id):
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapper
+
+def _tenant_or_404(username):
+    """The user id behind a /<username> URL"""
+    user_id = None if username.lower() in RESERVED else tenants.get(username)
+    if user_id is None:
+        abort(404)
+    return user_id
+
+def _targets_url(username=None):
+    if username:
+        return url_for('main.tenant_targets_manifest', username=username)
+    return url_for('main.targets_manifest')
+
+def _links_page(user_id, username=None):
+    links = Link.query.filter_by(user_id=user_id).order_by(Link.position, Link.id).all()
+    return render_template('index.html', links=links, profile=preference_snapshots.get(user_id), tenant=username,
+                           targets_url=_targets_url(username))
+
+def _gear_page(user_id, username=None):
+    gear_items = Gear.query.filter_by(user_id=user_id).order_by(Gear.created_at.desc()).all()
+    return render_template('gear.html', gear_items=gear_items, profile=preference_snapshots.get(user_id),
+                           tenant=username, targets_url=_targets_url(username))
+
+def _render_targets_manifest(user_id):
+    """The targets manifest of one creator; links to the gear page and non-HTTP URLs keep the tracking route"""
+    targets = {}
+    for kind, model in (('link', Link), ('gear', Gear)):
+        rows = db.session.execute(redirect_targets_select(model, kind).where(model.user_id == user_id))
+        targets[kind] = {id: url for id, url, _ in rows if link_health.is_checkable(url)}
+    # What _links_page and _gear_page render, in their order, for the manifest version
+    links = db.session.execute(db.select(Link.id, Link.title, Link.url, Link.icon)
+                               .where(Link.user_id == user_id).order_by(Link.position, Link.id))
+    gear_items = db.session.execute(db.select(Gear.id, Gear.title, Gear.description, Gear.price, Gear.url, Gear.image)
+                                    .where(Gear.user_id == user_id).order_by(Gear.created_at.desc()))
+    profile = preference_snapshots.get(user_id)
+    pages = {'links': [list(row) for row in links], 'gear': [list(row) for row in gear_items],
+             'profile': profile.to_dict() if profile else None}
+    return jsonify(offline.manifest(targets, pages))
+
+def _gear_page_url(user_id):
+    """Where a creator's '/gear' link points: /gear for the default creator, else /<username>/gear"""
+    username = tenants.username(user_id)
+    if username is None or username.lower() in RESERVED or tenants.is_default(user_id):
+        return url_for('main.gear')
+    return url_for('main.tenant_gear', username=username)
+
+@main.route('/')
 def index():
-    links = Link.query.order_by(Link.created_at.desc()).all()
-    return render_template('index.html', links=links)
+    user_id = tenants.default_id()
+    return page_cache.serve('index', lambda: _links_page(user_id), namespace=user_id)
 
-@app.route('/gear')
+@main.route('/gear')
 def gear():
     """Gear recommendations page"""
-    gear_items = Gear.query.order_by(Gear.created_at.desc()).all()
-    return render_template('gear.html', gear_items=gear_items)
+    user_id = tenants.default_id()
+    return page_cache.serve('gear', lambda: _gear_page(user_id), namespace=user_id)
+
+@main.route('/<username>')
+def tenant_index(username):
+    """A creator's links"""
+    user_id = _tenant_or_404(username)
+    return page_cache.serve('tenant_index', lambda: _links_page(user_id, username), namespace=user_id)
+
+@main.route('/<username>/gear')
+def tenant_gear(username):
+    """A creator's gear recommendations"""
+    user_id = _tenant_or_404(username)
+    return page_cache.serve('tenant_gear', lambda: _gear_page(user_id, username), namespace=user_id)
+
+@main.route('/api/targets')
+def targets_manifest():
+    """Where each of the default creator's links and gear items leads, for the public pages' click handler"""
+    user_id = tenants.default_id()
+    # Cached with the creator's pages, so the admin edits that invalidate those give it a new version
+    return page_cache.serve('targets_manifest', lambda: _render_targets_manifest(user_id), namespace=user_id)
+
+@main.route('/<username>/api/targets')
+def tenant_targets_manifest(username):
+    user_id = _tenant_or_404(username)
+    return page_cache.serve('tenant_targets_manifest', lambda: _render_targets_manifest(user_id), namespace=user_id)
+
+@main.route('/api/clicks', methods=['POST'])
+def click_beacon():
+    """Clicks the public pages followed directly, sent with navigator.sendBeacon (many per POST)"""
+    try:
+        clicks = offline.parse_beacon(request.stream.read(offline.MAX_BEACON_BYTES + 1))
+    except offline.BeaconError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    caches = {'link': link_targets, 'gear': gear_targets}
+    purpose = prefetch_purpose(request.headers.get)
+    for kind, id in clicks:
+        target = caches[kind].get(id)
+        # Deleted since the page was cached, or never followed directly
+        if target is None or target.is_gear_page:
+            continue
+        app_state().record_click(kind, id, target.owner, request.remote_addr, request.headers.get('User-Agent'),
+                                 request.referrer, purpose)
+    return '', 204
+
+@main.route('/sw.js')
+def service_worker():
+    """The public pages' service worker, regenerated when the assets are rebuilt"""
+    return page_cache.serve('service_worker', _render_service_worker)
 
-@app.route('/gear/<int:id>/click')
+def _render_service_worker():
+    source = current_app.jinja_env.loader.get_source(current_app.jinja_env, 'sw.js')[0]
+    script = render_template('sw.js', cache_version=offline.cache_version(assets.manifest.get('files', {}), source),
+                             reserved=sorted(RESERVED), static_prefix=current_app.static_url_path + '/')
+    return Response(script, mimetype='application/javascript')
+
+@main.route('/gear/<int:id>/click')
 def track_gear_click(id):
     """Track gear item clicks and redirect to purchase URL"""
-    gear = Gear.query.get_or_404(id)
-    gear.clicks += 1
-    db.session.commit()
-    return redirect(gear.url)
+    target = gear_targets.get(id)
+    if target is None:
+        abort(404)
+    app_state().record_click('gear', id, target.owner, request.remote_addr, request.headers.get('User-Agent'),
+                             request.referrer, prefetch_purpose(request.headers.get))
+    return redirect(target.url)
+
+def _api_page(resource, user_id):
+    """Serve one page of a creator's public API resource from the API cache"""
+    try:
+        fields, limit, cursor = public_api.parse_query(resource, request.args)
+    except public_api.ApiError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    key = public_api.cache_key(resource, fields, limit, cursor)
+    entry = api_cache.get(key, user_id)
+    if entry is None:
+        rows = db.session.execute(public_api.select_page(resource, fields, limit, cursor, owner=user_id)).all()
+        body, headers = public_api.render_page(resource, fields, rows, limit, request.path)
+        entry = api_cache.put(key, body, 'application/json', headers, namespace=user_id)
+    return PageCache.respond(entry)
 
-@app.route('/api/links')
+@main.route('/api/links')
 def get_links():
-    links = Link.query.order_by(Link.created_at.desc()).all()
-    return jsonify([{
-        'id': link.id,
-        'title': link.title,
-        'url': link.url,
-        'icon': link.icon,
-        'clicks': link.clicks
-    } for link in links])
-
-@app.route('/track/<int:id>')
+    """The default creator's links in page order; see public_api.py for paging and field selection"""
+    return _api_page(LINKS_API, tenants.default_id())
+
+@main.route('/api/gear')
+def get_gear_items():
+    """The default creator's gear items, newest first; see public_api.py for paging and field selection"""
+    return _api_page(GEAR_API, tenants.default_id())
+
+@main.route('/<username>/api/links')
+def get_tenant_links(username):
+    return _api_page(LINKS_API, _tenant_or_404(username))
+
+@main.route('/<username>/api/gear')
+def get_tenant_gear_items(username):
+    return _api_page(GEAR_API, _tenant_or_404(username))
+
+@main.route('/track/<int:id>')
 def track_click(id):
     """Track link clicks and redirect to the target URL"""
-    link = Link.query.get_or_404(id)
+    target = link_targets.get(id)
+    if target is None:
+        abort(404)
     
     # Special handling for gear page
-    if link.url == '/gear':
-        return redirect(url_for('gear'))
+    if target.is_gear_page:
+        return redirect(_gear_page_url(target.owner))
     
-    # Increment click counter
-    link.clicks += 1
-    db.session.commit()
+    # Queue the click; the flusher writes it in the background
+    app_state().record_click('link', id, target.owner, request.remote_addr, request.headers.get('User-Agent'),
+                             request.referrer, prefetch_purpose(request.headers.get))
     
-    return redirect(link.url)
+    return redirect(target.url)
 
 # Admin Routes
-@app.route('/admin')
+@main.route('/admin')
 @login_required
 def admin_dashboard():
     """Admin dashboard route"""
     try:
-        print(f"Loading admin dashboard for user {current_user.id}")
-        links = Link.query.filter_by(user_id=current_user.id).order_by(Link.created_at.desc()).all()
-        print(f"Found {len(links)} links")
-        return render_template('admin.html', links=links)
-    except Exception as e:
-        print(f"Error loading admin dashboard: {str(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        links = Link.query.filter_by(user_id=current_user.id).order_by(Link.position, Link.id).all()
+        log.debug("Admin dashboard for user %s: %d links", current_user.id, len(links))
+        health = link_health.health_by_target(db.session, LinkHealth, 'link', [link.id for link in links])
+        return render_template('admin.html', links=links, health=health,
+                               health_pending=health_runs.is_pending(current_user.id))
+    except Exception:
+        log.exception("Error loading admin dashboard")
         flash('Error loading admin dashboard', 'error')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
-@app.route('/admin/login', methods=['GET', 'POST'])
+@main.route('/admin/login', methods=['GET', 'POST'])
 def admin_login():
     """Admin login route"""
     if request.method == 'POST':
-        username = request.form.get('username')
+        username = request.form.get('username') or ''
         password = request.form.get('password')
-        print(f"Login attempt for username: {username}")
-        
+        # Every attempt spends a token from the client's bucket; failures also
+        # spend one from the username's, so a single account cannot be brute
+        # forced from many addresses
+        retry_after = (login_limiter.hit(f'ip:{request.remote_addr}')
+                       or login_limiter.hit(f'user:{username.lower()}', cost=0))
+        if retry_after:
+            log.warning("Rate limited admin login for username %r from %s", username, request.remote_addr)
+            return _login_refused('Too many login attempts, try again later', 429, retry_after)
+
         user = User.query.filter_by(username=username).first()
-        if user:
-            print(f"User found: {user.username}")
-            print(f"User ID: {user.id}")
-            if check_password_hash(user.password_hash, password):
-                print("Password check passed!")
-                login_user(user)
-                return redirect(url_for('admin_dashboard'))
-            else:
-                print("Password check failed!")
-                print(f"Provided password hash: {generate_password_hash(password)[:20]}...")
-                print(f"Stored password hash: {user.password_hash[:20]}...")
-        else:
-            print("User not found!")
-            
+        try:
+            ok, new_hash = password_verifier.verify(user.password_hash if user else None, password)
+        except login_guard.LoginBusy:
+            log.warning("Password check pool is full; refusing admin login for %r", username)
+            return _login_refused('The server is busy, try again in a moment', 503, 5)
+        if ok:
+            if new_hash:
+                user.password_hash = new_hash
+                db.session.commit()
+                log.info("Rehashed the password of user %s with %s", user.id, password_verifier.method)
+            log.info("Admin login for user %s", user.id)
+            login_user(user)
+            return redirect(url_for('main.admin_dashboard'))
+        login_limiter.hit(f'user:{username.lower()}')
+        log.warning("Failed admin login for username %r: %s", username, 'wrong password' if user else 'no such user')
+
         flash('Invalid username or password', 'error')
     return render_template('admin_login.html')
 
-@app.route('/admin/logout')
+def _login_refused(message, status, retry_after):
+    flash(message, 'error')
+    response = current_app.make_response((render_template('admin_login.html'), status))
+    response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+    return response
+
+@main.route('/admin/logout')
 @login_required
 def admin_logout():
     """Admin logout route"""
     logout_user()
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
 # Link Management Routes
-@app.route('/admin/links/add', methods=['POST'])
+@main.route('/admin/links/add', methods=['POST'])
 @login_required
 def add_link():
     """Add new link route"""
     try:
-        print("Attempting to add new link...")
         title = request.form.get('title')
         url = request.form.get('url')
         icon = request.form.get('icon')
-        
-        print(f"Received data - Title: {title}, URL: {url}, Icon: {icon}")
-        print(f"Current user ID: {current_user.id}")
-        
+        log.debug("Adding link %r -> %r for user %s", title, url, current_user.id)
+
         if not title or not url:
-            print("Missing required fields")
             return jsonify({'success': False, 'message': 'Title and URL are required'}), 400
-        
-        # Check if link already exists
-        existing_link = Link.query.filter_by(title=title, user_id=current_user.id).first()
-        if existing_link:
-            print(f"Link with title '{title}' already exists")
+
+        operations = [{'op': 'create', 'title': title, 'url': url, 'icon': icon}]
+        try:
+            result = admin_batch.apply(db.session, BATCH_TARGETS, operations, current_user.id)
+            db.session.commit()
+        except IntegrityError:
+            # uq_link_user_title: one title per user, enforced by the database
+            db.session.rollback()
             return jsonify({'success': False, 'message': 'A link with this title already exists'}), 400
-        
-        print(f"Creating new link for user {current_user.id}")
-        link = Link(
-            title=title,
-            url=url,
-            icon=icon,
-            user_id=current_user.id
-        )
-        db.session.add(link)
-        db.session.commit()
-        print(f"Link created successfully with ID: {link.id}")
-        
-        # Verify the link was created
-        created_link = Link.query.get(link.id)
-        if created_link:
-            print(f"Verified link exists in database with ID: {created_link.id}")
-            return jsonify({
-                'success': True, 
-                'message': 'Link added successfully',
-                'link': {
-                    'id': created_link.id,
-                    'title': created_link.title,
-                    'url': created_link.url,
-                    'icon': created_link.icon
-                }
-            })
-        else:
-            print("Link was not found after creation!")
-            return jsonify({'success': False, 'message': 'Link was not created properly'}), 500
-            
+        _after_admin_batch(result)
+        link = result.created[0]
+        log.info("Link %s created", link['id'])
+        return jsonify({
+            'success': True,
+            'message': 'Link added successfully',
+            'link': {key: link[key] for key in ('id', 'title', 'url', 'icon')}
+        })
+
     except Exception as e:
-        print(f"Error adding link: {str(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        log.exception("Error adding link")
         db.session.rollback()
         return jsonify({'success': False, 'message': f'Error adding link: {str(e)}'}), 500
 
-@app.route('/admin/links/edit/<int:id>', methods=['POST'])
+@main.route('/admin/links/edit/<int:id>', methods=['POST'])
 @login_required
 def edit_link(id):
     """Edit existing link route"""
@@ -273,10 +707,17 @@ def edit_link(id):
     link.title = title
     link.url = url
     link.icon = icon
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'A link with this title already exists'}), 400
+    link_targets.invalidate(id)
+    page_cache.bump(current_user.id)
+    api_cache.bump(current_user.id)
     return jsonify({'success': True})
 
-@app.route('/admin/links/delete/<int:id>', methods=['POST'])
+@main.route('/admin/links/delete/<int:id>', methods=['POST'])
 @login_required
 def delete_link(id):
     """Delete link route"""
@@ -286,25 +727,62 @@ def delete_link(id):
     
     db.session.delete(link)
     db.session.commit()
+    link_targets.invalidate(id)
+    page_cache.bump(current_user.id)
+    api_cache.bump(current_user.id)
     return jsonify({'success': True})
 
+# Batch edits
+BATCH_TARGETS = {
+    'link': admin_batch.Target(Link, ('title', 'url', 'icon'), required=('title', 'url'), owned=True),
+    'gear': admin_batch.Target(Gear, ('title', 'description', 'price', 'url', 'image'), owned=True),
+}
+
+def _after_admin_batch(result):
+    """Invalidate caches for a committed batch and queue images of new/changed gear"""
+    for id in result.changed.get('link', ()):
+        link_targets.invalidate(id)
+    for id in result.changed.get('gear', ()):
+        gear_targets.invalidate(id)
+    page_cache.bump(current_user.id)
+    api_cache.bump(current_user.id)
+    for image_url in result.images:
+        remote_images.submit(image_url)
+        image_pipeline.submit(image_url)
+
+@main.route('/admin/batch', methods=['POST'])
+@login_required
+def admin_batch_edit():
+    """Apply a list of create/update/delete/reorder operations in one transaction; see admin_batch.py"""
+    payload = request.get_json(silent=True)
+    operations = payload.get('operations') if isinstance(payload, dict) else None
+    try:
+        result = admin_batch.apply(db.session, BATCH_TARGETS, operations, current_user.id)
+        db.session.commit()
+    except admin_batch.BatchError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'A link with this title already exists'}), 400
+    _after_admin_batch(result)
+    log.info("Admin batch of %d operations applied for user %s", len(operations), current_user.id)
+    return jsonify({'success': True, 'applied': len(operations), 'created': result.created})
+
 # Gear Management Routes
-@app.route('/admin/gear')
+@main.route('/admin/gear')
 @login_required
 def admin_gear():
     """Admin gear management page"""
     try:
-        print("Loading gear management page...")
-        gear_items = Gear.query.all()
-        print(f"Found {len(gear_items)} gear items")
-        return render_template('admin_gear.html', gear_items=gear_items)
+        gear_items = Gear.query.filter_by(user_id=current_user.id).all()
+        health = link_health.health_by_target(db.session, LinkHealth, 'gear', [gear.id for gear in gear_items])
+        return render_template('admin_gear.html', gear_items=gear_items, health=health)
     except Exception as e:
-        print(f"Error loading gear management page: {str(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        log.exception("Error loading gear management page")
         return render_template('admin_gear.html', error=str(e))
 
-@app.route('/admin/gear/add', methods=['POST'])
+@main.route('/admin/gear/add', methods=['POST'])
 @login_required
 def add_gear():
     try:
@@ -322,22 +800,30 @@ def add_gear():
             description=description,
             price=price,
             url=url,
-            image=image_url  # Store the URL directly
+            image=image_url,  # Store the URL directly
+            user_id=current_user.id
         )
         db.session.add(new_gear)
         db.session.commit()
+        gear_targets.invalidate(new_gear.id)
+        page_cache.bump(current_user.id)
+        api_cache.bump(current_user.id)
+        remote_images.submit(image_url)
+        image_pipeline.submit(image_url)
 
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
-@app.route('/admin/gear/edit/<int:id>', methods=['POST'])
+@main.route('/admin/gear/edit/<int:id>', methods=['POST'])
 @login_required
 def edit_gear(id):
     try:
         gear = Gear.query.get_or_404(id)
-        
+        if gear.user_id != current_user.id:
+            return jsonify({'error': 'Unauthorized'}), 403
+
         gear.title = request.form.get('title', gear.title)
         gear.description = request.form.get('description', gear.description)
         gear.price = request.form.get('price', gear.price)
@@ -349,98 +835,449 @@ def edit_gear(id):
             gear.image = image_url
 
         db.session.commit()
+        gear_targets.invalidate(id)
+        page_cache.bump(current_user.id)
+        api_cache.bump(current_user.id)
+        if image_url:
+            remote_images.submit(image_url)
+            image_pipeline.submit(image_url)
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
-@app.route('/admin/gear/delete/<int:id>', methods=['POST'])
+@main.route('/admin/gear/delete/<int:id>', methods=['POST'])
 @login_required
 def delete_gear(id):
     try:
         gear = Gear.query.get_or_404(id)
+        if gear.user_id != current_user.id:
+            return jsonify({'error': 'Unauthorized'}), 403
         db.session.delete(gear)
         db.session.commit()
+        gear_targets.invalidate(id)
+        page_cache.bump(current_user.id)
+        api_cache.bump(current_user.id)
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
-@app.route('/admin/gear/<int:id>')
+@main.route('/admin/gear/<int:id>')
 @login_required
 def get_gear(id):
     """Get gear details for editing"""
     try:
-        print(f"Fetching gear details for ID: {id}")
         gear = Gear.query.get_or_404(id)
-        print(f"Found gear: {gear.title}")
+        if gear.user_id != current_user.id:
+            return jsonify({'error': 'Unauthorized'}), 403
         return jsonify(gear.to_dict())
     except Exception as e:
-        print(f"Error fetching gear details: {str(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        log.exception("Error fetching gear details for %s", id)
         return jsonify({'success': False, 'message': f'Error fetching gear details: {str(e)}'}), 500
 
+@main.route('/admin/api/clicks')
+@login_required
+def click_series():
+    """Time-series click counts of the current user's links and gear, from the rollup tables"""
+    granularity = request.args.get('granularity', 'hour')
+    if granularity not in click_events.GRANULARITIES:
+        return jsonify({'success': False, 'message': 'granularity must be minute, hour or day'}), 400
+    default_window = {'minute': timedelta(hours=1), 'hour': timedelta(days=2), 'day': timedelta(days=30)}
+    try:
+        since = request.args.get('since')
+        since = datetime.fromisoformat(since) if since else datetime.utcnow() - default_window[granularity]
+        until = request.args.get('until')
+        until = datetime.fromisoformat(until) if until else None
+    except ValueError:
+        return jsonify({'success': False, 'message': 'since/until must be ISO 8601 timestamps'}), 400
+    target_type = request.args.get('type')
+    if target_type not in (None, 'link', 'gear'):
+        return jsonify({'success': False, 'message': 'type must be link or gear'}), 400
+    return jsonify({
+        'granularity': granularity,
+        'series': click_events.series(db, ClickRollup, granularity, since, until,
+                                      target_type=target_type, target_id=request.args.get('id', type=int),
+                                      owned={kind: db.select(model.id).where(model.user_id == current_user.id)
+                                             for kind, model in FEED_TARGETS}),
+    })
+
+@main.cli.command('build-images')
+def build_images_command():
+    """Cache remote gear images and build responsive variants for all of them"""
+    for image_url, in db.session.execute(db.select(Gear.image).distinct()):
+        if remote_images.is_remote(image_url):
+            try:
+                image_url = remote_images.url_prefix + remote_images.fetch(image_url)
+            except Exception as e:
+                print(f"Error caching {image_url}: {str(e)}")
+                continue
+        path = image_pipeline.source_path(image_url)
+        if path is None:
+            print(f"Skipping {image_url} (not a local static file)")
+            continue
+        try:
+            manifest = image_pipeline.build(path)
+            print(f"Built {image_url} -> {manifest['dir']}")
+        except Exception as e:
+            print(f"Error building {image_url}: {str(e)}")
+    page_cache.bump()
+
+@main.cli.command('build-assets')
+@click.option('--offline', is_flag=True, help='Use only what is already in static/vendor/.')
+def build_assets_command(offline):
+    """Vendor, subset, minify and fingerprint the CSS/JS/font assets"""
+    icons = asset_pipeline.template_icons(os.path.join(current_app.root_path, current_app.template_folder))
+    icons.update(icon for icon in db.session.execute(db.select(Link.icon).distinct()).scalars() if icon)
+    try:
+        manifest = asset_pipeline.build(current_app.static_folder, icons, offline=offline)
+    except (asset_pipeline.AssetError, OSError) as e:
+        raise click.ClickException(str(e))
+    http_caching.precompress_tree(os.path.join(current_app.static_folder, asset_pipeline.OUTPUT_DIR))
+    assets.reload()
+    page_cache.bump()
+    print(f"Built {len(manifest['files'])} bundles with {len(manifest['icons'])} icons; "
+          "restart running workers to pick them up")
+
+@main.cli.command('compress-static')
+def compress_static_command():
+    """Write .br/.gz copies of the compressible static files, served to clients that accept them"""
+    written = http_caching.precompress_tree(current_app.static_folder, compressor.min_size, out=print)
+    encodings = ' and '.join(http_caching.available_encodings())
+    print(f"Wrote {written} precompressed files ({encodings})")
+
+@main.cli.command('rollup-clicks')
+def rollup_clicks_command():
+    """Roll up raw click events and apply the retention policy"""
+    click_buffer.flush()
+    processed = click_events.rollup(db, ClickEvent, ClickRollup)
+    deleted = click_events.prune(db, ClickEvent, ClickRollup, current_app.config['CLICK_RETENTION'])
+    print(f"Rolled up {processed} click events, pruned {deleted}")
+
+BULK_MODELS = {'links': Link, 'gear': Gear, 'preferences': Preferences}
+# Rows without an id are matched on these unique columns
+BULK_NATURAL_KEYS = {'links': ('user_id', 'title')}
+BULK_MIMETYPES = {'jsonl': 'application/x-ndjson', 'csv': 'text/csv'}
+
+def _bulk_owner_defaults(model, user_id):
+    return {'user_id': user_id} if 'user_id' in model.__table__.c else {}
+
+def _after_bulk_import(kind, owner=None):
+    """Drop this worker's caches for the imported table (only ``owner``'s pages when given)"""
+    if kind == 'links':
+        link_targets.invalidate()
+    elif kind == 'gear':
+        gear_targets.invalidate()
+    else:
+        preference_snapshots.invalidate()
+    page_cache.bump(owner)
+    api_cache.bump(owner)
+
+@main.cli.command('export-data')
+@click.argument('kind', type=click.Choice(list(BULK_MODELS)))
+@click.argument('output', type=click.File('w'), default='-')
+@click.option('--format', 'fmt', type=click.Choice(bulk_io.FORMATS), help='Defaults to the file extension, else jsonl.')
+def export_data_command(kind, output, fmt):
+    """Stream a table to OUTPUT (default stdout) as JSON Lines or CSV"""
+    model = BULK_MODELS[kind]
+    total = bulk_io.count_rows(db, model)
+    progress = lambda n: click.echo(f"Exported {n}/{total} {kind}", err=True)
+    for chunk in bulk_io.export_rows(db, model, fmt or bulk_io.guess_format(output.name), progress=progress):
+        output.write(chunk)
+
+@main.cli.command('import-data')
+@click.argument('kind', type=click.Choice(list(BULK_MODELS)))
+@click.argument('input', type=click.File('r', encoding='utf-8'), default='-')
+@click.option('--format', 'fmt', type=click.Choice(bulk_io.FORMATS), help='Defaults to the file extension, else jsonl.')
+@click.option('--chunk-size', default=bulk_io.DEFAULT_CHUNK_SIZE, show_default=True, help='Rows per INSERT batch.')
+@click.option('--owner', help='Username that owns every imported row (default: keep user_id, else admin).')
+def import_data_command(kind, input, fmt, chunk_size, owner):
+    """Upsert JSON Lines or CSV rows from INPUT (default stdin), matched on id"""
+    model = BULK_MODELS[kind]
+    admin = User.query.filter_by(username=owner or 'admin').first()
+    if owner and admin is None:
+        raise click.ClickException(f'No user named {owner}')
+    defaults = _bulk_owner_defaults(model, admin.id) if admin else {}
+    overrides = defaults if owner else {}
+    try:
+        rows = bulk_io.read_rows(input, fmt or bulk_io.guess_format(input.name))
+        total = bulk_io.import_rows(db, model, rows, defaults, overrides, chunk_size,
+                                    progress=lambda n: click.echo(f"Imported {n} {kind}", err=True),
+                                    natural_key=BULK_NATURAL_KEYS.get(kind))
+    except bulk_io.BulkError as e:
+        raise click.ClickException(str(e))
+    _after_bulk_import(kind)
+    click.echo(f"Imported {total} {kind}")
+
+@main.route('/admin/export/<kind>')
+@login_required
+def export_data(kind):
+    """Download a table as a streamed JSON Lines or CSV file"""
+    if kind not in BULK_MODELS:
+        abort(404)
+    fmt = request.args.get('format', 'jsonl')
+    if fmt not in bulk_io.FORMATS:
+        return jsonify({'success': False, 'message': f"format must be one of {', '.join(bulk_io.FORMATS)}"}), 400
+    model = BULK_MODELS[kind]
+    owner = current_user.id if 'user_id' in model.__table__.c else None
+    return Response(
+        stream_with_context(bulk_io.export_rows(db, model, fmt, owner=owner)),
+        mimetype=BULK_MIMETYPES[fmt],
+        headers={
+            'Content-Disposition': f'attachment; filename={kind}.{fmt}',
+            # Lets clients show download progress in rows
+            'X-Total-Count': str(bulk_io.count_rows(db, model, owner)),
+        },
+    )
+
+@main.route('/admin/import/<kind>', methods=['POST'])
+@login_required
+def import_data(kind):
+    """Upsert an uploaded file (multipart 'file' or raw body), streaming progress as JSON Lines"""
+    if kind not in BULK_MODELS:
+        abort(404)
+    upload = request.files.get('file')
+    fmt = request.args.get('format') or bulk_io.guess_format(upload.filename if upload else None)
+    if fmt not in bulk_io.FORMATS:
+        return jsonify({'success': False, 'message': f"format must be one of {', '.join(bulk_io.FORMATS)}"}), 400
+    chunk_size = request.args.get('chunk_size', bulk_io.DEFAULT_CHUNK_SIZE, type=int)
+    model = BULK_MODELS[kind]
+    stream = io.TextIOWrapper(upload.stream if upload else request.stream, encoding='utf-8', newline='')
+
+    def generate():
+        imported = 0
+        try:
+            rows = bulk_io.read_rows(stream, fmt)
+            # Uploaded rows always belong to the uploader
+            owned = _bulk_owner_defaults(model, current_user.id)
+            for imported in bulk_io.iter_import(db, model, rows, owned, owned, chunk_size=chunk_size,
+                                                natural_key=BULK_NATURAL_KEYS.get(kind), owner=current_user.id):
+                yield bulk_io.progress_line(imported=imported)
+        except Exception as e:
+            log.exception("Error importing %s", kind)
+            yield bulk_io.progress_line(success=False, imported=imported, message=str(e))
+            return
+        finally:
+            _after_bulk_import(kind, current_user.id)
+        if kind == 'gear':
+            images = db.select(Gear.image).where(Gear.user_id == current_user.id).distinct()
+            for image_url, in db.session.execute(images):
+                remote_images.submit(image_url)
+                image_pipeline.submit(image_url)
+        yield bulk_io.progress_line(success=True, imported=imported, done=True)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@metrics.add_collector
+def _cache_and_pool_metrics():
+    """Gauges and counters owned by other modules, read at scrape time"""
+    pool = pool_metrics.snapshot()
+    values = [
+        ('linktree_click_buffer_pending', 'gauge', 'Click increments waiting to be flushed',
+         sum(click_buffer.pending().values())),
+        ('linktree_db_pool_checked_out', 'gauge', 'Connections checked out of the pool', pool['checked_out']),
+        ('linktree_db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a pooled connection',
+         pool['wait_seconds_total']),
+        ('linktree_db_pool_timeouts_total', 'counter', 'Pool checkouts that timed out', pool['timeouts']),
+        ('linktree_password_checks_in_flight', 'gauge', 'Password checks running or queued',
+         password_verifier.in_flight),
+        ('linktree_click_feed_subscribers', 'gauge', 'Open live admin dashboards', click_feed.subscriber_count()),
+        ('linktree_click_feed_threaded', 'gauge', 'Live admin dashboards holding a worker thread',
+         click_feed.threaded_count()),
+        ('linktree_click_feed_dropped_total', 'counter', 'Live dashboards dropped for not reading',
+         click_feed.dropped),
+    ]
+    async_pool = app_state().async_pool_metrics.snapshot()
+    values += [
+        ('linktree_async_db_pool_checked_out', 'gauge', 'Connections checked out of the ASGI async pool',
+         async_pool['checked_out']),
+        ('linktree_async_db_pool_wait_seconds_total', 'counter', 'Time spent waiting for an async pooled connection',
+         async_pool['wait_seconds_total']),
+        ('linktree_async_db_pool_timeouts_total', 'counter', 'Async pool checkouts that timed out',
+         async_pool['timeouts']),
+    ]
+    filter_stats = click_filter.stats()
+    values.append(('linktree_clicks_kept_total', 'counter', 'Tracked clicks counted', filter_stats['kept']))
+    for verdict, n in filter_stats['filtered'].items():
+        values.append((f'linktree_clicks_filtered_{verdict}_total', 'counter',
+                       f'Tracked clicks filtered as {verdict}', n))
+    for name, cache in (('page', page_cache), ('api', api_cache)):
+        stats = cache.stats()
+        values.append((f'linktree_{name}_cache_hits_total', 'counter', f'{name} cache hits', stats['hits']))
+        values.append((f'linktree_{name}_cache_misses_total', 'counter', f'{name} cache misses', stats['misses']))
+        values.append((f'linktree_{name}_cache_bytes', 'gauge', f'{name} cache size', stats['bytes']))
+    return values
+
+@main.route('/metrics')
+def prometheus_metrics():
+    """Prometheus text exposition of this worker's metrics"""
+    # Scrapers present METRICS_TOKEN; otherwise only the logged-in site owner gets in
+    token = current_app.config['METRICS_TOKEN']
+    if not (token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')):
+        if not current_user.is_authenticated:
+            abort(401)
+        if not tenants.is_default(current_user.id):
+            abort(403)
+    return current_app.response_class(metrics.render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@main.route('/admin/profiler', methods=['GET', 'POST'])
+@owner_required
+def profiler():
+    """GET: collapsed stacks for flamegraph.pl/speedscope. POST action=start|stop|reset."""
+    profiler = metrics.profiler
+    if request.method == 'POST':
+        action = request.form.get('action') or (request.get_json(silent=True) or {}).get('action')
+        if action not in ('start', 'stop', 'reset'):
+            return jsonify({'success': False, 'message': 'action must be start, stop or reset'}), 400
+        getattr(profiler, action)()
+        return jsonify({'success': True, 'running': profiler.running, 'samples': profiler.samples})
+    return current_app.response_class(profiler.collapsed(), mimetype='text/plain', headers={
+        'Content-Disposition': 'attachment; filename=profile.folded',
+        'X-Profiler-Samples': str(profiler.samples),
+    })
+
+@main.route('/admin/cache/stats')
+@owner_required
+def cache_stats():
+    """Page cache hit/miss counters for this worker"""
+    return jsonify(page_cache.stats())
+
+FEED_TARGETS = (('link', Link), ('gear', Gear))
+
+def click_count_select(model, owner):
+    return db.select(model.id, model.clicks, model.filtered_clicks).where(model.user_id == owner)
+
+def live_click_counts(rows_by_kind, buffer):
+    """The click feed's sync event: stored counts (``{kind: rows}``) plus the clicks still in ``buffer``"""
+    pending, filtered = buffer.pending(), buffer.pending(filtered=True)
+    return {kind: {str(id): {'clicks': (clicks or 0) + pending[(kind, id)],
+                             'filtered_clicks': filtered_clicks + filtered[(kind, id)]}
+                   for id, clicks, filtered_clicks in rows}
+            for kind, rows in rows_by_kind.items()}
+
+@main.route('/admin/clicks/stream')
+@login_required
+def click_stream():
+    """Server-sent click-count deltas for the current user's links and gear"""
+    try:
+        # Subscribed before the counts are read, so no click falls in between
+        subscriber = click_feed.subscribe(current_user.id, threaded=True)
+    except FeedFull as e:
+        return jsonify({'success': False, 'message': str(e)}), 503, {'Retry-After': '30'}
+    try:
+        initial = live_click_counts({kind: db.session.execute(click_count_select(model, current_user.id))
+                                     for kind, model in FEED_TARGETS}, click_buffer)
+    except Exception:
+        click_feed.unsubscribe(subscriber)
+        raise
+    return Response(click_feed.stream(subscriber, initial), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@main.route('/admin/clicks/filter')
+@owner_required
+def click_filter_stats():
+    """Kept and filtered click counts for this worker since it started"""
+    return jsonify(click_filter.stats())
+
+@main.route('/admin/db/pool')
+@owner_required
+def pool_stats():
+    """Connection pool checkout wait and utilisation for this worker"""
+    return jsonify({'profile': current_app.config['DB_PROFILE'], **pool_metrics.snapshot(),
+                    'async': app_state().async_pool_metrics.snapshot()})
+
+def check_link_health(app, owner=None):
+    """Check one creator's (or every) stored URL and record the results; returns (targets, results)"""
+    with app.app_context():
+        targets = link_health.load_targets(db.session, HEALTH_TARGETS, owner)
+        results = link_checker.check_many(url for _, _, url in targets)
+        try:
+            link_health.save_results(db.session, LinkHealth, targets, results)
+            link_health.prune(db.session, LinkHealth, HEALTH_TARGETS)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        if app.config['LINK_HEALTH_REWRITE']:
+            link_targets.invalidate()
+            gear_targets.invalidate()
+            # The targets manifests carry the rewritten URLs too
+            page_cache.bump(owner)
+        counts = link_health.summary(targets, results)
+        log.info("Checked %d links for %s: %s", len(results), owner or 'everyone', counts)
+        return targets, results
+
+@main.route('/admin/health')
+@login_required
+def link_health_results():
+    """The latest check of each of the current user's links and gear"""
+    records = {}
+    for kind, model in HEALTH_TARGETS.items():
+        ids = db.session.execute(db.select(model.id).where(model.user_id == current_user.id)).scalars().all()
+        records[kind] = [record.to_dict() for record in
+                         link_health.health_by_target(db.session, LinkHealth, kind, ids).values()]
+    return jsonify({'pending': health_runs.is_pending(current_user.id), **records})
+
+@main.route('/admin/health/check', methods=['POST'])
+@login_required
+def start_link_health_check():
+    """Check the current user's links in the background"""
+    queued = health_runs.submit(current_user.id, check_link_health, current_app._get_current_object(),
+                                current_user.id)
+    return jsonify({'success': True, 'queued': queued}), 202
+
 # Debug route - REMOVE AFTER DEBUGGING
-@app.route('/debug/db')
+@main.route('/debug/db')
+@owner_required
 def debug_db():
     """Debug route to check database state"""
     try:
-        print("Checking database state...")
-        print(f"Database URL: {app.config['SQLALCHEMY_DATABASE_URI'][:20]}...")
-        
         # Check if tables exist
-        print("Checking if tables exist...")
         inspector = db.inspect(db.engine)
         tables = inspector.get_table_names()
-        print(f"Found tables: {tables}")
-        
+        log.debug("Found tables: %s", tables)
+
         # Check admin user
-        print("Checking for admin user...")
         admin = User.query.filter_by(username='admin').first()
         
         # Check environment variables
+        from werkzeug.security import generate_password_hash
         admin_password = os.environ.get('ADMIN_PASSWORD')
         has_admin_password = bool(admin_password)
         
         if admin:
-            print(f"Admin user found with ID: {admin.id}")
             return jsonify({
                 'admin_exists': True,
                 'admin_id': admin.id,
                 'admin_username': admin.username,
-                'admin_password_hash': admin.password_hash[:20] + '...',
                 'tables': tables,
                 'has_admin_password': has_admin_password
             })
         else:
-            print("Admin user not found")
             # Try to create admin user if it doesn't exist
             try:
-                print("Attempting to create admin user...")
                 if not admin_password:
-                    print("WARNING: ADMIN_PASSWORD environment variable not set!")
+                    log.warning("ADMIN_PASSWORD is not set; creating the admin user with the default password")
                     admin_password = 'admin123'  # Default password
                 
                 admin = User(
                     username='admin',
-                    password_hash=generate_password_hash(admin_password)
+                    password_hash=generate_password_hash(admin_password, password_verifier.method)
                 )
                 db.session.add(admin)
                 db.session.commit()
-                print("Admin user created successfully!")
+                log.info("Admin user created from /debug/db")
                 
                 return jsonify({
                     'admin_exists': True,
                     'admin_id': admin.id,
                     'admin_username': admin.username,
-                    'admin_password_hash': admin.password_hash[:20] + '...',
                     'tables': tables,
                     'has_admin_password': has_admin_password,
                     'message': 'Admin user was just created'
                 })
             except Exception as e:
-                print(f"Error creating admin user: {str(e)}")
+                log.exception("Error creating admin user")
                 db.session.rollback()
                 return jsonify({
                     'admin_exists': False,
@@ -450,86 +1287,149 @@ def debug_db():
                     'has_admin_password': has_admin_password
                 })
     except Exception as e:
-        print(f"Error in debug route: {str(e)}")
+        log.exception("Error in debug route")
         import traceback
-        print(f"Traceback: {traceback.format_exc()}")
         return jsonify({
             'error': str(e),
             'traceback': traceback.format_exc()
         })
 
+@main.cli.command('export-static')
+@click.option('--output', default='build', show_default=True, help='Directory that receives versioned builds.')
+@click.option('--force', is_flag=True, help='Re-render even if the content hash is unchanged.')
+def export_static_command(output, force):
+    """Pre-render the public pages into a static build"""
+    import static_export
+    owner = tenants.default_id()
+    static_export.export_site(current_app._get_current_object(), Link, Gear, Preferences, owner,
+                              output=output, force=force, profile=preference_snapshots.get(owner))
+
 def init_db():
-    """Initialize the database"""
+    """Create tables and seed the admin user, preferences and default links (idempotent)"""
+    from werkzeug.security import generate_password_hash
     try:
-        print("Starting database initialization...")
-        print(f"Database URL: {app.config['SQLALCHEMY_DATABASE_URI'][:20]}...")
+        log.info("Initializing database %s", db.engine.url.render_as_string(hide_password=True))
+
+        # Create all tables, plus indexes added to existing ones since
+        db.create_all()
+        migrations.migrate(db, MIGRATED_MODELS)
+        log.info("Database tables created")
         
-        # Create all tables
-        with app.app_context():
-            db.create_all()
-            print("Database tables created successfully")
-            
-            # Check if admin user exists
-            admin = User.query.filter_by(username='admin').first()
-            if not admin:
-                print("Creating admin user...")
-                admin = User(
-                    username='admin',
-                    password_hash=generate_password_hash(os.environ.get('ADMIN_PASSWORD', 'admin'))
-                )
-                db.session.add(admin)
-                db.session.commit()
-                print("Admin user created successfully")
-            else:
-                print("Admin user already exists")
-            
-            # Check if preferences exist
-            preferences = Preferences.query.filter_by(user_id=admin.id).first()
-            if not preferences:
-                print("Creating default preferences...")
-                preferences = Preferences(user_id=admin.id)
-                db.session.add(preferences)
-                db.session.commit()
-                print("Default preferences created successfully")
-            else:
-                print("Preferences already exist")
-            
-            # Check if default links exist
-            existing_links = Link.query.filter_by(user_id=admin.id).count()
-            if existing_links == 0:
-                print("Creating default links...")
-                default_links = [
-                    Link(title='Gear Recommendations', url=url_for('gear', _external=True), icon='fas fa-gamepad', user_id=admin.id),
-                    Link(title='YouTube', url='https://youtube.com/@dcgaming', icon='fab fa-youtube', user_id=admin.id),
-                    Link(title='Twitch', url='https://twitch.tv/dcgaming', icon='fab fa-twitch', user_id=admin.id),
-                    Link(title='Twitter', url='https://twitter.com/dcgaming', icon='fab fa-twitter', user_id=admin.id)
-                ]
-                for link in default_links:
-                    db.session.add(link)
-                db.session.commit()
-                print("Default links created successfully")
-            else:
-                print("Links already exist in database")
+        # Check if admin user exists
+        admin = User.query.filter_by(username='admin').first()
+        if not admin:
+            admin = User(
+                username='admin',
+                password_hash=generate_password_hash(os.environ.get('ADMIN_PASSWORD', 'admin'),
+                                                     password_verifier.method)
+            )
+            db.session.add(admin)
+            db.session.commit()
+            log.info("Admin user created")
+        else:
+            log.info("Admin user already exists")
+        
+        # Check if preferences exist
+        preferences = Preferences.query.filter_by(user_id=admin.id).first()
+        if not preferences:
+            preferences = Preferences(user_id=admin.id,
+                                      site_description='Donkey Kong Country Speedrunning and other shenanigans')
+            db.session.add(preferences)
+            db.session.commit()
+            log.info("Default preferences created")
+        else:
+            log.info("Preferences already exist")
+        
+        # Check if default links exist
+        existing_links = Link.query.filter_by(user_id=admin.id).count()
+        if existing_links == 0:
+            default_links = [
+                # Relative on purpose: track_click sends '/gear' to the gear page
+                {'title': 'Gear Recommendations', 'url': '/gear', 'icon': 'fas fa-gamepad'},
+                {'title': 'YouTube', 'url': 'https://youtube.com/@dcgaming', 'icon': 'fab fa-youtube'},
+                {'title': 'Twitch', 'url': 'https://twitch.tv/dcgaming', 'icon': 'fab fa-twitch'},
+                {'title': 'Twitter', 'url': 'https://twitter.com/dcgaming', 'icon': 'fab fa-twitter'},
+            ]
+            db.session.execute(db.insert(Link), [dict(link, user_id=admin.id, position=position)
+                                                 for position, link in enumerate(default_links)])
+            db.session.commit()
+            log.info("Default links created")
+        else:
+            log.info("Links already exist in database")
         
         return True
-    except Exception as e:
-        print(f"Error initializing database: {str(e)}")
-        print("Traceback:", traceback.format_exc())
+    except Exception:
+        log.exception("Error initializing database")
         db.session.rollback()
         return False
 
-# Initialize database when the application starts
-with app.app_context():
-    print("Initializing database...")
-    success = init_db()
-    if not success:
-        print("WARNING: Database initialization failed!")
+MIGRATED_MODELS = (User, Link, Gear, ClickEvent, ClickRollup, LinkHealth, Preferences)
 
-# For local development
-if __name__ == '__main__':
-    app.run(debug=True) 
+@main.cli.command('migrate-db')
+def migrate_db_command():
+    """Add indexes and constraints from models.py to an existing database"""
+    try:
+        migrations.migrate(db, MIGRATED_MODELS)
+    except migrations.MigrationError as e:
+        raise click.ClickException(str(e))
+    print("Database schema is up to date")
+
+@main.cli.command('tune-password-hash')
+@click.option('--target-ms', default=250, show_default=True, help='Longest acceptable time for one password check.')
+def tune_password_hash_command(target_ms):
+    """Suggest a LOGIN_HASH_METHOD for this machine"""
+    method = login_guard.tune_scrypt(target_ms / 1000.0)
+    print(f"LOGIN_HASH_METHOD={method}")
+    print("Existing hashes are upgraded to it on the next successful login.")
+
+@main.cli.command('create-user')
+@click.argument('username')
+@click.password_option()
+def create_user_command(username, password):
+    """Add a creator whose public page is /USERNAME"""
+    from werkzeug.security import generate_password_hash
+    problem = validate_username(username)
+    if problem:
+        raise click.ClickException(problem)
+    if db.session.execute(db.select(User.id).where(User.username == username)).scalar() is not None:
+        raise click.ClickException(f'{username} already exists')
+    user = User(username=username, password_hash=generate_password_hash(password, password_verifier.method))
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(Preferences(user_id=user.id, site_title=username))
+    db.session.commit()
+    tenants.invalidate()
+    print(f"Created {username}; their page is /{username}")
+
+@main.cli.command('check-links')
+@click.option('--owner', help='Only this creator\'s links (username).')
+def check_links_command(owner):
+    """Check every stored link and gear URL and record the results"""
+    user_id = None
+    if owner:
+        user_id = db.session.execute(db.select(User.id).where(User.username == owner)).scalar()
+        if user_id is None:
+            raise click.ClickException(f'No user named {owner}')
+    targets, results = check_link_health(current_app._get_current_object(), user_id)
+    for kind, id, url in targets:
+        result = results.get(url)
+        if result is None:
+            continue
+        if not result.ok:
+            print(f"BROKEN   {kind} {id}: {url} ({result.status or result.error}, {result.latency_ms:.0f} ms)")
+        elif result.redirects:
+            print(f"REDIRECT {kind} {id}: {url} -> {result.final_url} ({result.redirects} hops)")
+    counts = link_health.summary(targets, results)
+    print(f"{counts['ok']} ok, {counts['redirected']} redirected, {counts['broken']} broken, "
+          f"{counts['skipped']} not checkable")
+
+@main.cli.command('init-db')
+def init_db_command():
+    """Create tables and seed default data (run once per environment)"""
+    if not init_db():
+        raise click.ClickException('Database initialization failed')
 
-@app.route('/admin/preferences', methods=['GET', 'POST'])
+@main.route('/admin/preferences', methods=['GET', 'POST'])
 @login_required
 def preferences():
     if request.method == 'POST':
@@ -548,18 +1448,42 @@ def preferences():
             preferences.text_color = data.get('text_color', preferences.text_color)
 
             db.session.commit()
+            preference_snapshots.invalidate(current_user.id)
+            page_cache.bump(current_user.id)
             return jsonify({'success': True, 'message': 'Preferences updated successfully'})
-        except Exception as e:
-            print(f"Error updating preferences: {str(e)}")
+        except Exception:
+            log.exception("Error updating preferences")
             db.session.rollback()
             return jsonify({'success': False, 'message': 'Error updating preferences'})
 
-    preferences = Preferences.query.filter_by(user_id=current_user.id).first()
+    preferences = preference_snapshots.get(current_user.id)
     return jsonify(preferences.to_dict() if preferences else {}) 
 
-@app.context_processor
+@main.route('/theme.css')
+def theme_css():
+    """Theme colour variables for the current user, versioned by ETag"""
+    preferences = preference_snapshots.get(current_user.id) if current_user.is_authenticated else None
+    response = current_app.response_class(
+        preferences.theme_css if preferences else DEFAULT_THEME_CSS, mimetype='text/css')
+    response.set_etag(preferences.theme_etag if preferences else 'default')
+    # The URL carries the ETag as ?v=, so a changed theme is a new URL
+    response.cache_control.private = True
+    response.cache_control.max_age = 31536000
+    return response.make_conditional(request)
+
+@main.app_context_processor
 def inject_preferences():
     if current_user.is_authenticated:
-        preferences = Preferences.query.filter_by(user_id=current_user.id).first()
+        preferences = preference_snapshots.get(current_user.id)
         return {'preferences': preferences}
-    return {'preferences': None} 
\ No newline at end of file
+    return {'preferences': None}
+
+app = create_app()
+# This module-level app is what WSGI servers, asgi.py and the flask CLI load, so
+# it sets up process logging; apps built with create_app() elsewhere leave the
+# host's logging alone
+instrumentation.configure_logging(app.config['LOG_LEVEL'])
+
+# For local development
+if __name__ == '__main__':
+    app.run(debug=True)
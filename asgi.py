@@ -0,0 +1,363 @@
+"""ASGI entry point with async handlers for the public read/redirect routes.
+
+    uvicorn asgi:application --workers 4
+
+``/track/<id>``, ``/gear/<id>/click``, ``/api/links`` and ``/api/gear`` (and
+each creator's ``/<username>/api/...``) are served on the event loop with an
+async SQLAlchemy engine (aiosqlite or asyncpg), and ``/``, ``/gear``,
+``/<username>`` and ``/<username>/gear`` (with their ``/api/targets``
+manifests) and ``/sw.js`` are answered straight from the page cache when it is
+warm. The admin dashboard's live click feed
+(``/admin/clicks/stream``) is streamed from the event loop too, so open
+dashboards do not tie up the WSGI adapter's thread.
+Everything else, including every admin route and page-cache misses, is
+handed to the regular Flask app through asgiref's WSGI adapter.
+
+Needs the optional packages in requirements-asgi.txt.
+"""
+import asyncio
+import json
+import re
+import time
+from email.utils import format_datetime, parsedate_to_datetime
+from urllib.parse import parse_qsl, quote
+
+from asgiref.wsgi import WsgiToAsgi
+from flask_login import current_user
+from werkzeug.test import EnvironBuilder
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import app as linktree
+import db_profiles
+import link_health
+import public_api
+from click_feed import FeedFull, format_event, nest
+from click_filter import prefetch_purpose
+from models import db, Link, Gear, LinkHealth
+from tenants import RESERVED
+
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+
+_TRACK_RE = re.compile(r'^/track/(\d+)$')
+_GEAR_CLICK_RE = re.compile(r'^/gear/(\d+)/click$')
+_PAGES = {'/': 'index', '/gear': 'gear', '/api/targets': 'targets_manifest'}
+_APIS = {'/api/links': linktree.LINKS_API, '/api/gear': linktree.GEAR_API}
+# Flask endpoint names, for the Cache-Control policies
+_API_ENDPOINTS = {'/api/links': 'main.get_links', '/api/gear': 'main.get_gear_items'}
+_TENANT_RE = re.compile(r'^/([^/]+)(/gear|/api/links|/api/gear|/api/targets)?$')
+# Suffix after /<username> -> page cache key, which is also the Flask endpoint name
+_TENANT_PAGES = {'': 'tenant_index', '/gear': 'tenant_gear', '/api/targets': 'tenant_targets_manifest'}
+_TENANT_APIS = {'/api/links': (linktree.LINKS_API, 'main.get_tenant_links'),
+                '/api/gear': (linktree.GEAR_API, 'main.get_tenant_gear_items')}
+
+
+def async_database_url(flask_app):
+    """The app's resolved database URL with its async driver swapped in"""
+    with flask_app.app_context():
+        url = db.engine.url
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f'No async driver configured for {backend}')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+class AsyncLinktree:
+    """ASGI app: async fast paths in front of the WSGI Flask app."""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        # The fast paths run outside an app context, so they use the app's state directly
+        self.state = linktree.app_state(flask_app)
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.engine = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http' or scope['method'] not in ('GET', 'HEAD'):
+            return await self.wsgi(scope, receive, send)
+
+        if scope['path'] == '/admin/clicks/stream' and scope['method'] == 'GET':
+            if await self._click_stream(scope, receive, send) is not False:
+                return
+            return await self.wsgi(scope, receive, send)
+
+        start = time.perf_counter()
+        status = []
+
+        async def send_and_record(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            await send(message)
+
+        endpoint = await self._fast_path(scope, send_and_record)
+        if endpoint is None:
+            return await self.wsgi(scope, receive, send)
+        linktree.metrics.record_request(endpoint, scope['method'], status[0] if status else 500,
+                                        time.perf_counter() - start)
+
+    async def _fast_path(self, scope, send):
+        """Handle the request on the event loop if it can be; returns the endpoint name used for metrics"""
+        path = scope['path']
+        match = _TRACK_RE.match(path)
+        if match:
+            handled = await self._track(scope, send, 'link', int(match.group(1)), self.state.link_targets, Link,
+                                        self.state.cache_policies.header_for('main.track_click'))
+            return 'asgi.track_click' if handled is not False else None
+        match = _GEAR_CLICK_RE.match(path)
+        if match:
+            await self._track(scope, send, 'gear', int(match.group(1)), self.state.gear_targets, Gear,
+                              self.state.cache_policies.header_for('main.track_gear_click'))
+            return 'asgi.track_gear_click'
+        if path == '/sw.js':
+            entry = self.state.page_cache.get('service_worker')
+            if entry is not None:
+                await self._cached_page(scope, send, entry, 'main.service_worker')
+                return 'asgi.service_worker'
+            return None
+        # Creator lookups must not block the loop; until the Flask app has
+        # warmed the directory, those requests go to it
+        if path in _APIS or path in _PAGES:
+            user_id = self.state.tenants.peek_default()
+            if user_id is None:
+                return None
+            if path in _APIS:
+                await self._api(scope, send, _APIS[path], _API_ENDPOINTS[path], user_id)
+                return f'asgi.{_APIS[path].name}_api'
+            entry = self.state.page_cache.get(_PAGES[path], user_id)
+            if entry is not None:
+                await self._cached_page(scope, send, entry, f'main.{_PAGES[path]}')
+                return f'asgi.{_PAGES[path]}'
+            return None
+        match = _TENANT_RE.match(path)
+        if match and match.group(1).lower() not in RESERVED:
+            user_id = self.state.tenants.peek(match.group(1))
+            if user_id is None:
+                return None
+            suffix = match.group(2) or ''
+            if suffix in _TENANT_APIS:
+                resource, endpoint = _TENANT_APIS[suffix]
+                await self._api(scope, send, resource, endpoint, user_id)
+                return f'asgi.tenant_{resource.name}_api'
+            key = _TENANT_PAGES[suffix]
+            entry = self.state.page_cache.get(key, user_id)
+            if entry is not None:
+                await self._cached_page(scope, send, entry, f'main.{key}')
+                return f'asgi.{key}'
+        return None
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.engine = self._create_engine()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.state.click_buffer.stop()
+                if self.engine is not None:
+                    await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _ensure_engine(self):
+        # Servers that skip the lifespan protocol
+        if self.engine is None:
+            self.engine = self._create_engine()
+        return self.engine
+
+    def _create_engine(self):
+        """The async engine, pooled by the same DB_PROFILE as the Flask app's and measured in its own metrics"""
+        config = self.flask_app.config
+        url = async_database_url(self.flask_app)
+        metrics = self.state.async_pool_metrics
+        engine = create_async_engine(url, **db_profiles.engine_options(
+            url.render_as_string(hide_password=False), metrics, config['DB_PROFILE'], config['DB_POOL_OVERRIDES'],
+            asyncio=True))
+        db_profiles.instrument_engine(engine.sync_engine, metrics)
+        return engine
+
+    async def _track(self, scope, send, kind, id, cache, model, cache_control):
+        stale = cache.is_stale()
+        if not stale and cache.is_missing(id):
+            return await _respond(send, 404, b'Not Found', 'text/plain; charset=utf-8', method=scope['method'])
+        target = None if stale else cache.peek(id)
+        if target is None:
+            engine = await self._ensure_engine()
+            statement = link_health.redirect_select(model, LinkHealth, kind,
+                                                    self.flask_app.config['LINK_HEALTH_REWRITE'])
+            async with engine.connect() as conn:
+                if cache.is_stale():
+                    cache.fill((await conn.execute(statement)).all())
+                    target = cache.peek(id)
+                else:
+                    row = (await conn.execute(statement.where(model.id == id))).first()
+                    if row is None:
+                        cache.put_missing(id)
+                    else:
+                        target = cache.put(id, *row[1:])
+        if target is None:
+            return await _respond(send, 404, b'Not Found', 'text/plain; charset=utf-8', method=scope['method'])
+
+        if kind == 'link' and target.is_gear_page:
+            # Which gear page depends on the creator; left to the Flask app
+            return False
+        headers = _headers(scope)
+        self.state.record_click(kind, id, target.owner, _client_address(self.flask_app, scope, headers),
+                                headers.get('user-agent'), headers.get('referer'), prefetch_purpose(headers.get))
+        return await _redirect(send, target.url, cache_control, scope['method'])
+
+    async def _click_stream(self, scope, receive, send, heartbeat=15.0):
+        """The live click feed as an async loop; False (left to Flask) without a logged-in session"""
+        user_id = await asyncio.to_thread(_session_user, self.flask_app, scope, _headers(scope))
+        if user_id is None:
+            return False
+        feed = self.state.click_feed
+        try:
+            subscriber = feed.subscribe(user_id)
+        except FeedFull as e:
+            body = json.dumps({'success': False, 'message': str(e)}).encode()
+            return await _respond(send, 503, body, 'application/json', [(b'retry-after', b'30')])
+        watcher = None
+        try:
+            engine = await self._ensure_engine()
+            async with engine.connect() as conn:
+                rows = {kind: (await conn.execute(linktree.click_count_select(model, user_id))).all()
+                        for kind, model in linktree.FEED_TARGETS}
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no')]})
+            disconnected = asyncio.Event()
+
+            async def watch():
+                while (await receive())['type'] != 'http.disconnect':
+                    pass
+                disconnected.set()
+
+            watcher = asyncio.create_task(watch())
+            chunk = 'retry: 3000\n\n' + format_event('sync', linktree.live_click_counts(rows, self.state.click_buffer))
+            idle = 0.0
+            while not subscriber.closed:
+                if chunk:
+                    # Blocks while the client is not reading; the feed drops it if that lasts
+                    await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+                    chunk, idle = None, 0.0
+                try:
+                    await asyncio.wait_for(disconnected.wait(), feed.interval)
+                    break
+                except asyncio.TimeoutError:
+                    idle += feed.interval
+                deltas = subscriber.take(0)
+                if deltas:
+                    chunk = format_event('clicks', nest(deltas))
+                elif idle >= heartbeat:
+                    chunk = ': keep-alive\n\n'
+            if not disconnected.is_set():
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            feed.unsubscribe(subscriber)
+
+    async def _api(self, scope, send, resource, endpoint, user_id):
+        args = dict(parse_qsl(scope['query_string'].decode('latin-1')))
+        try:
+            fields, limit, cursor = public_api.parse_query(resource, args)
+        except public_api.ApiError as e:
+            body = public_api.dumps({'success': False, 'message': str(e)})
+            return await _respond(send, 400, body, 'application/json', method=scope['method'])
+        key = public_api.cache_key(resource, fields, limit, cursor)
+        entry = self.state.api_cache.get(key, user_id)
+        if entry is None:
+            engine = await self._ensure_engine()
+            async with engine.connect() as conn:
+                statement = public_api.select_page(resource, fields, limit, cursor, owner=user_id)
+                rows = (await conn.execute(statement)).all()
+            body, headers = public_api.render_page(resource, fields, rows, limit, scope['path'])
+            entry = self.state.api_cache.put(key, body, 'application/json', headers, namespace=user_id)
+        return await self._cached_page(scope, send, entry, endpoint)
+
+    async def _cached_page(self, scope, send, entry, endpoint):
+        headers = _headers(scope)
+        body = entry.body
+        encoding = self.state.compressor.choose(headers.get('accept-encoding'), entry.mimetype, len(body))
+        # Same validators as the Flask path: a compressed body has a weak ETag
+        etag = f'W/"{entry.etag}"' if encoding else f'"{entry.etag}"'
+        extra = [(b'etag', etag.encode()), (b'last-modified', format_datetime(entry.last_modified, usegmt=True).encode())]
+        extra.extend((name.lower().encode(), value.encode()) for name, value in entry.headers.items()
+                     if name.lower() != 'cache-control')
+        cache_control = self.state.cache_policies.header_for(endpoint) or entry.headers.get('Cache-Control')
+        if cache_control:
+            extra.append((b'cache-control', cache_control.encode()))
+        extra.append((b'vary', b'Accept-Encoding'))
+        if_none_match = headers.get('if-none-match')
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+            not_modified = f'"{entry.etag}"' in tags or if_none_match.strip() == '*'
+        else:
+            not_modified = _not_modified_since(headers.get('if-modified-since'), entry.last_modified)
+        if not_modified:
+            return await _respond(send, 304, b'', None, extra)
+        if encoding:
+            body = self.state.compressor.encoded(body, encoding, entry.etag)
+            extra.append((b'content-encoding', encoding.encode()))
+        content_type = entry.mimetype + ('; charset=utf-8' if entry.mimetype.startswith('text/') else '')
+        return await _respond(send, 200, body, content_type, extra, scope['method'])
+
+
+def _headers(scope):
+    return {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+
+
+def _client_address(flask_app, scope, headers):
+    """The visitor's address, read from X-Forwarded-For like the Flask app's ProxyFix"""
+    hops = flask_app.config['TRUSTED_PROXY_HOPS']
+    if hops:
+        forwarded = [value.strip() for value in headers.get('x-forwarded-for', '').split(',')]
+        if len(forwarded) >= hops and forwarded[-hops]:
+            return forwarded[-hops]
+    client = scope.get('client')
+    return client[0] if client else None
+
+
+def _session_user(flask_app, scope, headers):
+    """The id of the user Flask-Login authenticates for this request, or None
+
+    Runs the request's cookie through Flask-Login as the Flask route would (the
+    user loader and session protection), so a deleted user or a session from
+    another client is not let in. Blocking; call it off the event loop.
+    """
+    environ = EnvironBuilder(path=scope['path'], method=scope['method'], headers=list(headers.items()),
+                             environ_base={'REMOTE_ADDR': _client_address(flask_app, scope, headers)}).get_environ()
+    with flask_app.request_context(environ):
+        if not current_user.is_authenticated:
+            return None
+        return current_user.id
+
+
+def _not_modified_since(value, last_modified):
+    if not value:
+        return False
+    try:
+        return last_modified <= parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return False
+
+
+async def _redirect(send, location, cache_control=None, method='GET'):
+    headers = [(b'location', quote(location, safe=":/?#[]@!$&'()*+,;=%").encode())]
+    if cache_control:
+        headers.append((b'cache-control', cache_control.encode()))
+    await _respond(send, 302, b'', None, headers, method)
+
+
+async def _respond(send, status, body, content_type, extra_headers=(), method='GET'):
+    """Send a complete response; a HEAD response keeps GET's Content-Length but has no body"""
+    headers = [(b'content-length', str(len(body)).encode())]
+    if content_type:
+        headers.append((b'content-type', content_type.encode()))
+    headers.extend(extra_headers)
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': b'' if method == 'HEAD' else body})
+
+
+application = AsyncLinktree(linktree.app)
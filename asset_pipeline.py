@@ -0,0 +1,308 @@
+"""Vendored, bundled and fingerprinted CSS/JS/font assets.
+
+``flask build-assets`` downloads the third-party assets the pages use into
+``static/vendor/``: Bootstrap, the two Google Fonts, and the SVG of each Font
+Awesome icon that is actually used. It then writes minified bundles with
+content-hashed names to ``static/cache/assets/``, plus a ``manifest.json``:
+
+- ``public.css``: fonts, icons and styles.css, for the public pages
+- ``admin.css`` / ``admin.js``: the same plus Bootstrap, for the admin pages
+
+Font Awesome is subset to the icons in the templates and in ``Link.icon``,
+each inlined as an SVG mask, so no icon font is downloaded at all. Templates
+ask for ``asset('public.css')``, a static filename for ``url_for``. Before the
+first build it returns None, and the templates fall back to the CDN links.
+Files under ``static/cache/`` are served with immutable cache headers, apart
+from ``manifest.json``, which each build rewrites.
+"""
+import hashlib
+import json
+import os
+import re
+import urllib.parse
+import urllib.request
+
+VENDOR_FILES = {
+    'vendor/bootstrap.min.css': 'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css',
+    'vendor/bootstrap.bundle.min.js': 'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js',
+}
+GOOGLE_FONTS_URL = 'https://fonts.googleapis.com/css2?family=Press+Start+2P&family=VT323&display=swap'
+FONT_AWESOME_SVG_URL = 'https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0/svgs/{style}/{name}.svg'
+# Loaded as well when a link uses an icon added after the last build
+FONT_AWESOME_CSS_URL = 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css'
+
+ICONS = ':icons'
+BUNDLES = {
+    'public.css': ['vendor/fonts/fonts.css', ICONS, 'styles.css'],
+    'admin.css': ['vendor/bootstrap.min.css', 'vendor/fonts/fonts.css', ICONS, 'styles.css'],
+    'admin.js': ['vendor/bootstrap.bundle.min.js'],
+}
+OUTPUT_DIR = 'cache/assets'
+
+# Browsers get woff2 from Google Fonts only if they look like one
+FONT_USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+
+ICON_STYLES = {'fa': 'solid', 'fas': 'solid', 'fa-solid': 'solid', 'far': 'regular', 'fa-regular': 'regular',
+               'fab': 'brands', 'fa-brands': 'brands'}
+STYLE_CLASSES = {'solid': ('fas', 'fa-solid', 'fa'), 'regular': ('far', 'fa-regular'), 'brands': ('fab', 'fa-brands')}
+ICON_MODIFIER = re.compile(r'fa-(\d+x|2xs|xs|sm|lg|xl|2xl|fw|spin|pulse|beat|fade|bounce|shake|border|inverse'
+                           r'|flip(-\w+)?|rotate-\w+|pull-\w+|stack(-\w+)?|ul|li)$')
+TEMPLATE_ICON_CLASSES = re.compile(r'class="([^"{]*\bfa-[^"{]*)"')
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+class AssetError(RuntimeError):
+    """A vendored file is missing and could not be downloaded."""
+
+
+def parse_icon(classes):
+    """``(style, name)`` for a Font Awesome class list like 'fab fa-youtube', else None"""
+    if not classes or 'fa' not in classes:
+        return None
+    tokens = classes.split()
+    style = next((ICON_STYLES[token] for token in tokens if token in ICON_STYLES), None)
+    names = [token[3:] for token in tokens
+             if token.startswith('fa-') and token not in ICON_STYLES and not ICON_MODIFIER.match(token)]
+    if style is None or not names:
+        return None
+    return style, names[0]
+
+
+def template_icons(template_folder):
+    """Icon class lists written literally in the templates"""
+    found = set()
+    for name in sorted(os.listdir(template_folder)):
+        if name.endswith('.html'):
+            with open(os.path.join(template_folder, name), encoding='utf-8') as f:
+                found.update(TEMPLATE_ICON_CLASSES.findall(f.read()))
+    return found
+
+
+# Runtime
+
+class Assets:
+    """The build manifest, read once per process; exposed to templates"""
+
+    def __init__(self, static_folder=None):
+        self.static_folder = static_folder
+        self._manifest = None
+
+    @property
+    def manifest(self):
+        if self._manifest is None:
+            path = os.path.join(self.static_folder, OUTPUT_DIR, 'manifest.json')
+            try:
+                with open(path) as f:
+                    self._manifest = json.load(f)
+            except (OSError, ValueError):
+                self._manifest = {}
+        return self._manifest
+
+    def reload(self):
+        self._manifest = None
+
+    def path(self, name):
+        """Static filename of a built bundle, for url_for('static', ...), or None before a build"""
+        return self.manifest.get('files', {}).get(name)
+
+    def preloads(self):
+        """Static filenames of the fonts every page needs"""
+        return self.manifest.get('preload', [])
+
+    def needs_icon_font(self, links=()):
+        """True if a link uses an icon the last build did not include"""
+        built = self.manifest.get('icons')
+        if built is None:
+            return False
+        built = set(built)
+        for link in links:
+            icon = parse_icon(getattr(link, 'icon', None))
+            if icon and '/'.join(icon) not in built:
+                return True
+        return False
+
+
+# Build
+
+def fetch_url(url, timeout=30):
+    request = urllib.request.Request(url, headers={'User-Agent': FONT_USER_AGENT})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+
+def build(static_folder, icon_classes, fetch=fetch_url, offline=False, out=print):
+    """Vendor what is missing, then write the bundles and manifest; returns the manifest"""
+    def vendored(name, url):
+        path = os.path.join(static_folder, name)
+        if not os.path.exists(path):
+            if offline:
+                raise AssetError(f"{name} is not vendored yet; run build-assets without --offline once")
+            out(f"Downloading {url}")
+            _write(path, fetch(url))
+        return path
+
+    for name, url in VENDOR_FILES.items():
+        vendored(name, url)
+    if not os.path.exists(os.path.join(static_folder, 'vendor/fonts/fonts.css')):
+        if offline:
+            raise AssetError("Fonts are not vendored yet; run build-assets without --offline once")
+        _vendor_google_fonts(static_folder, fetch, out)
+
+    icons = {}
+    for classes in sorted(icon_classes):
+        icon = parse_icon(classes)
+        if icon is None or icon in icons:
+            continue
+        style, name = icon
+        try:
+            path = vendored(f'vendor/fontawesome/{style}/{name}.svg',
+                            FONT_AWESOME_SVG_URL.format(style=style, name=name))
+        except (OSError, AssetError) as e:
+            out(f"Skipping icon {style}/{name}: {e}")
+            continue
+        with open(path, encoding='utf-8') as f:
+            icons[icon] = f.read()
+
+    output = os.path.join(static_folder, OUTPUT_DIR)
+    os.makedirs(output, exist_ok=True)
+    previous = Assets(static_folder).manifest
+    preload_sources = _read_lines(os.path.join(static_folder, 'vendor/fonts/preload.txt'))
+    manifest = {'files': {}, 'preload': [], 'icons': sorted('/'.join(icon) for icon in icons)}
+    copied = {}
+    for bundle, sources in BUNDLES.items():
+        parts = []
+        for source in sources:
+            if source == ICONS:
+                parts.append(icon_css(icons))
+                continue
+            path = os.path.join(static_folder, source)
+            with open(path, encoding='utf-8') as f:
+                text = f.read()
+            if bundle.endswith('.css'):
+                text = _inline_urls(text, os.path.dirname(path), output, copied)
+            parts.append(text)
+        body = '\n'.join(parts) if bundle.endswith('.css') else ';\n'.join(parts)
+        if bundle.endswith('.css'):
+            body = minify_css(body)
+        manifest['files'][bundle] = f'{OUTPUT_DIR}/{_write_fingerprinted(output, bundle, body.encode())}'
+    for source, name in copied.items():
+        if os.path.basename(source) in preload_sources:
+            manifest['preload'].append(f'{OUTPUT_DIR}/{name}')
+    manifest['preload'].sort()
+
+    _write(os.path.join(output, 'manifest.json'), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    _prune(output, manifest, previous)
+    for bundle, name in manifest['files'].items():
+        out(f"{bundle} -> static/{name}")
+    return manifest
+
+
+def icon_css(icons):
+    """Icons as CSS masks: the element is filled with currentColor through the icon's shape"""
+    if not icons:
+        return ''
+    selectors, rules = [], []
+    for (style, name), svg in sorted(icons.items()):
+        svg = re.sub(r'<!--.*?-->', '', svg, flags=re.S).strip()
+        selector = ','.join(f'.{cls}.fa-{name}' for cls in STYLE_CLASSES[style])
+        selectors.append(selector)
+        rules.append(f'{selector}{{--fa-icon:url("data:image/svg+xml,{urllib.parse.quote(svg, safe=" =:/")}")}}')
+    every = ','.join(selectors)
+    base = (f'{every}{{display:inline-block;width:1.25em;height:1em;vertical-align:-.125em;'
+            f'background-color:currentColor;-webkit-mask:var(--fa-icon) center/contain no-repeat;'
+            f'mask:var(--fa-icon) center/contain no-repeat}}')
+    # The full Font Awesome stylesheet may be loaded too (see needs_icon_font); hide its glyphs
+    before = ','.join(f'{selector}::before' for selector in ','.join(selectors).split(','))
+    return '\n'.join([base, f'{before}{{content:none!important}}'] + rules)
+
+
+def minify_css(text):
+    """Drop comments (except /*! licences */) and insignificant whitespace"""
+    text = re.sub(r'/\*(?!!).*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,])\s*', r'\1', text)
+    return text.replace(';}', '}').strip()
+
+
+def _vendor_google_fonts(static_folder, fetch, out):
+    out(f"Downloading {GOOGLE_FONTS_URL}")
+    css = fetch(GOOGLE_FONTS_URL).decode()
+    folder = os.path.join(static_folder, 'vendor/fonts')
+    preload = []
+    subset = None
+    lines = []
+    for line in css.splitlines():
+        comment = re.match(r'\s*/\*\s*([\w-]+)\s*\*/', line)
+        if comment:
+            subset = comment.group(1)
+        match = CSS_URL.search(line)
+        if match and match.group(2).startswith('http'):
+            url = match.group(2)
+            name = os.path.basename(urllib.parse.urlsplit(url).path)
+            out(f"Downloading {url}")
+            _write(os.path.join(folder, name), fetch(url))
+            line = line.replace(url, name)
+            if subset == 'latin':
+                preload.append(name)
+        lines.append(line)
+    _write(os.path.join(folder, 'fonts.css'), '\n'.join(lines).encode())
+    _write(os.path.join(folder, 'preload.txt'), '\n'.join(preload).encode())
+
+
+def _inline_urls(text, source_dir, output, copied):
+    """Copy files a stylesheet references next to the bundle, fingerprinted, and point at them"""
+    def replace(match):
+        url = match.group(2)
+        if url.startswith(('data:', 'http:', 'https:', '//', '#')):
+            return match.group(0)
+        path = os.path.normpath(os.path.join(source_dir, url.split('?', 1)[0].split('#', 1)[0]))
+        if not os.path.isfile(path):
+            return match.group(0)
+        if path not in copied:
+            with open(path, 'rb') as f:
+                copied[path] = _write_fingerprinted(output, os.path.basename(path), f.read())
+        return f'url({copied[path]})'
+    return CSS_URL.sub(replace, text)
+
+
+def _write_fingerprinted(folder, name, data):
+    base, ext = os.path.splitext(name)
+    name = f'{base}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+    path = os.path.join(folder, name)
+    if not os.path.exists(path):
+        _write(path, data)
+    return name
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _read_lines(path):
+    try:
+        with open(path) as f:
+            return {line.strip() for line in f if line.strip()}
+    except OSError:
+        return set()
+
+
+def _prune(output, manifest, previous):
+    """Keep this build's files and the previous one's (pages cached before the build still use them)"""
+    keep = {'manifest.json'}
+    for m in (manifest, previous):
+        keep.update(os.path.basename(name) for name in list(m.get('files', {}).values()) + m.get('preload', []))
+    referenced = set()
+    for name in keep:
+        path = os.path.join(output, name)
+        if name.endswith('.css') and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                referenced.update(match.group(2) for match in CSS_URL.finditer(f.read()))
+    for name in os.listdir(output):
+        # .br/.gz siblings written by 'flask compress-static' go with their file
+        base = name[:-3] if name.endswith(('.br', '.gz')) else name
+        if base not in keep and base not in referenced:
+            os.remove(os.path.join(output, name))
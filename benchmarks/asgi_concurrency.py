@@ -0,0 +1,161 @@
+"""Compare the threaded WSGI server with the ASGI app under concurrent clients.
+
+Starts each server in its own process against the same seeded SQLite
+database, then drives it with N concurrent keep-alive asyncio clients hitting
+a mix of /track/<id>, /api/links, / and /gear. Reports req/s and
+p50/p99 latency per mode and concurrency level.
+
+    python benchmarks/asgi_concurrency.py --concurrency 100 1000 --requests 20000
+"""
+import argparse
+import asyncio
+import os
+import resource
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WSGI_SERVER = r'''
+import logging, sys
+sys.path.insert(0, sys.argv[1])
+from werkzeug.serving import ThreadedWSGIServer
+import app as linktree
+logging.getLogger('werkzeug').setLevel(logging.ERROR)  # no access log, like uvicorn below
+ThreadedWSGIServer.request_queue_size = 2048
+ThreadedWSGIServer('127.0.0.1', int(sys.argv[2]), linktree.app).serve_forever()
+'''
+
+SERVERS = {
+    'wsgi': lambda port: [sys.executable, '-c', WSGI_SERVER, ROOT, str(port)],
+    'asgi': lambda port: [sys.executable, '-m', 'uvicorn', 'asgi:application', '--port', str(port),
+                          '--log-level', 'warning', '--no-access-log', '--backlog', '2048'],
+}
+
+
+def seed_database(path):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{path}')
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'],
+                   cwd=ROOT, env=env, check=True, capture_output=True)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, db_path, log):
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}')
+    process = subprocess.Popen(SERVERS[mode](port), cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=log)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            log.seek(0)
+            raise RuntimeError(f'{mode} server exited:\n{log.read().decode()[-2000:]}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process, port
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'{mode} server did not start')
+
+
+async def fetch(reader, writer, path):
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: bench\r\nUser-Agent: asgi-bench\r\n\r\n'.encode())
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = dict(line.split(':', 1) for line in lines[1:] if ':' in line)
+    headers = {name.strip().lower(): value.strip() for name, value in headers.items()}
+    await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers.get('connection', '').lower() == 'close'
+
+
+async def client(port, paths, offset, count, latencies, errors):
+    reader = writer = None
+    for i in range(count):
+        path = paths[(offset + i) % len(paths)]
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            status, close = await fetch(reader, writer, path)
+            if status >= 400:
+                errors.append(status)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            errors.append(path)
+            close = True
+        latencies.append(time.perf_counter() - start)
+        if close and writer is not None:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def drive(port, paths, concurrency, total):
+    latencies, errors = [], []
+    per_client = max(1, total // concurrency)
+    start = time.perf_counter()
+    await asyncio.gather(*(client(port, paths, n, per_client, latencies, errors) for n in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        'errors': len(errors),
+    }
+
+
+def raise_fd_limit(needed):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(needed, hard), hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--modes', nargs='+', choices=list(SERVERS), default=list(SERVERS))
+    args = parser.parse_args()
+    raise_fd_limit(max(args.concurrency) * 2 + 256)
+
+    # init-db seeds links 1-4 (1 is the /gear page link) and no gear items
+    paths = ['/track/2', '/track/3', '/track/4', '/api/links', '/', '/gear']
+    with tempfile.TemporaryDirectory() as tmp:
+        seeded_db = os.path.join(tmp, 'seed.db')
+        seed_database(seeded_db)
+
+        print(f"{'mode':<6} {'clients':>8} {'requests':>9} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for mode in args.modes:
+            db_path = os.path.join(tmp, f'{mode}.db')
+            shutil.copyfile(seeded_db, db_path)
+            log = open(os.path.join(tmp, f'{mode}.log'), 'w+b')
+            process, port = start_server(mode, db_path, log)
+            try:
+                asyncio.run(drive(port, paths, 10, 200))  # warm caches and pools
+                for concurrency in args.concurrency:
+                    r = asyncio.run(drive(port, paths, concurrency, args.requests))
+                    print(f"{mode:<6} {concurrency:>8} {r['requests']:>9} {r['rps']:>9.1f} "
+                          f"{r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['errors']:>7}")
+            finally:
+                process.terminate()
+                process.wait(timeout=10)
+                log.close()
+
+
+if __name__ == '__main__':
+    main()
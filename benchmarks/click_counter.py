@@ -0,0 +1,111 @@
+"""Benchmark the buffered click pipeline against the old read-modify-write path.
+
+Runs N concurrent clients against /track/<id> through the Flask test client,
+once with the original "load row, clicks += 1, commit" handler and once with
+the buffered handler, then reports requests/sec and how many clicks made it
+into the database.
+
+    python benchmarks/click_counter.py --threads 16 --clicks 4000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def setup_app(db_path):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    # Every request comes from the same client; without this all but the first would be filtered as repeats
+    os.environ['CLICK_DEDUP_WINDOW'] = '0'
+    import app as linktree
+
+    app, db, Link = linktree.app, linktree.db, linktree.Link
+
+    @app.route('/bench/legacy-track/<int:id>')
+    def legacy_track_click(id):
+        """The tracking handler as it was before buffering"""
+        link = Link.query.get_or_404(id)
+        link.clicks += 1
+        db.session.commit()
+        return linktree.redirect(link.url)
+
+    with app.app_context():
+        linktree.init_db()
+        admin = linktree.User.query.filter_by(username='admin').first()
+        link = Link(title='Bench', url='https://example.com/', user_id=admin.id, clicks=0)
+        db.session.add(link)
+        db.session.commit()
+        return linktree, link.id
+
+
+def run(app, path, threads, clicks):
+    per_thread = clicks // threads
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker():
+        client = app.test_client()
+        for _ in range(per_thread):
+            try:
+                response = client.get(path)
+                ok = response.status_code == 302
+            except Exception:
+                ok = False
+            if not ok:
+                with lock:
+                    errors[0] += 1
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    return per_thread * threads, elapsed, errors[0]
+
+
+def read_clicks(linktree, link_id):
+    with linktree.app.app_context():
+        linktree.db.session.expire_all()
+        return linktree.db.session.get(linktree.Link, link_id).clicks
+
+
+def reset_clicks(linktree, link_id):
+    with linktree.app.app_context():
+        linktree.Link.query.filter_by(id=link_id).update({'clicks': 0})
+        linktree.db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--clicks', type=int, default=4000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        linktree, link_id = setup_app(os.path.join(tmp, 'bench.db'))
+        click_buffer = linktree.app_state(linktree.app).click_buffer
+
+        modes = [
+            ('legacy', f'/bench/legacy-track/{link_id}', lambda: None),
+            ('buffered', f'/track/{link_id}', click_buffer.flush),
+        ]
+        print(f"{'mode':<10} {'requests':>9} {'req/s':>10} {'errors':>7} {'stored':>7} {'lost':>6}")
+        for name, path, finish in modes:
+            reset_clicks(linktree, link_id)
+            sent, elapsed, errors = run(linktree.app, path, args.threads, args.clicks)
+            finish()
+            stored = read_clicks(linktree, link_id)
+            print(f"{name:<10} {sent:>9} {sent / elapsed:>10.1f} {errors:>7} {stored:>7} {sent - stored:>6}")
+
+        click_buffer.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Measure cold start: process import of app.py to the first response of GET /.
+
+Each run is a fresh interpreter against a copy of the same seeded SQLite
+database. Pass --ref to measure another git revision side by side, e.g. the
+commit before the application factory:
+
+    python benchmarks/cold_start.py --runs 10 --ref HEAD~1
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r'''
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import app as linktree
+imported = time.perf_counter()
+response = linktree.app.test_client().get('/')
+first = time.perf_counter()
+print(json.dumps({'import_ms': (imported - start) * 1000, 'first_response_ms': (first - start) * 1000,
+                  'status': response.status_code}))
+'''
+
+
+def seed_database(path):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{path}')
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'],
+                   cwd=ROOT, env=env, check=True, capture_output=True)
+
+
+def export_revision(ref, target):
+    archive = subprocess.run(['git', 'archive', ref], cwd=ROOT, check=True, capture_output=True).stdout
+    subprocess.run(['tar', '-x', '-C', target], input=archive, check=True)
+
+
+def measure(source_dir, seeded_db, runs, tmp):
+    samples = []
+    for i in range(runs):
+        db_path = os.path.join(tmp, f'run-{i}.db')
+        shutil.copyfile(seeded_db, db_path)
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', PYTHONDONTWRITEBYTECODE='1')
+        result = subprocess.run([sys.executable, '-c', PROBE, source_dir], cwd=source_dir, env=env,
+                                capture_output=True, text=True)
+        lines = [line for line in result.stdout.splitlines() if line.startswith('{')]
+        if result.returncode != 0 or not lines:
+            raise RuntimeError(f'probe failed in {source_dir}:\n{result.stderr[-2000:]}')
+        samples.append(json.loads(lines[-1]))
+    return {
+        'import_ms': statistics.median(s['import_ms'] for s in samples),
+        'first_response_ms': statistics.median(s['first_response_ms'] for s in samples),
+        'status': samples[-1]['status'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--ref', help='git revision to compare against the working tree')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        seeded_db = os.path.join(tmp, 'seed.db')
+        seed_database(seeded_db)
+
+        targets = [('working tree', ROOT)]
+        if args.ref:
+            ref_dir = os.path.join(tmp, 'ref')
+            os.makedirs(ref_dir)
+            export_revision(args.ref, ref_dir)
+            targets.insert(0, (args.ref, ref_dir))
+
+        print(f"{'source':<14} {'import ms':>10} {'first response ms':>18} {'status':>7}")
+        for name, source_dir in targets:
+            result = measure(source_dir, seeded_db, args.runs, tmp)
+            print(f"{name:<14} {result['import_ms']:>10.1f} {result['first_response_ms']:>18.1f} {result['status']:>7}")
+
+
+if __name__ == '__main__':
+    main()
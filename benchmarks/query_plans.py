@@ -0,0 +1,165 @@
+"""Check the query plans of the request-path queries on a seeded database.
+
+Seeds 100k links and gear items (spread over 100 users), click events and
+rollups, then runs EXPLAIN on every query the public and admin routes issue
+and fails if any of them scans a whole table or sorts in a temp structure.
+Runs against a throwaway SQLite file by default; pass --database to check a
+scratch Postgres database instead (its tables are dropped and recreated):
+
+    python benchmarks/query_plans.py --rows 100000
+    python benchmarks/query_plans.py --database postgresql://localhost/linktree_plans --reset
+
+The index and gear pages read every row by design (they are page-cached);
+their plans are printed but not counted as failures.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def seed(linktree, rows, users=100):
+    db = linktree.db
+    db.drop_all()
+    db.create_all()
+    start = datetime(2024, 1, 1)
+    rng = random.Random(42)
+    with db.engine.begin() as conn:
+        conn.execute(linktree.User.__table__.insert(),
+                     [{'id': i, 'username': f'user{i}', 'password_hash': 'x'} for i in range(1, users + 1)])
+        conn.execute(linktree.Preferences.__table__.insert(), [{'user_id': i} for i in range(1, users + 1)])
+        for offset in range(0, rows, 10000):
+            batch = range(offset, min(rows, offset + 10000))
+            conn.execute(linktree.Link.__table__.insert(), [{
+                'title': f'Link {i}', 'url': f'https://example.com/{i}', 'icon': 'fas fa-link', 'clicks': 0,
+                'created_at': start + timedelta(seconds=i), 'user_id': i % users + 1, 'position': i,
+            } for i in batch])
+            conn.execute(linktree.Gear.__table__.insert(), [{
+                'title': f'Gear {i}', 'description': 'd', 'price': '$1', 'url': f'https://example.com/g/{i}',
+                'image': '/static/x.jpg', 'clicks': 0, 'created_at': start + timedelta(seconds=i),
+                'user_id': i % users + 1,
+            } for i in batch])
+            conn.execute(linktree.ClickEvent.__table__.insert(), [{
+                'created_at': start + timedelta(seconds=i), 'target_type': 'link',
+                'target_id': rng.randint(1, rows), 'rolled_up': i < rows - 1000,
+            } for i in batch])
+            conn.execute(linktree.ClickRollup.__table__.insert(), [{
+                'granularity': ('minute', 'hour', 'day')[i % 3], 'bucket_start': start + timedelta(minutes=i),
+                'target_type': 'link', 'target_id': i % 500 + 1, 'clicks': 1,
+            } for i in batch])
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.exec_driver_sql('ANALYZE')
+    else:
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql('ANALYZE')
+
+
+def request_path_queries(linktree, rows):
+    """(name, statement, full_read) for each query the routes run"""
+    db, Link, Gear = linktree.db, linktree.Link, linktree.Gear
+    public_api = linktree.public_api
+    User, Preferences, ClickEvent, ClickRollup = (linktree.User, linktree.Preferences,
+                                                   linktree.ClickEvent, linktree.ClickRollup)
+    middle = (datetime(2024, 1, 1) + timedelta(seconds=rows // 2), rows // 2)
+    # Links page by (position, id)
+    link_middle = (rows // 2, rows // 2)
+    fields = linktree.LINKS_API.default_fields
+    return [
+        ('tenant lookup by username', db.select(User.id).where(User.username == 'user7'), False),
+        ('index: links in position order',
+         db.select(Link).where(Link.user_id == 7).order_by(Link.position, Link.id), False),
+        ('gear: gear, newest first',
+         db.select(Gear).where(Gear.user_id == 7).order_by(Gear.created_at.desc()), False),
+        ('/api/links first page', public_api.select_page(linktree.LINKS_API, fields, 100, owner=7), False),
+        ('/api/links next page', public_api.select_page(linktree.LINKS_API, fields, 100, link_middle, owner=7), False),
+        ('/api/gear next page', public_api.select_page(linktree.GEAR_API, linktree.GEAR_API.default_fields,
+                                                       100, middle, owner=7), False),
+        ('track_click redirect lookup', db.select(Link.url).where(Link.id == rows // 2), False),
+        ('track_gear_click redirect lookup', db.select(Gear.url).where(Gear.id == rows // 2), False),
+        ('load_user', db.select(User.id, User.username).where(User.id == 7), False),
+        ('admin_login user lookup', db.select(User).where(User.username == 'user7'), False),
+        ('admin_dashboard links', db.select(Link).where(Link.user_id == 7).order_by(Link.position, Link.id), False),
+        ('batch create: top position', db.select(db.func.min(Link.position)).where(Link.user_id == 7), False),
+        ('add_link uniqueness (user_id, title)',
+         db.select(Link.id).where(Link.user_id == 7, Link.title == 'Link 7006'), False),
+        ('preferences by user', db.select(Preferences).where(Preferences.user_id == 7).limit(1), False),
+        ('click rollup: pending events', db.select(db.func.max(ClickEvent.id)).where(ClickEvent.rolled_up.is_(False)),
+         False),
+        ('click analytics series',
+         db.select(ClickRollup.bucket_start, db.func.sum(ClickRollup.clicks))
+         .where(ClickRollup.granularity == 'hour', ClickRollup.bucket_start >= datetime(2024, 1, 20))
+         .group_by(ClickRollup.bucket_start).order_by(ClickRollup.bucket_start), False),
+    ]
+
+
+def explain(conn, statement):
+    """Plan lines plus (full_scan, sort) problems for one statement"""
+    compiled = statement.compile(conn, compile_kwargs={'literal_binds': True})
+    if conn.dialect.name == 'sqlite':
+        rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}').all()
+        lines = [row[-1] for row in rows]
+        scans = [line for line in lines if line.startswith('SCAN') and 'USING' not in line]
+        sorts = [line for line in lines if 'TEMP B-TREE' in line]
+        return lines, scans, sorts
+
+    plan = conn.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {compiled}').scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    lines, scans, sorts = [], [], []
+
+    def walk(node, depth):
+        line = '  ' * depth + node['Node Type'] + (f" on {node['Relation Name']}" if 'Relation Name' in node else '') \
+            + (f" using {node['Index Name']}" if 'Index Name' in node else '')
+        lines.append(line)
+        if node['Node Type'] == 'Seq Scan':
+            scans.append(line.strip())
+        if node['Node Type'] in ('Sort', 'Incremental Sort'):
+            sorts.append(line.strip())
+        for child in node.get('Plans', ()):
+            walk(child, depth + 1)
+
+    walk(plan[0]['Plan'], 0)
+    return lines, scans, sorts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--database', help='scratch database URL (default: a temporary SQLite file)')
+    parser.add_argument('--reset', action='store_true', help='allow dropping the tables of --database')
+    args = parser.parse_args()
+    if args.database and not args.reset:
+        parser.error('--database needs --reset: its tables are dropped and reseeded')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = args.database or f"sqlite:///{os.path.join(tmp, 'plans.db')}"
+        import app as linktree
+
+        failures = 0
+        with linktree.app.app_context():
+            print(f"Seeding {args.rows} rows into {linktree.db.engine.dialect.name}...")
+            seed(linktree, args.rows)
+            with linktree.db.engine.connect() as conn:
+                for name, statement, full_read in request_path_queries(linktree, args.rows):
+                    lines, scans, sorts = explain(conn, statement)
+                    problems = [] if full_read else scans + sorts
+                    status = 'FULL READ' if full_read else ('FAIL' if problems else 'ok')
+                    failures += bool(problems)
+                    print(f"\n[{status}] {name}")
+                    for line in lines:
+                        print(f"    {line}")
+            linktree.click_buffer.stop()
+
+        print(f"\n{failures} request-path queries scan or sort")
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
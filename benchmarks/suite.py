@@ -0,0 +1,433 @@
+"""Throughput, latency and queries-per-request for the public and admin routes.
+
+Seeds a throwaway SQLite database with a configurable number of links, gear
+items and click events, then drives each route with N concurrent clients,
+both in-process through the Flask test client and over HTTP against a local
+threaded WSGI server. Queries per request come from the Server-Timing header,
+which the suite turns on with SERVER_TIMING=1. Results are written as JSON so runs from two
+commits can be compared:
+
+    python benchmarks/suite.py --links 2000 --gear 200 --clicks 100000 --output before.json
+    python benchmarks/suite.py --links 2000 --gear 200 --clicks 100000 --output after.json
+    python benchmarks/suite.py --compare before.json after.json --threshold 10
+
+--compare exits with status 1 if any route's throughput dropped, or its p99
+rose, by more than --threshold percent.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import re
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_PASSWORD = 'bench-password'
+
+WSGI_SERVER = r'''
+import logging, sys
+sys.path.insert(0, sys.argv[1])
+from werkzeug.serving import ThreadedWSGIServer
+import app as linktree
+logging.getLogger('werkzeug').setLevel(logging.ERROR)
+ThreadedWSGIServer.request_queue_size = 1024
+ThreadedWSGIServer('127.0.0.1', int(sys.argv[2]), linktree.app).serve_forever()
+'''
+
+SERVER_TIMING_DB = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+
+
+# Seeding
+
+def seed(linktree, links, gear, clicks):
+    """init-db's admin and default links, plus the requested volumes; returns the ids to hit"""
+    db = linktree.db
+    linktree.init_db()
+    admin_id = db.session.execute(db.select(linktree.User.id).where(linktree.User.username == 'admin')).scalar()
+    now = datetime.utcnow()
+    rng = random.Random(42)
+    with db.engine.begin() as conn:
+        for offset in range(0, links, 5000):
+            conn.execute(linktree.Link.__table__.insert(), [{
+                'title': f'Bench link {i}', 'url': f'https://example.com/{i}', 'icon': 'fas fa-link',
+                'clicks': 0, 'created_at': now - timedelta(seconds=links - i), 'user_id': admin_id,
+            } for i in range(offset, min(links, offset + 5000))])
+        for offset in range(0, gear, 5000):
+            # Image paths that do not exist, so no image variants are built mid-run
+            conn.execute(linktree.Gear.__table__.insert(), [{
+                'title': f'Bench gear {i}', 'description': 'Benchmark item', 'price': '$10',
+                'url': f'https://example.com/gear/{i}', 'image': f'/static/images/bench-{i}.jpg',
+                'clicks': 0, 'created_at': now - timedelta(seconds=gear - i), 'user_id': admin_id,
+            } for i in range(offset, min(gear, offset + 5000))])
+    link_ids = db.session.execute(
+        db.select(linktree.Link.id).where(linktree.Link.title.like('Bench link %'))).scalars().all()
+    gear_ids = db.session.execute(db.select(linktree.Gear.id)).scalars().all()
+
+    # Two days of click history, rolled up like the background job would
+    targets = [('link', id) for id in link_ids[:500]] + [('gear', id) for id in gear_ids[:100]]
+    with db.engine.begin() as conn:
+        for offset in range(0, clicks if targets else 0, 10000):
+            conn.execute(linktree.ClickEvent.__table__.insert(), [
+                dict(zip(('target_type', 'target_id'), rng.choice(targets)),
+                     created_at=now - timedelta(seconds=rng.randrange(2 * 86400)), ua_class='desktop')
+                for _ in range(offset, min(clicks, offset + 10000))
+            ])
+    if clicks and targets:
+        linktree.click_events.rollup(db, linktree.ClickEvent, linktree.ClickRollup)
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql('ANALYZE')
+    return link_ids, gear_ids
+
+
+def routes(link_ids, gear_ids, api_cursor):
+    """(name, path list, needs_login) for every benchmarked route"""
+    sample = lambda ids, n=200: ids[:: max(1, len(ids) // n)] or [0]
+    return [
+        ('index', ['/'], False),
+        ('gear', ['/gear'], False),
+        ('api_links', ['/api/links'], False),
+        ('api_links_page2', [f'/api/links?{urlencode({"cursor": api_cursor})}'] if api_cursor else ['/api/links'],
+         False),
+        ('track_click', [f'/track/{id}' for id in sample(link_ids)], False),
+        ('gear_click', [f'/gear/{id}/click' for id in sample(gear_ids)], False),
+        ('admin_dashboard', ['/admin'], True),
+        ('admin_gear', ['/admin/gear'], True),
+        ('admin_clicks', ['/admin/api/clicks?granularity=hour'], True),
+    ]
+
+
+# Transports
+
+class TestClientTransport:
+    """Requests through app.test_client(), one client per thread"""
+    name = 'test-client'
+
+    def __init__(self, app):
+        self.app = app
+
+    def session(self, login):
+        client = self.app.test_client()
+        if login:
+            response = client.post('/admin/login', data={'username': 'admin', 'password': ADMIN_PASSWORD})
+            assert response.status_code == 302, 'admin login failed'
+        return client
+
+    def get(self, client, path):
+        response = client.get(path)
+        response.close()
+        return response.status_code, response.headers.get_all('Server-Timing')
+
+    def close(self, client):
+        pass
+
+
+class HttpTransport:
+    """Requests over HTTP to a local server, one connection per thread"""
+    name = 'wsgi-server'
+
+    def __init__(self, port):
+        self.port = port
+
+    def session(self, login):
+        conn = {'http': None, 'cookie': None}
+        if login:
+            body = urlencode({'username': 'admin', 'password': ADMIN_PASSWORD})
+            status, headers, _ = self._request(conn, 'POST', '/admin/login', body,
+                                               {'Content-Type': 'application/x-www-form-urlencoded'})
+            cookie = headers.get('set-cookie')
+            assert status == 302 and cookie, 'admin login failed'
+            conn['cookie'] = cookie.split(';', 1)[0]
+        return conn
+
+    def get(self, conn, path):
+        status, _, timing = self._request(conn, 'GET', path)
+        return status, timing
+
+    def close(self, conn):
+        if conn['http'] is not None:
+            conn['http'].close()
+
+    def _request(self, conn, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if conn['cookie']:
+            headers['Cookie'] = conn['cookie']
+        for attempt in range(2):
+            if conn['http'] is None:
+                conn['http'] = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+            try:
+                conn['http'].request(method, path, body, headers)
+                response = conn['http'].getresponse()
+                response.read()
+            except (http.client.HTTPException, OSError):
+                conn['http'].close()
+                conn['http'] = None
+                if attempt:
+                    raise
+                continue
+            if response.will_close:
+                conn['http'].close()
+                conn['http'] = None
+            names = {name.lower(): value for name, value in response.getheaders()}
+            return response.status, names, [value for name, value in response.getheaders()
+                                            if name.lower() == 'server-timing']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(db_path, log):
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}')
+    process = subprocess.Popen([sys.executable, '-c', WSGI_SERVER, ROOT, str(port)], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=log)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            log.seek(0)
+            raise RuntimeError(f'server exited:\n{log.read().decode()[-2000:]}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process, port
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('server did not start')
+
+
+# Measurement
+
+def run_route(transport, paths, login, concurrency, total, warmup):
+    """Drive one route with ``concurrency`` threads; returns the summary row"""
+    per_thread = max(1, total // concurrency)
+    latencies, queries, db_ms, errors = [], [], [], []
+    failures = []
+    lock = threading.Lock()
+    ready = threading.Barrier(concurrency + 1)
+
+    def worker(n):
+        session = None
+        try:
+            session = transport.session(login)
+            for i in range(warmup):
+                transport.get(session, paths[(n + i) % len(paths)])
+            mine, my_queries, my_db, my_errors = [], [], [], []
+            ready.wait()
+            for i in range(per_thread):
+                path = paths[(n * per_thread + i) % len(paths)]
+                start = time.perf_counter()
+                try:
+                    status, timing = transport.get(session, path)
+                except (http.client.HTTPException, OSError) as e:
+                    my_errors.append(repr(e))
+                    continue
+                mine.append(time.perf_counter() - start)
+                if status >= 400:
+                    my_errors.append(status)
+                for value in timing:
+                    match = SERVER_TIMING_DB.search(value)
+                    if match:
+                        my_db.append(float(match.group(1)))
+                        my_queries.append(int(match.group(2)))
+            with lock:
+                latencies.extend(mine)
+                queries.extend(my_queries)
+                db_ms.extend(my_db)
+                errors.extend(my_errors)
+        except threading.BrokenBarrierError:
+            pass  # another worker failed
+        except Exception as e:
+            failures.append(e)
+            # Release everyone waiting at the barrier instead of leaving them there forever
+            ready.abort()
+        finally:
+            if session is not None:
+                transport.close(session)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    try:
+        ready.wait()
+    except threading.BrokenBarrierError:
+        pass
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if failures:
+        raise RuntimeError(f'{len(failures)} of {concurrency} clients failed: {failures[0]!r}') from failures[0]
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3) if latencies else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        # Page and API cache hits skip the database, so these are averages
+        'queries_per_request': round(statistics.fmean(queries), 2) if queries else None,
+        'db_ms_per_request': round(statistics.fmean(db_ms), 3) if db_ms else None,
+    }
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_row(row):
+    queries = '-' if row['queries_per_request'] is None else f"{row['queries_per_request']:.2f}"
+    print(f"{row['transport']:<12} {row['route']:<16} {row['concurrency']:>4} {row['requests']:>7} "
+          f"{row['rps'] or 0:>9.1f} {row['p50_ms'] or 0:>8.2f} {row['p99_ms'] or 0:>8.2f} {queries:>8} "
+          f"{row['errors']:>6}")
+
+
+def run(args):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        # Every admin client logs in from 127.0.0.1, so the login rate limit is off
+        os.environ.update(DATABASE_URL=f'sqlite:///{db_path}', ADMIN_PASSWORD=ADMIN_PASSWORD,
+                          LOG_LEVEL=os.environ.get('LOG_LEVEL', 'WARNING'), LOGIN_RATE_PER_MINUTE='0',
+                          SERVER_TIMING='1')
+        sys.path.insert(0, ROOT)
+        import app as linktree
+
+        app = linktree.app
+        with app.app_context():
+            print(f"Seeding {args.links} links, {args.gear} gear items, {args.clicks} clicks...")
+            link_ids, gear_ids = seed(linktree, args.links, args.gear, args.clicks)
+            first_page = app.test_client().get('/api/links')
+            next_link = first_page.headers.get('Link', '')
+            cursor = re.search(r'cursor=([^&>]+)', next_link)
+            linktree.db.engine.dispose()
+        server_db = os.path.join(tmp, 'server.db')
+        # The backup API includes pages still in the WAL, which a file copy would miss
+        with sqlite3.connect(db_path) as source, sqlite3.connect(server_db) as target:
+            source.backup(target)
+        route_list = [route for route in routes(link_ids, gear_ids, cursor and cursor.group(1))
+                      if not args.routes or route[0] in args.routes]
+
+        print(f"{'transport':<12} {'route':<16} {'conc':>4} {'reqs':>7} {'req/s':>9} {'p50 ms':>8} "
+              f"{'p99 ms':>8} {'queries':>8} {'errors':>6}")
+        transports = []
+        if 'test-client' in args.transports:
+            transports.append((TestClientTransport(app), None))
+        for transport, _ in transports:
+            results.extend(run_transport(transport, route_list, args))
+        if 'wsgi-server' in args.transports:
+            log = open(os.path.join(tmp, 'server.log'), 'w+b')
+            process, port = start_server(server_db, log)
+            try:
+                results.extend(run_transport(HttpTransport(port), route_list, args))
+            finally:
+                process.terminate()
+                process.wait(timeout=10)
+                log.close()
+        linktree.app_state(app).click_buffer.stop()
+
+    return {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': {'links': args.links, 'gear': args.gear, 'clicks': args.clicks},
+            'requests_per_route': args.requests,
+            'warmup_per_thread': args.warmup,
+        },
+        'results': results,
+    }
+
+
+def run_transport(transport, route_list, args):
+    rows = []
+    for concurrency in args.concurrency:
+        for name, paths, login in route_list:
+            row = {'transport': transport.name, 'route': name, 'concurrency': concurrency}
+            row.update(run_route(transport, paths, login, concurrency, args.requests, args.warmup))
+            print_row(row)
+            rows.append(row)
+    return rows
+
+
+# Comparison
+
+def compare(base_path, head_path, threshold):
+    """Print throughput/p99 changes per route; returns the number of regressions"""
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(head_path) as f:
+        head = json.load(f)
+    key = lambda row: (row['transport'], row['route'], row['concurrency'])
+    before = {key(row): row for row in base['results']}
+    print(f"{base['meta']['revision']} -> {head['meta']['revision']}")
+    if base['meta']['seed'] != head['meta']['seed']:
+        print(f"warning: seeded volumes differ ({base['meta']['seed']} vs {head['meta']['seed']})")
+    print(f"{'transport':<12} {'route':<16} {'conc':>4} {'req/s':>16} {'p99 ms':>18} {'queries':>12}")
+    regressions = 0
+    for row in head['results']:
+        old = before.get(key(row))
+        if old is None or not old['rps'] or not row['rps']:
+            continue
+        rps_change = (row['rps'] - old['rps']) / old['rps'] * 100
+        p99_change = (row['p99_ms'] - old['p99_ms']) / old['p99_ms'] * 100 if old['p99_ms'] else 0.0
+        regressed = rps_change < -threshold or p99_change > threshold
+        regressions += regressed
+        queries = f"{old['queries_per_request']}->{row['queries_per_request']}"
+        print(f"{row['transport']:<12} {row['route']:<16} {row['concurrency']:>4} {rps_change:>+15.1f}% "
+              f"{p99_change:>+17.1f}% {queries:>12}{'  REGRESSION' if regressed else ''}")
+    print(f"\n{regressions} regression(s) beyond {threshold}%")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--links', type=int, default=1000)
+    parser.add_argument('--gear', type=int, default=100)
+    parser.add_argument('--clicks', type=int, default=50000, help='click events over the last two days')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per route and concurrency level')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--warmup', type=int, default=5, help='unmeasured requests per client thread')
+    parser.add_argument('--transports', nargs='+', choices=['test-client', 'wsgi-server'],
+                        default=['test-client', 'wsgi-server'])
+    parser.add_argument('--routes', nargs='+', help='only these routes (default: all)')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'HEAD'), help='compare two result files')
+    parser.add_argument('--threshold', type=float, default=10.0, help='regression threshold for --compare, in %%')
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+
+    report = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {len(report['results'])} results to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
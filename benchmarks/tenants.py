@@ -0,0 +1,165 @@
+"""Public page latency as the number of creators on one deployment grows.
+
+For each tenant count, a fresh interpreter seeds a throwaway SQLite database
+with that many creators (each with --links links and --gear gear items), then
+requests a sample of creators' /<username> pages and /<username>/api/links
+twice: cold (rendered, then cached) and warm (from the page cache). Finally
+one sampled creator edits a link through /admin/batch and every sampled page
+is requested again; only that creator's page should miss the cache:
+
+    python benchmarks/tenants.py --tenants 10 100 1000
+
+Exits with status 1 if the warm page p50 at the largest count is more than
+--threshold percent above the one at the smallest.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = 'bench-password'
+
+
+def seed(linktree, tenants, links, gear):
+    """init-db's admin plus ``tenants - 1`` creators; returns every creator's (id, username)"""
+    from werkzeug.security import generate_password_hash
+
+    db = linktree.db
+    linktree.init_db()
+    # One hash for everyone: seeding 1,000 scrypt hashes would dominate the run
+    password_hash = generate_password_hash(PASSWORD, linktree.password_verifier.method)
+    with db.engine.begin() as conn:
+        conn.execute(linktree.User.__table__.insert(), [
+            {'username': f'creator{i:04d}', 'password_hash': password_hash} for i in range(1, tenants)])
+    users = db.session.execute(db.select(linktree.User.id, linktree.User.username)
+                               .where(linktree.User.username.like('creator%'))).all()
+    with db.engine.begin() as conn:
+        conn.execute(linktree.Preferences.__table__.insert(), [
+            {'user_id': id, 'site_title': username} for id, username in users])
+        for offset in range(0, len(users), 500):
+            chunk = users[offset:offset + 500]
+            if links:
+                conn.execute(linktree.Link.__table__.insert(), [{
+                    'title': f'Link {n}', 'url': f'https://example.com/{username}/{n}', 'icon': 'fas fa-link',
+                    'clicks': 0, 'user_id': id, 'position': n,
+                } for id, username in chunk for n in range(links)])
+            if gear:
+                conn.execute(linktree.Gear.__table__.insert(), [{
+                    'title': f'Gear {n}', 'description': 'Benchmark item', 'price': '$10',
+                    'url': f'https://example.com/{username}/gear/{n}', 'image': f'/static/images/bench-{n}.jpg',
+                    'clicks': 0, 'user_id': id,
+                } for id, username in chunk for n in range(gear)])
+    return users
+
+
+def timed(client, paths):
+    latencies = []
+    for path in paths:
+        start = time.perf_counter()
+        response = client.get(path)
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, (path, response.status_code)
+        response.close()
+    latencies.sort()
+    return {
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+        'p99_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 3),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+    }
+
+
+def worker(args):
+    """One tenant count, in this interpreter; prints a JSON result line"""
+    sys.path.insert(0, ROOT)
+    import app as linktree
+
+    app = linktree.app
+    with app.app_context():
+        users = seed(linktree, args.worker, args.links, args.gear)
+        sample = random.Random(42).sample(users, min(args.sample, len(users)))
+        client = app.test_client()
+        client.get('/').close()  # loads the username directory once
+        pages = [f'/{username}' for _, username in sample]
+        apis = [f'/{username}/api/links' for _, username in sample]
+        result = {
+            'tenants': args.worker,
+            'sampled': len(sample),
+            'page_cold': timed(client, pages),
+            'page_warm': timed(client, pages),
+            'api_cold': timed(client, apis),
+            'api_warm': timed(client, apis),
+        }
+
+        editor_id, editor = sample[0]
+        admin = app.test_client()
+        response = admin.post('/admin/login', data={'username': editor, 'password': PASSWORD})
+        assert response.status_code == 302, 'login failed'
+        link_id = linktree.db.session.execute(
+            linktree.db.select(linktree.Link.id).where(linktree.Link.user_id == editor_id)).scalars().first()
+        misses = linktree.page_cache.misses
+        response = admin.post('/admin/batch', json={'operations': [
+            {'op': 'update', 'id': link_id, 'title': 'Edited'}]})
+        assert response.status_code == 200, response.get_data(as_text=True)
+        result['page_after_edit'] = timed(client, pages)
+        result['misses_after_edit'] = linktree.page_cache.misses - misses
+        result['page_cache_entries'] = linktree.page_cache.stats()['entries']
+    state = linktree.app_state(app)
+    state.click_buffer.stop()
+    state.password_verifier.stop()
+    print(json.dumps(result))
+
+
+def measure(count, args, tmp):
+    db_path = os.path.join(tmp, f'tenants-{count}.db')
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', LOG_LEVEL='WARNING')
+    command = [sys.executable, os.path.abspath(__file__), '--worker', str(count), '--links', str(args.links),
+               '--gear', str(args.gear), '--sample', str(args.sample)]
+    result = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+    lines = [line for line in result.stdout.splitlines() if line.startswith('{')]
+    if result.returncode != 0 or not lines:
+        raise RuntimeError(f'{count} tenants failed:\n{result.stderr[-2000:]}')
+    return json.loads(lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tenants', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--links', type=int, default=20, help='links per creator')
+    parser.add_argument('--gear', type=int, default=5, help='gear items per creator')
+    parser.add_argument('--sample', type=int, default=200, help='creators whose pages are requested')
+    parser.add_argument('--threshold', type=float, default=25.0, help='allowed warm p50 growth, in %%')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        return worker(args)
+
+    print(f"{'tenants':>8} {'cold p50':>9} {'warm p50':>9} {'warm p99':>9} {'api cold':>9} {'api warm':>9} "
+          f"{'edit misses':>12}")
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in sorted(args.tenants):
+            row = measure(count, args, tmp)
+            results.append(row)
+            print(f"{row['tenants']:>8} {row['page_cold']['p50_ms']:>9.3f} {row['page_warm']['p50_ms']:>9.3f} "
+                  f"{row['page_warm']['p99_ms']:>9.3f} {row['api_cold']['p50_ms']:>9.3f} "
+                  f"{row['api_warm']['p50_ms']:>9.3f} {row['misses_after_edit']:>5} of {row['sampled']:<5}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'links': args.links, 'gear': args.gear, 'results': results}, f, indent=2)
+
+    smallest, largest = results[0]['page_warm']['p50_ms'], results[-1]['page_warm']['p50_ms']
+    growth = (largest - smallest) / smallest * 100 if smallest else 0.0
+    print(f"Warm page p50 changed {growth:+.1f}% from {results[0]['tenants']} to {results[-1]['tenants']} tenants")
+    if growth > args.threshold:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""Streaming bulk import/export of links, gear and preferences.
+
+Exports stream rows out of a server-side cursor as JSON Lines or CSV without
+loading the table. Imports read the same formats incrementally and write
+them in chunks of multi-row ``INSERT ... ON CONFLICT (id) DO UPDATE``
+statements, so an export re-imported elsewhere updates rows that already
+exist and inserts the rest. Rows without an ``id`` are matched on the
+model's natural key when it has one (a link's user and title), otherwise
+inserted. An import on behalf of one creator (``owner``) only ever updates
+that creator's rows: an id that belongs to someone else is skipped.
+Each chunk commits on its own; since the upserts are idempotent, a failed
+import can simply be re-run.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+from sqlalchemy import Boolean, DateTime, Integer, func, select, text
+
+FORMATS = ('jsonl', 'csv')
+DEFAULT_CHUNK_SIZE = 500
+
+
+class BulkError(ValueError):
+    """A row that cannot be imported; the message names the line."""
+
+
+def guess_format(filename, default='jsonl'):
+    if filename:
+        for fmt in FORMATS:
+            if filename.lower().endswith('.' + fmt):
+                return fmt
+        if filename.lower().endswith('.json') or filename.lower().endswith('.ndjson'):
+            return 'jsonl'
+    return default
+
+
+# Export
+
+def export_rows(db, model, fmt='jsonl', batch_size=1000, progress=None, owner=None):
+    """Yield the table as JSON Lines or CSV text, one chunk of rows at a time.
+
+    ``progress(count)`` is called after each chunk with the running row total.
+    With ``owner``, only that user's rows are exported.
+    """
+    if fmt not in FORMATS:
+        raise BulkError(f"Unknown format {fmt!r}, expected one of {', '.join(FORMATS)}")
+    table = model.__table__
+    names = [column.name for column in table.columns]
+    statement = select(table).order_by(table.c.id)
+    if owner is not None:
+        statement = statement.where(table.c.user_id == owner)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(names)
+
+    total = 0
+    with db.engine.connect() as conn:
+        result = conn.execution_options(yield_per=batch_size).execute(statement)
+        for partition in result.partitions():
+            total += len(partition)
+            for row in partition:
+                values = [_dump_value(value) for value in row]
+                if writer:
+                    writer.writerow(['' if value is None else value for value in values])
+                else:
+                    buffer.write(json.dumps(dict(zip(names, values)), separators=(',', ':')))
+                    buffer.write('\n')
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            if progress:
+                progress(total)
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def count_rows(db, model, owner=None):
+    statement = select(func.count()).select_from(model.__table__)
+    if owner is not None:
+        statement = statement.where(model.__table__.c.user_id == owner)
+    return db.session.execute(statement).scalar()
+
+
+# Import
+
+def read_rows(stream, fmt='jsonl'):
+    """Parse a text stream of JSON Lines or CSV into ``(line_number, dict)`` pairs"""
+    if fmt == 'jsonl':
+        for number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                raise BulkError(f'line {number}: invalid JSON ({e})')
+            if not isinstance(row, dict):
+                raise BulkError(f'line {number}: expected a JSON object')
+            yield number, row
+    elif fmt == 'csv':
+        # Line 1 is the header row
+        for number, row in enumerate(csv.DictReader(stream), 2):
+            yield number, row
+    else:
+        raise BulkError(f"Unknown format {fmt!r}, expected one of {', '.join(FORMATS)}")
+
+
+def import_rows(db, model, rows, defaults=None, overrides=None, chunk_size=DEFAULT_CHUNK_SIZE, progress=None,
+                natural_key=None, owner=None):
+    """Upsert ``(line_number, dict)`` rows into ``model``'s table in chunks.
+
+    ``progress(count)`` is called after each committed chunk with the running
+    total. Returns the number of rows written.
+    """
+    total = 0
+    for total in iter_import(db, model, rows, defaults, overrides, chunk_size, natural_key, owner):
+        if progress:
+            progress(total)
+    return total
+
+
+def iter_import(db, model, rows, defaults=None, overrides=None, chunk_size=DEFAULT_CHUNK_SIZE, natural_key=None,
+                owner=None):
+    """Like :func:`import_rows`, yielding the running total after each chunk.
+
+    ``defaults`` fills columns a row leaves empty (e.g. ``user_id``) and
+    ``overrides`` replaces them on every row (e.g. a different owner when
+    moving data between environments). Rows without an id are upserted on
+    ``natural_key``, the columns of a unique index, when one is given. With
+    ``owner``, conflicting rows are only updated if that user owns them.
+    """
+    table = model.__table__
+    insert = _dialect_insert(db.engine.dialect.name)
+    total = 0
+    chunk = []
+    for number, raw in rows:
+        chunk.append(_coerce_row(table, number, raw, defaults or {}, overrides or {}))
+        if len(chunk) >= chunk_size:
+            total += _write_chunk(db, table, insert, chunk, natural_key, owner)
+            chunk = []
+            yield total
+    if chunk:
+        total += _write_chunk(db, table, insert, chunk, natural_key, owner)
+        yield total
+    _sync_id_sequence(db, table)
+
+
+def progress_line(**fields):
+    """One JSON Lines progress record for a streamed import response"""
+    return json.dumps(fields) + '\n'
+
+
+def _write_chunk(db, table, insert, chunk, natural_key=None, owner=None):
+    # executemany needs the same keys in every row of a statement
+    groups = {}
+    # Another creator's row with the same id is left alone, not taken over
+    scope = table.c.user_id == owner if owner is not None and 'user_id' in table.c else None
+    for row in chunk:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    with db.engine.begin() as conn:
+        for keys, group in groups.items():
+            statement = insert(table)
+            conflict = ('id',) if 'id' in keys else natural_key
+            if conflict and set(conflict) <= set(keys):
+                updates = {key: statement.excluded[key] for key in keys if key not in conflict}
+                index_elements = [table.c[key] for key in conflict]
+                statement = (statement.on_conflict_do_update(index_elements=index_elements, set_=updates,
+                                                             where=scope)
+                             if updates else statement.on_conflict_do_nothing(index_elements=index_elements))
+            conn.execute(statement, group)
+    return len(chunk)
+
+
+def _coerce_row(table, number, raw, defaults, overrides):
+    row = {}
+    for key, value in raw.items():
+        if key not in table.c:
+            raise BulkError(f"line {number}: unknown column {key!r}")
+        column = table.c[key]
+        if value in ('', None) and column.default is not None and not column.primary_key:
+            continue  # let the column default apply
+        if value == '':
+            value = None
+        try:
+            row[key] = _load_value(column.type, value)
+        except (TypeError, ValueError):
+            raise BulkError(f'line {number}: bad value for {key}: {value!r}')
+    for key, value in defaults.items():
+        if row.get(key) is None:
+            row[key] = value
+    row.update(overrides)
+    missing = [
+        column.name for column in table.columns
+        if not column.nullable and not column.primary_key and column.default is None
+        and row.get(column.name) is None
+    ]
+    if missing:
+        raise BulkError(f"line {number}: missing {', '.join(missing)}")
+    return row
+
+
+def _load_value(column_type, value):
+    if value is None:
+        return None
+    if isinstance(column_type, Boolean):
+        return value if isinstance(value, bool) else str(value).lower() in ('1', 'true', 'yes')
+    if isinstance(column_type, Integer):
+        return int(value)
+    if isinstance(column_type, DateTime):
+        return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+    return value
+
+
+def _dump_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _dialect_insert(name):
+    if name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        raise BulkError(f'Bulk import needs SQLite or PostgreSQL, not {name}')
+    return insert
+
+
+def _sync_id_sequence(db, table):
+    """Explicit ids do not advance Postgres sequences; move them past the new max"""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    with db.engine.begin() as conn:
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM \"{table.name}\"), 1))"
+        ))
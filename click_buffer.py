@@ -0,0 +1,120 @@
+"""In-process click aggregation for the tracking routes.
+
+Redirects record a click by bumping a counter in memory and return straight
+away. A background thread periodically hands the accumulated increments (and
+any queued click events) to a flush callback, which applies them as atomic
+``clicks = clicks + :n`` updates and a batched event insert. Filtered clicks
+(bots, prefetches, duplicates; see click_filter.py) are counted separately.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import Counter
+
+log = logging.getLogger(__name__)
+
+
+class ClickBuffer:
+    """Thread-safe click counter that batches increments for a flush callback.
+
+    ``flush_fn`` receives a ``Counter`` keyed by ``(kind, id)``, the list of
+    queued event dicts and a ``Counter`` of filtered clicks keyed the same
+    way, and must apply all three to the database. Flushes happen
+    every ``interval`` seconds, or sooner once ``max_pending`` distinct targets
+    or events are waiting.
+    """
+
+    def __init__(self, flush_fn, interval=2.0, max_pending=500):
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = Counter()
+        self._events = []
+        self._filtered = Counter()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._pid = None
+        self.flushed_total = 0
+        self.failed_flushes = 0
+
+    def add(self, kind, id, n=1, event=None, filtered=False):
+        """Queue ``n`` clicks (or filtered clicks) for the given target, plus an optional event row."""
+        with self._lock:
+            (self._filtered if filtered else self._pending)[(kind, id)] += n
+            if event is not None:
+                self._events.append(event)
+            pending = max(len(self._pending), len(self._events), len(self._filtered))
+        self._ensure_thread()
+        if pending >= self.max_pending:
+            self._wakeup.set()
+
+    def pending(self, filtered=False):
+        """Return a snapshot of the increments (or filtered clicks) not yet flushed."""
+        with self._lock:
+            return Counter(self._filtered if filtered else self._pending)
+
+    def flush(self):
+        """Apply everything queued so far. Returns the number of clicks written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, Counter()
+                events, self._events = self._events, []
+                filtered, self._filtered = self._filtered, Counter()
+            if not batch and not events and not filtered:
+                return 0
+            try:
+                self.flush_fn(batch, events, filtered)
+            except Exception:
+                # Put everything back so it is retried on the next run
+                self.failed_flushes += 1
+                with self._lock:
+                    self._pending.update(batch)
+                    self._events[:0] = events
+                    self._filtered.update(filtered)
+                raise
+            written = sum(batch.values())
+            self.flushed_total += written
+            return written
+
+    def stop(self):
+        """Stop the background thread and flush whatever is left."""
+        self._stopped = True
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=max(self.interval, 1.0) * 2)
+        try:
+            self.flush()
+        except Exception:
+            log.exception("Error flushing clicks on shutdown")
+
+    def _ensure_thread(self):
+        # Started lazily, and restarted after a fork (e.g. gunicorn workers)
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name='click-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                log.exception("Error flushing clicks")
+
+
+def register_shutdown(buffer):
+    """Make sure pending clicks are written when the process exits."""
+    atexit.register(buffer.stop)
+    return buffer
@@ -0,0 +1,165 @@
+"""Click event stream and time-bucketed rollups.
+
+Tracking routes describe each click with :func:`make_event`; the events ride
+along with the buffered counters and are inserted in batches. :func:`rollup`
+folds new raw events into per-minute/hour/day bucket rows, and :func:`prune`
+applies the retention policy so neither table grows without bound.
+"""
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+
+GRANULARITIES = ('minute', 'hour', 'day')
+# Bucket rows per upsert statement, well inside SQLite's bound parameter limit
+_UPSERT_ROWS = 500
+
+_BOT_RE = re.compile(r'bot|crawl|spider|slurp|preview|facebookexternalhit|embedly|curl|wget|python-requests', re.I)
+_TABLET_RE = re.compile(r'ipad|tablet|kindle|silk', re.I)
+_MOBILE_RE = re.compile(r'mobi|iphone|android', re.I)
+
+
+def classify_user_agent(user_agent):
+    """Reduce a User-Agent header to a coarse device class"""
+    if not user_agent:
+        return 'other'
+    if _BOT_RE.search(user_agent):
+        return 'bot'
+    if _TABLET_RE.search(user_agent):
+        return 'tablet'
+    if _MOBILE_RE.search(user_agent):
+        return 'mobile'
+    return 'desktop'
+
+
+def make_event(kind, id, referrer=None, user_agent=None, now=None):
+    """Build the row inserted into the click event table"""
+    return {
+        'created_at': now or datetime.utcnow(),
+        'target_type': kind,
+        'target_id': id,
+        'referrer': referrer[:500] if referrer else None,
+        'ua_class': classify_user_agent(user_agent),
+    }
+
+
+def bucket_start(timestamp, granularity):
+    if granularity == 'minute':
+        return timestamp.replace(second=0, microsecond=0)
+    if granularity == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def rollup(db, ClickEvent, ClickRollup, batch_size=5000):
+    """Fold raw events that have not been rolled up yet into bucket rows.
+
+    Each batch of events is claimed by the same ``UPDATE ... RETURNING`` that
+    marks it rolled up, and its counts are added to the buckets with an upsert
+    in the same transaction, so concurrent rollups (the click flusher of each
+    worker and the ``rollup-clicks`` command) never count an event twice or
+    race to insert a bucket. Returns the number of events processed.
+    """
+    max_id = db.session.query(db.func.max(ClickEvent.id)).filter(ClickEvent.rolled_up.is_(False)).scalar()
+    if max_id is None:
+        return 0
+
+    events = ClickEvent.__table__
+    table = ClickRollup.__table__
+    insert = _dialect_insert(db.engine.dialect.name)
+    processed = 0
+    while True:
+        batch = (
+            db.select(events.c.id)
+            .where(events.c.rolled_up.is_(False), events.c.id <= max_id)
+            .order_by(events.c.id)
+            .limit(batch_size)
+        )
+        claimed = db.session.execute(
+            events.update()
+            .where(events.c.id.in_(batch), events.c.rolled_up.is_(False))
+            .values(rolled_up=True)
+            .returning(events.c.created_at, events.c.target_type, events.c.target_id)
+        ).all()
+        if not claimed:
+            db.session.commit()
+            return processed
+
+        buckets = Counter()
+        for created_at, target_type, target_id in claimed:
+            for granularity in GRANULARITIES:
+                buckets[(granularity, bucket_start(created_at, granularity), target_type, target_id)] += 1
+        # Sorted so concurrent rollups lock bucket rows in the same order
+        rows = [
+            {'granularity': granularity, 'bucket_start': start, 'target_type': target_type,
+             'target_id': target_id, 'clicks': n}
+            for (granularity, start, target_type, target_id), n in sorted(buckets.items())
+        ]
+        for i in range(0, len(rows), _UPSERT_ROWS):
+            statement = insert(table).values(rows[i:i + _UPSERT_ROWS])
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=['granularity', 'target_type', 'target_id', 'bucket_start'],
+                set_={'clicks': table.c.clicks + statement.excluded.clicks},
+            ))
+        db.session.commit()
+        processed += len(claimed)
+
+
+def _dialect_insert(name):
+    if name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        raise RuntimeError(f'Click rollups need SQLite or PostgreSQL, not {name}')
+    return insert
+
+
+def prune(db, ClickEvent, ClickRollup, retention, now=None):
+    """Delete rolled-up raw events and fine-grained buckets past their retention.
+
+    ``retention`` maps ``'events'`` and each granularity to a ``timedelta``;
+    a missing or ``None`` entry keeps that data forever.
+    """
+    now = now or datetime.utcnow()
+    deleted = {}
+    if retention.get('events'):
+        deleted['events'] = db.session.query(ClickEvent).filter(
+            ClickEvent.rolled_up.is_(True),
+            ClickEvent.created_at < now - retention['events'],
+        ).delete(synchronize_session=False)
+    for granularity in GRANULARITIES:
+        if retention.get(granularity):
+            deleted[granularity] = db.session.query(ClickRollup).filter(
+                ClickRollup.granularity == granularity,
+                ClickRollup.bucket_start < now - retention[granularity],
+            ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def series(db, ClickRollup, granularity, since, until=None, target_type=None, target_id=None, owned=None):
+    """Click counts per bucket, read from the rollup table only.
+
+    ``owned`` (``{kind: select of target ids}``) limits it to one creator's targets.
+    """
+    query = db.session.query(ClickRollup.bucket_start, db.func.sum(ClickRollup.clicks)).filter(
+        ClickRollup.granularity == granularity,
+        ClickRollup.bucket_start >= bucket_start(since, granularity),
+    )
+    if until is not None:
+        query = query.filter(ClickRollup.bucket_start <= until)
+    if target_type:
+        query = query.filter(ClickRollup.target_type == target_type)
+    if target_id is not None:
+        query = query.filter(ClickRollup.target_id == target_id)
+    if owned is not None:
+        query = query.filter(db.or_(*(db.and_(ClickRollup.target_type == kind, ClickRollup.target_id.in_(ids))
+                                      for kind, ids in owned.items())))
+    rows = query.group_by(ClickRollup.bucket_start).order_by(ClickRollup.bucket_start).all()
+    return [{'bucket': start.isoformat(), 'clicks': int(clicks)} for start, clicks in rows]
+
+
+def retention_from_days(events=7, minute=2, hour=90, day=None):
+    """Build a retention policy from day counts (``None`` or 0 keeps forever)"""
+    policy = {'events': events, 'minute': minute, 'hour': hour, 'day': day}
+    return {k: timedelta(days=v) if v else None for k, v in policy.items()}
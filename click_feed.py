@@ -0,0 +1,188 @@
+"""Live click deltas for open admin dashboards (server-sent events).
+
+The tracking routes :meth:`ClickFeed.publish` every click, kept or filtered,
+under the clicked target's owner. Publishing only bumps a counter, and does
+nothing while that owner has no dashboard open. A single ticker thread
+coalesces what was published into each subscriber's pending deltas at most
+``1 / interval`` times a second.
+
+A subscriber that reads slowly just gets larger, less frequent deltas. Its
+pending map is bounded by the owner's number of links and gear, not by the
+click rate. One that has not read for ``stale_after`` seconds (a connection
+stuck behind a dead proxy) is dropped. Nothing here touches the database;
+each stream makes one query for its initial counts. The feed is per process,
+so with several workers a dashboard only sees the clicks its own worker
+served. Streams served by :meth:`ClickFeed.stream` each hold a WSGI worker
+thread, so at most ``max_threaded`` of them are open at once.
+"""
+import json
+import logging
+import threading
+import time
+from collections import Counter
+
+log = logging.getLogger(__name__)
+
+
+class FeedFull(RuntimeError):
+    """Too many dashboards are subscribed; the client should retry later."""
+
+
+class Subscriber:
+    """One open stream's pending deltas, keyed ``(kind, id, field)``"""
+
+    def __init__(self, owner, threaded=False):
+        self.owner = owner
+        # Served by ClickFeed.stream() on a worker thread, rather than on an event loop
+        self.threaded = threaded
+        self.pending = Counter()
+        self.ready = threading.Event()
+        self.last_read = time.monotonic()
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def merge(self, deltas):
+        with self._lock:
+            self.pending.update(deltas)
+        self.ready.set()
+
+    def take(self, timeout):
+        """Wait up to ``timeout`` seconds for deltas; returns them (possibly empty)"""
+        self.ready.wait(timeout)
+        self.ready.clear()
+        self.last_read = time.monotonic()
+        with self._lock:
+            deltas, self.pending = self.pending, Counter()
+        return deltas
+
+
+class ClickFeed:
+    """In-process pub/sub of click counts, coalesced per tick"""
+
+    def __init__(self, interval=0.25, max_subscribers=100, stale_after=60.0, max_threaded=4):
+        self.interval = interval
+        self.max_subscribers = max_subscribers
+        self.max_threaded = max_threaded
+        self.stale_after = stale_after
+        self._subscribers = {}
+        self._threaded = 0
+        self._published = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.dropped = 0
+
+    def publish(self, kind, id, owner, field='clicks', n=1):
+        """Record ``n`` new clicks (``field`` 'clicks' or 'filtered_clicks') on one of ``owner``'s targets"""
+        if owner not in self._subscribers:
+            return
+        with self._lock:
+            self._published.setdefault(owner, Counter())[(kind, id, field)] += n
+        self._wakeup.set()
+
+    def subscribe(self, owner, threaded=False):
+        """A new subscriber for ``owner``'s clicks; ``threaded`` if it will be read by :meth:`stream`"""
+        with self._lock:
+            if sum(map(len, self._subscribers.values())) >= self.max_subscribers:
+                raise FeedFull('Too many live dashboards open')
+            if threaded and self._threaded >= self.max_threaded:
+                raise FeedFull('Too many live dashboards open on this worker\'s threads')
+            subscriber = Subscriber(owner, threaded)
+            self._subscribers.setdefault(owner, set()).add(subscriber)
+            self._threaded += threaded
+        self._ensure_thread()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        subscriber.closed = True
+        subscriber.ready.set()
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.owner)
+            if subscribers is not None and subscriber in subscribers:
+                subscribers.discard(subscriber)
+                self._threaded -= subscriber.threaded
+                if not subscribers:
+                    del self._subscribers[subscriber.owner]
+                    self._published.pop(subscriber.owner, None)
+
+    def subscriber_count(self):
+        return sum(map(len, self._subscribers.values()))
+
+    def threaded_count(self):
+        return self._threaded
+
+    def stream(self, subscriber, initial=None, heartbeat=15.0):
+        """Server-sent events for ``subscriber``: a ``sync`` event, then ``clicks`` deltas"""
+        try:
+            yield 'retry: 3000\n\n'
+            if initial is not None:
+                yield format_event('sync', initial)
+            while not subscriber.closed:
+                deltas = subscriber.take(heartbeat)
+                if subscriber.closed:
+                    break
+                if deltas:
+                    yield format_event('clicks', nest(deltas))
+                else:
+                    # Comment lines keep proxies from timing the stream out and reveal gone clients
+                    yield ': keep-alive\n\n'
+        finally:
+            self.unsubscribe(subscriber)
+
+    def tick(self):
+        """Hand everything published since the last tick to the subscribers"""
+        with self._lock:
+            published, self._published = self._published, {}
+            subscribers = {owner: list(subs) for owner, subs in self._subscribers.items()}
+        now = time.monotonic()
+        for owner, subs in subscribers.items():
+            deltas = published.get(owner)
+            for subscriber in subs:
+                if now - subscriber.last_read > self.stale_after:
+                    log.info("Dropping a live dashboard of user %s that stopped reading", owner)
+                    self.dropped += 1
+                    self.unsubscribe(subscriber)
+                    continue
+                if deltas:
+                    subscriber.merge(deltas)
+
+    def stop(self):
+        with self._lock:
+            subscribers = [s for subs in self._subscribers.values() for s in subs]
+        for subscriber in subscribers:
+            self.unsubscribe(subscriber)
+        self._wakeup.set()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='click-feed', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        # Runs while any dashboard is open
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            self._wakeup.wait(self.stale_after / 2)
+            self._wakeup.clear()
+            try:
+                self.tick()
+            except Exception:
+                log.exception("Error publishing click deltas")
+            # Coalesce: at most one tick per interval
+            time.sleep(self.interval)
+
+
+def nest(deltas):
+    """``{(kind, id, field): n}`` -> ``{kind: {id: {field: n}}}`` for JSON"""
+    nested = {}
+    for (kind, id, field), n in deltas.items():
+        nested.setdefault(kind, {}).setdefault(str(id), {})[field] = n
+    return nested
+
+
+def format_event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
@@ -0,0 +1,143 @@
+"""Engine/pool tuning profiles for Postgres and SQLite.
+
+``DB_PROFILE`` picks a preset for how the app is deployed:
+
+- ``serverless``: one warm connection per instance, recycled quickly, since
+  Vercel-style instances are many, short-lived and share a connection limit.
+- ``single-node``: one process serving everything; a normal-sized pool.
+- ``multi-worker``: several processes on one host (gunicorn); a small pool
+  per worker so workers x pool stays under the server's connection limit.
+
+SQLite databases additionally get WAL journaling, a busy timeout and mmap
+I/O so concurrent click writes wait instead of failing with "database is
+locked".
+"""
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+PROFILES = {
+    'serverless': {'pool_size': 1, 'max_overflow': 2, 'pool_recycle': 300, 'pool_timeout': 10},
+    'single-node': {'pool_size': 10, 'max_overflow': 10, 'pool_recycle': 1800, 'pool_timeout': 30},
+    'multi-worker': {'pool_size': 3, 'max_overflow': 2, 'pool_recycle': 1800, 'pool_timeout': 30},
+}
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # ms
+    'mmap_size': 64 * 1024 * 1024,
+}
+
+
+class PoolMetrics:
+    """Checkout counts, wait time and utilisation for the connection pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pool_size = 0
+        self.max_overflow = 0
+        self.checkouts = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+
+    def record_wait(self, seconds, timed_out=False):
+        with self._lock:
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def on_checkout(self, *args):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def on_checkin(self, *args):
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def snapshot(self):
+        with self._lock:
+            capacity = self.pool_size + self.max_overflow
+            return {
+                'pool_size': self.pool_size,
+                'max_overflow': self.max_overflow,
+                'checkouts': self.checkouts,
+                'checked_out': self.checked_out,
+                'peak_checked_out': self.peak_checked_out,
+                'utilisation': round(self.checked_out / capacity, 4) if capacity else 0.0,
+                'wait_seconds_total': round(self.wait_seconds_total, 6),
+                'wait_seconds_max': round(self.wait_seconds_max, 6),
+                'wait_seconds_avg': round(self.wait_seconds_total / self.checkouts, 6) if self.checkouts else 0.0,
+                'timeouts': self.timeouts,
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection in ``metrics``"""
+    metrics = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+
+def timed_pool_class(metrics, asyncio=False):
+    """A TimedQueuePool recording into ``metrics``; a class, so pool.recreate() keeps it"""
+    bases = (TimedQueuePool, AsyncAdaptedQueuePool) if asyncio else (TimedQueuePool,)
+    return type('TimedQueuePool', bases, {'metrics': metrics})
+
+
+def engine_options(database_uri, metrics, profile='single-node', overrides=None, asyncio=False):
+    """SQLALCHEMY_ENGINE_OPTIONS for the given database and deployment profile, with waits recorded in ``metrics``
+
+    ``asyncio=True`` gives the same settings for ``create_async_engine()``.
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE {profile!r}, expected one of {', '.join(PROFILES)}")
+    options = dict(PROFILES[profile])
+    options.update(overrides or {})
+    options['pool_pre_ping'] = True
+    # Compiled SQL cache; request-path queries are a small fixed set
+    options['query_cache_size'] = 1200
+
+    if database_uri.startswith('sqlite'):
+        if ':memory:' in database_uri or database_uri in ('sqlite://', 'sqlite:///'):
+            # In-memory databases need SQLAlchemy's default single-connection pool
+            return {'query_cache_size': options['query_cache_size']}
+        options['pool_pre_ping'] = False
+        options['connect_args'] = {'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000, 'check_same_thread': False}
+    options['poolclass'] = timed_pool_class(metrics, asyncio)
+    metrics.pool_size = options['pool_size']
+    metrics.max_overflow = options['max_overflow']
+    return options
+
+
+def instrument_engine(engine, metrics):
+    """Attach ``metrics`` to the engine's pool and, for SQLite, the connection pragmas"""
+    event.listen(engine, 'checkout', metrics.on_checkout)
+    event.listen(engine, 'checkin', metrics.on_checkin)
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', _apply_sqlite_pragmas)
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
@@ -0,0 +1,211 @@
+"""Negotiated compression and per-route Cache-Control for every response.
+
+``CachePolicies`` maps endpoints to a ``Cache-Control`` value; responses of
+unlisted endpoints that set none themselves get the default. ``Compressor``
+encodes compressible responses with Brotli (when the ``brotli`` package is
+installed) or gzip, whichever the client prefers. Bodies with an ETag (the
+page and API caches) are compressed once and served from a small memo; their
+ETag becomes weak, so conditional requests still match.
+
+Static files are never compressed per request: ``precompress_tree`` writes
+``.br``/``.gz`` siblings once (``flask compress-static``, and every
+``build-assets``), and ``serve_precompressed`` swaps them in. Range requests
+always get the identity file, so partial image downloads keep working.
+"""
+import gzip
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+
+from flask import send_file
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml',
+                      'image/svg+xml', 'application/manifest+json')
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def compressible(mimetype):
+    return bool(mimetype) and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def available_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encoding, offered):
+    """The client's preferred encoding among ``offered`` (in server preference order), or None"""
+    if not accept_encoding:
+        return None
+    quality = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        quality[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in offered:
+        q = quality.get(encoding, quality.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def encode(data, encoding, best=False):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if best else 5)
+    return gzip.compress(data, compresslevel=9 if best else 6, mtime=0)
+
+
+class CachePolicies:
+    """Cache-Control per endpoint, e.g. never cache the click-tracking redirects"""
+
+    def __init__(self, policies=None, default='private, no-store', immutable_prefix='cache/',
+                 mutable_files=('cache/assets/manifest.json',)):
+        self.policies = dict(policies or {})
+        self.default = default
+        # Static files under this prefix are content-addressed, except the
+        # mutable_files (the asset manifest is rewritten in place), which are
+        # revalidated on every use
+        self.immutable_prefix = immutable_prefix
+        self.mutable_files = frozenset(mutable_files)
+
+    def header_for(self, endpoint):
+        return self.policies.get(endpoint)
+
+    def apply(self, response, endpoint, view_args=None):
+        filename = (view_args or {}).get('filename', '') if endpoint == 'static' else ''
+        if filename.startswith(self.immutable_prefix):
+            if filename in self.mutable_files:
+                value = 'public, no-cache'
+            else:
+                value = 'public, max-age=31536000, immutable'
+        else:
+            value = self.policies.get(endpoint)
+        if value is not None:
+            response.headers['Cache-Control'] = value
+        elif 'Cache-Control' not in response.headers and self.default:
+            response.headers['Cache-Control'] = self.default
+        return response
+
+
+class Compressor:
+    """Compresses response bodies; ETagged bodies are compressed once"""
+
+    def __init__(self, min_size=1024, memo_bytes=8 * 1024 * 1024, enabled=True):
+        self.min_size = min_size
+        self.memo_bytes = memo_bytes
+        self.enabled = enabled
+        self._memo = OrderedDict()
+        self._memo_size = 0
+        self._lock = threading.Lock()
+
+    def encoded(self, body, encoding, etag=None):
+        """``body`` in ``encoding``, from the memo when ``etag`` identifies it"""
+        if etag is None:
+            return encode(body, encoding)
+        key = (etag, encoding)
+        with self._lock:
+            data = self._memo.get(key)
+            if data is not None:
+                self._memo.move_to_end(key)
+                return data
+        data = encode(body, encoding)
+        with self._lock:
+            if key not in self._memo and len(data) <= self.memo_bytes:
+                self._memo[key] = data
+                self._memo_size += len(data)
+                while self._memo_size > self.memo_bytes:
+                    _, evicted = self._memo.popitem(last=False)
+                    self._memo_size -= len(evicted)
+        return data
+
+    def choose(self, accept_encoding, mimetype, size):
+        """Encoding to use for a body, or None to send it as-is"""
+        if not self.enabled or size < self.min_size or not compressible(mimetype):
+            return None
+        return negotiate(accept_encoding, available_encodings())
+
+    def compress(self, response, request):
+        """after_request hook: compress a buffered, compressible response in place"""
+        if not compressible(response.mimetype):
+            return response
+        response.vary.add('Accept-Encoding')
+        if (response.status_code != 200 or request.method == 'HEAD' or response.is_streamed
+                or response.direct_passthrough or 'Content-Encoding' in response.headers):
+            return response
+        body = response.get_data()
+        encoding = self.choose(request.headers.get('Accept-Encoding'), response.mimetype, len(body))
+        if encoding is None:
+            return response
+        etag, _ = response.get_etag()
+        response.set_data(self.encoded(body, encoding, etag))
+        response.headers['Content-Encoding'] = encoding
+        if etag:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+def serve_precompressed(response, request, static_folder):
+    """Swap a static file response for its .br/.gz sibling when the client accepts it"""
+    if (request.endpoint != 'static' or response.status_code != 200 or 'Range' in request.headers
+            or not compressible(response.mimetype)):
+        return response
+    response.vary.add('Accept-Encoding')
+    path = safe_join(static_folder, (request.view_args or {}).get('filename', ''))
+    if path is None or not os.path.isfile(path):
+        return response
+    source_mtime = os.stat(path).st_mtime
+    offered = [encoding for encoding in SUFFIXES
+               if os.path.isfile(path + SUFFIXES[encoding])
+               and os.stat(path + SUFFIXES[encoding]).st_mtime >= source_mtime]
+    encoding = negotiate(request.headers.get('Accept-Encoding'), offered)
+    if encoding is None:
+        return response
+    variant = send_file(path + SUFFIXES[encoding], mimetype=response.mimetype, conditional=True)
+    response.close()
+    variant.headers['Content-Encoding'] = encoding
+    variant.vary.add('Accept-Encoding')
+    return variant
+
+
+def precompress_tree(folder, min_size=1024, out=None):
+    """Write .br/.gz siblings for compressible files under ``folder``; returns how many were written"""
+    written = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if name.endswith(tuple(SUFFIXES.values())) or name.endswith('.tmp'):
+                continue
+            path = os.path.join(root, name)
+            mimetype, _ = mimetypes.guess_type(name)
+            if not compressible(mimetype) or os.path.getsize(path) < min_size:
+                continue
+            data = None
+            for encoding in available_encodings():
+                target = path + SUFFIXES[encoding]
+                if os.path.exists(target) and os.stat(target).st_mtime >= os.stat(path).st_mtime:
+                    continue
+                if data is None:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                compressed = encode(data, encoding, best=True)
+                if len(compressed) >= len(data):
+                    continue
+                with open(target + '.tmp', 'wb') as f:
+                    f.write(compressed)
+                os.replace(target + '.tmp', target)
+                written += 1
+                if out:
+                    out(f"{os.path.relpath(target, folder)}: {len(data)} -> {len(compressed)} bytes")
+    return written
@@ -0,0 +1,207 @@
+"""Responsive variants for gear images.
+
+Local source images are resized to a few widths and re-encoded as AVIF (when
+Pillow has an AVIF encoder), WebP and JPEG. Variants are cached on disk under
+a directory named after the source's content hash, so identical images are
+only processed once. Builds run in a small thread pool so admin requests
+never wait on Pillow.
+"""
+import functools
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+MIME_TYPES = {'AVIF': 'image/avif', 'WEBP': 'image/webp', 'JPEG': 'image/jpeg'}
+EXTENSIONS = {'AVIF': 'avif', 'WEBP': 'webp', 'JPEG': 'jpg'}
+QUALITY = {'AVIF': 55, 'WEBP': 78, 'JPEG': 82}
+
+
+@functools.lru_cache(maxsize=None)
+def output_formats():
+    """Formats this Pillow build can encode, best first (Pillow is imported on first use)"""
+    from PIL import Image
+    try:
+        import pillow_avif  # noqa: F401  (registers the AVIF codec on older Pillow)
+    except ImportError:
+        pass
+    Image.init()
+    return tuple(fmt for fmt in ('AVIF', 'WEBP', 'JPEG') if fmt in Image.SAVE)
+
+
+class ResponsiveImage:
+    """What a template needs to emit ``<picture>``/``srcset`` markup"""
+    __slots__ = ('src', 'width', 'height', 'sources')
+
+    def __init__(self, src, width, height, sources):
+        self.src = src
+        self.width = width
+        self.height = height
+        self.sources = sources  # [(mime type, srcset)], best format first
+
+
+class ImagePipeline:
+    """Builds and looks up cached variants for images under ``static_folder``."""
+
+    def __init__(self, static_folder, static_url_path='/static', cache_subdir='cache/images',
+                 widths=(160, 320, 480), max_workers=2, on_built=None):
+        self.static_folder = static_folder
+        self.static_url_path = static_url_path
+        self.cache_subdir = cache_subdir
+        self.widths = tuple(sorted(widths))
+        self.on_built = on_built
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-pipeline')
+        self._manifests = {}
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    @property
+    def cache_dir(self):
+        return os.path.join(self.static_folder, self.cache_subdir)
+
+    def source_path(self, image_url):
+        """Map an image URL to a file under the static folder, if it is one"""
+        if not image_url or '://' in image_url or image_url.startswith('//'):
+            return None
+        name = image_url.split('?', 1)[0].lstrip('/')
+        prefix = self.static_url_path.strip('/') + '/'
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+        path = os.path.realpath(os.path.join(self.static_folder, name))
+        if not path.startswith(os.path.realpath(self.static_folder) + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    def lookup(self, image_url):
+        """Return a ResponsiveImage for already-built variants, or None.
+
+        Never processes images itself; a miss schedules a background build.
+        """
+        path = self.source_path(image_url)
+        if path is None:
+            return None
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        manifest = self._manifests.get(key)
+        if manifest is None:
+            manifest = self._read_manifest(self._variant_dir(path))
+            if manifest is None:
+                self.submit(image_url)
+                return None
+            self._manifests[key] = manifest
+        return self._responsive(manifest)
+
+    def submit(self, image_url):
+        """Build variants for ``image_url`` in the background"""
+        path = self.source_path(image_url)
+        if path is None:
+            return None
+        with self._lock:
+            if path in self._in_flight:
+                return None
+            self._in_flight.add(path)
+        return self._executor.submit(self._build_and_notify, path)
+
+    def build(self, path):
+        """Synchronously build (or reuse) the variants for a source file"""
+        from PIL import Image, ImageOps
+
+        variant_dir = self._variant_dir(path)
+        manifest = self._read_manifest(variant_dir)
+        if manifest is not None:
+            return manifest
+
+        tmp_dir = f'{variant_dir}.tmp{threading.get_ident()}'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        with Image.open(path) as original:
+            image = ImageOps.exif_transpose(original)
+            image.load()
+        if image.mode not in ('RGB', 'RGBA', 'L'):
+            image = image.convert('RGBA' if 'transparency' in image.info or 'A' in image.mode else 'RGB')
+        width, height = image.size
+        widths = [w for w in self.widths if w < width] + [min(width, self.widths[-1])]
+
+        formats = output_formats()
+        variants = {fmt: [] for fmt in formats}
+        for w in sorted(set(widths)):
+            h = max(1, round(height * w / width))
+            resized = image if w == width else image.resize((w, h), Image.LANCZOS)
+            for fmt in formats:
+                frame = resized
+                if fmt == 'JPEG' and frame.mode not in ('RGB', 'L'):
+                    frame = self._flatten(frame)
+                name = f'{w}.{EXTENSIONS[fmt]}'
+                frame.save(os.path.join(tmp_dir, name), fmt, quality=QUALITY[fmt], optimize=fmt == 'JPEG')
+                variants[fmt].append([w, name])
+
+        largest = widths[-1]
+        manifest = {
+            'dir': os.path.basename(variant_dir),
+            'width': largest,
+            'height': max(1, round(height * largest / width)),
+            'variants': variants,
+        }
+        with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        try:
+            os.replace(tmp_dir, variant_dir)
+        except OSError:
+            # Another worker finished the same image first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return manifest
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def _build_and_notify(self, path):
+        try:
+            self.build(path)
+            if self.on_built is not None:
+                self.on_built(path)
+        except Exception as e:
+            log.warning("Error building image variants for %s: %s", path, e)
+        finally:
+            with self._lock:
+                self._in_flight.discard(path)
+
+    def _variant_dir(self, path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                digest.update(chunk)
+        widths = ','.join(map(str, self.widths)) + ':' + ','.join(output_formats())
+        digest.update(widths.encode())
+        return os.path.join(self.cache_dir, digest.hexdigest()[:20])
+
+    @staticmethod
+    def _read_manifest(variant_dir):
+        try:
+            with open(os.path.join(variant_dir, 'manifest.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _flatten(image):
+        from PIL import Image
+        background = Image.new('RGB', image.size, (0, 0, 0))
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.split()[-1])
+        return background
+
+    def _responsive(self, manifest):
+        base = f"{self.static_url_path}/{self.cache_subdir}/{manifest['dir']}/"
+        sources = []
+        for fmt in output_formats():
+            entries = manifest['variants'].get(fmt)
+            if entries:
+                srcset = ', '.join(f'{base}{name} {w}w' for w, name in entries)
+                sources.append((MIME_TYPES[fmt], srcset))
+        fallback = manifest['variants'].get('JPEG') or next(iter(manifest['variants'].values()))
+        return ResponsiveImage(base + fallback[-1][1], manifest['width'], manifest['height'], sources)
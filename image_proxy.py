@@ -0,0 +1,218 @@
+"""Fetch-once local cache for remote gear images.
+
+Gear images are stored as third-party URLs. Each one is downloaded once in
+the background, validated with Pillow, and written content-addressed into the
+static cache so visitors load it from us with immutable cache headers. A
+small ref file per source URL points at the stored content; the oldest files
+are evicted when the cache grows past its size limit. Requests go through
+:mod:`outbound_http`, so neither the URL nor any redirect it answers with can
+reach a private address.
+"""
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import outbound_http
+
+log = logging.getLogger(__name__)
+
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif', 'AVIF': 'avif'}
+
+
+class ImageFetchError(Exception):
+    pass
+
+
+class RemoteImageCache:
+    """Localizes remote image URLs into ``<static_folder>/<cache_subdir>``."""
+
+    def __init__(self, static_folder, static_url_path='/static', cache_subdir='cache/remote',
+                 max_image_bytes=5 * 1024 * 1024, max_total_bytes=200 * 1024 * 1024,
+                 timeout=10.0, allow_private=False, max_workers=2, on_fetched=None, max_redirects=5,
+                 max_attempts=3, failure_ttl=3600.0, max_failed=1024):
+        self.static_folder = static_folder
+        self.static_url_path = static_url_path
+        self.cache_subdir = cache_subdir
+        self.max_image_bytes = max_image_bytes
+        self.max_total_bytes = max_total_bytes
+        self.timeout = timeout
+        self.allow_private = allow_private
+        self.max_redirects = max_redirects
+        self.on_fetched = on_fetched
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-fetch')
+        # A URL that failed max_attempts times is not fetched again until
+        # failure_ttl seconds after its last failure; at most max_failed are remembered
+        self.max_attempts = max_attempts
+        self.failure_ttl = failure_ttl
+        self.max_failed = max_failed
+        self._in_flight = set()
+        self._failed = OrderedDict()  # url -> (failures, monotonic time of the last one), oldest first
+        self._lock = threading.Lock()
+
+    @property
+    def cache_dir(self):
+        return os.path.join(self.static_folder, self.cache_subdir)
+
+    @property
+    def refs_dir(self):
+        return os.path.join(self.cache_dir, 'refs')
+
+    @property
+    def url_prefix(self):
+        return f'{self.static_url_path}/{self.cache_subdir}/'
+
+    @staticmethod
+    def is_remote(url):
+        return bool(url) and urllib.parse.urlsplit(url).scheme in ('http', 'https')
+
+    def local_url(self, url):
+        """Return our URL for a localized copy of ``url``, or None.
+
+        A miss schedules a background fetch, so the caller should fall back
+        to the original URL for now.
+        """
+        if not self.is_remote(url):
+            return None
+        name = self._read_ref(url)
+        if name is not None:
+            return self.url_prefix + name
+        self.submit(url)
+        return None
+
+    def submit(self, url):
+        """Fetch ``url`` in the background unless it is cached or already queued"""
+        if not self.is_remote(url):
+            return None
+        with self._lock:
+            if url in self._in_flight or self._gave_up(url):
+                return None
+            self._in_flight.add(url)
+        return self._executor.submit(self._fetch_and_notify, url)
+
+    def fetch(self, url):
+        """Download, validate and store ``url``. Returns the stored file name."""
+        name = self._read_ref(url)
+        if name is not None:
+            return name
+
+        data = self._download(url)
+
+        from PIL import Image
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image_format = image.format
+                image.verify()
+        except Exception as e:
+            raise ImageFetchError(f'invalid image data: {str(e)}')
+        if image_format not in EXTENSIONS:
+            raise ImageFetchError(f'unsupported image format: {image_format}')
+
+        name = f'{hashlib.sha256(data).hexdigest()[:32]}.{EXTENSIONS[image_format]}'
+        os.makedirs(self.refs_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, name)
+        if not os.path.exists(path):
+            self._write_atomic(path, data)
+        self._write_atomic(self._ref_path(url), name.encode())
+        self.evict()
+        return name
+
+    def evict(self):
+        """Delete the least recently stored files until under max_total_bytes"""
+        files = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and not entry.name.startswith('.'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        files.sort()
+        for _, size, path in files:
+            if total <= self.max_total_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        # Refs to evicted files are treated as misses and refetched
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def _fetch_and_notify(self, url):
+        try:
+            self.fetch(url)
+            if self.on_fetched is not None:
+                self.on_fetched(url)
+        except Exception as e:
+            with self._lock:
+                failures, _ = self._failed.pop(url, (0, None))
+                self._failed[url] = (failures + 1, time.monotonic())
+                while len(self._failed) > self.max_failed:
+                    self._failed.popitem(last=False)
+            log.warning("Error caching image %s: %s", url, e)
+        finally:
+            with self._lock:
+                self._in_flight.discard(url)
+
+    def _gave_up(self, url):
+        """Whether ``url`` failed too often to try again yet; call with the lock held"""
+        failures, failed_at = self._failed.get(url, (0, None))
+        if failed_at is not None and time.monotonic() - failed_at >= self.failure_ttl:
+            del self._failed[url]
+            return False
+        return failures >= self.max_attempts
+
+    def _download(self, url):
+        """The image bytes at ``url``, following redirects by hand so every hop's address is checked"""
+        current = url
+        for _ in range(self.max_redirects + 1):
+            parts = urllib.parse.urlsplit(current)
+            conn = outbound_http.connection(parts, self.timeout, self.allow_private)
+            try:
+                conn.request('GET', outbound_http.request_path(parts),
+                             headers={'User-Agent': 'dc-gaming-linktree image cache'})
+                response = conn.getresponse()
+                location = response.getheader('Location')
+                if response.status in outbound_http.REDIRECT_STATUSES and location:
+                    current = urllib.parse.urljoin(current, location)
+                    continue
+                if response.status != 200:
+                    raise ImageFetchError(f'HTTP {response.status}')
+                content_type = response.getheader('Content-Type', '')
+                if not content_type.startswith('image/'):
+                    raise ImageFetchError(f'not an image: {content_type or "no content type"}')
+                length = response.getheader('Content-Length')
+                if length and int(length) > self.max_image_bytes:
+                    raise ImageFetchError(f'image is {length} bytes, limit is {self.max_image_bytes}')
+                data = response.read(self.max_image_bytes + 1)
+            finally:
+                conn.close()
+            if len(data) > self.max_image_bytes:
+                raise ImageFetchError(f'image is larger than {self.max_image_bytes} bytes')
+            return data
+        raise ImageFetchError(f'more than {self.max_redirects} redirects')
+
+    def _ref_path(self, url):
+        return os.path.join(self.refs_dir, hashlib.sha256(url.encode()).hexdigest()[:32])
+
+    def _read_ref(self, url):
+        try:
+            with open(self._ref_path(url)) as f:
+                name = f.read().strip()
+        except OSError:
+            return None
+        return name if os.path.exists(os.path.join(self.cache_dir, name)) else None
+
+    @staticmethod
+    def _write_atomic(path, data):
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
@@ -0,0 +1,323 @@
+"""Request metrics, SQL and template timing, a sampling profiler and logging.
+
+``Instrumentation.init_app`` wires up:
+
+- per-endpoint latency histograms and request counters
+- SQL query count and time per request, from SQLAlchemy cursor events
+- template render time, from Flask's template signals
+- a ``Server-Timing`` header with the app and database time of each response
+
+``render_metrics()`` produces the Prometheus text format served at /metrics.
+``SamplingProfiler`` periodically snapshots the stacks of threads that are
+handling a request and aggregates them in the collapsed format that
+flamegraph.pl and speedscope read. ``configure_logging`` sends all log
+records through a queue so request threads never block on the log stream;
+it changes the root logger, so only the server entry point calls it.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import before_render_template, current_app, g, request, template_rendered
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+log = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values"""
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0, 0.0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted(self._series.items())
+            series = [(labels, list(counts), count, total) for labels, (counts, count, total) in series]
+        for labels, counts, count, total in series:
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames + ("le",), labels + (_num(bound),))} {bucket_count}')
+            lines.append(f'{self.name}_bucket{_labels(self.labelnames + ("le",), labels + ("+Inf",))} {count}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_num(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class CounterMetric:
+    """Monotonic counter keyed by a tuple of label values"""
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f'{self.name}{_labels(self.labelnames, labels)} {_num(value)}' for labels, value in values)
+        return lines
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _num(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _RequestStats(threading.local):
+    active = False
+    sql_count = 0
+    sql_seconds = 0.0
+
+
+class Instrumentation:
+    """Metrics for one process; attach with init_app()"""
+
+    def __init__(self):
+        self.requests = CounterMetric('linktree_http_requests_total', 'HTTP requests handled',
+                                      ('endpoint', 'method', 'status'))
+        self.latency = Histogram('linktree_http_request_duration_seconds', 'Request latency',
+                                 ('endpoint', 'method'))
+        self.sql_per_request = Histogram('linktree_sql_queries_per_request', 'SQL statements run per request',
+                                         ('endpoint',), QUERY_COUNT_BUCKETS)
+        self.sql_time = Histogram('linktree_sql_request_seconds', 'Time spent in SQL per request', ('endpoint',))
+        self.sql_queries = CounterMetric('linktree_sql_queries_total', 'SQL statements run, in and out of requests')
+        self.template_time = Histogram('linktree_template_render_seconds', 'Template render time', ('template',))
+        self.slow_request_seconds = 1.0
+        self.profiler = SamplingProfiler()
+        self._collectors = []
+        self._stats = _RequestStats()
+        self._template_starts = threading.local()
+
+    def add_collector(self, collect):
+        """Register ``collect() -> [(name, type, help, value)]`` for values read at scrape time"""
+        self._collectors.append(collect)
+        return collect
+
+    def init_app(self, app, engine):
+        self.slow_request_seconds = app.config['SLOW_REQUEST_SECONDS']
+        self.profiler.interval = app.config['PROFILER_INTERVAL']
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._before_render, app, weak=False)
+        template_rendered.connect(self._after_render, app, weak=False)
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        if app.config['PROFILER_ENABLED']:
+            self.profiler.start()
+
+    def record_request(self, endpoint, method, status, seconds):
+        """Count one request; also used by the ASGI fast paths, which bypass Flask"""
+        self.requests.inc(endpoint, method, status)
+        self.latency.observe(seconds, endpoint, method)
+
+    def render_metrics(self):
+        lines = []
+        for metric in (self.requests, self.latency, self.sql_per_request, self.sql_time, self.sql_queries,
+                       self.template_time):
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            for name, kind, help, value in collect():
+                lines.extend((f'# HELP {name} {help}', f'# TYPE {name} {kind}', f'{name} {_num(value)}'))
+        return '\n'.join(lines) + '\n'
+
+    # Flask hooks
+
+    def _before_request(self):
+        g._instrumentation_start = time.perf_counter()
+        self._stats.active = True
+        self._stats.sql_count = 0
+        self._stats.sql_seconds = 0.0
+        self.profiler.enter_request()
+
+    def _after_request(self, response):
+        start = g.get('_instrumentation_start')
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        endpoint = request.endpoint or 'unmatched'
+        stats = self._stats
+        self.record_request(endpoint, request.method, response.status_code, elapsed)
+        self.sql_per_request.observe(stats.sql_count, endpoint)
+        self.sql_time.observe(stats.sql_seconds, endpoint)
+        if current_app.config['SERVER_TIMING']:
+            response.headers.add('Server-Timing', f'app;dur={elapsed * 1000:.1f}')
+            response.headers.add('Server-Timing',
+                                 f'db;dur={stats.sql_seconds * 1000:.1f};desc="{stats.sql_count} queries"')
+        if elapsed >= self.slow_request_seconds:
+            log.warning('Slow request %s %s: %.0f ms, %d queries (%.0f ms)', request.method, request.path,
+                        elapsed * 1000, stats.sql_count, stats.sql_seconds * 1000)
+        return response
+
+    def _teardown_request(self, exc):
+        self._stats.active = False
+        self.profiler.exit_request()
+
+    def _before_render(self, sender, template, context, **extra):
+        starts = self._template_starts.__dict__.setdefault('starts', {})
+        starts[template.name] = time.perf_counter()
+
+    def _after_render(self, sender, template, context, **extra):
+        start = self._template_starts.__dict__.get('starts', {}).pop(template.name, None)
+        if start is not None:
+            self.template_time.observe(time.perf_counter() - start, template.name or 'string')
+
+    # SQLAlchemy events
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_instrumentation_starts', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('_instrumentation_starts')
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        self.sql_queries.inc()
+        stats = self._stats
+        if stats.active:
+            stats.sql_count += 1
+            stats.sql_seconds += elapsed
+
+
+class SamplingProfiler:
+    """Samples the stacks of request threads into collapsed (flamegraph) format.
+
+    Only threads inside a request are sampled, so idle server and background
+    threads do not drown out the request path.
+    """
+
+    def __init__(self, interval=0.01, max_stacks=20000):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.samples = 0
+        self._stacks = Counter()
+        self._request_threads = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def enter_request(self):
+        if self._thread is not None:
+            self._request_threads.add(threading.get_ident())
+
+    def exit_request(self):
+        self._request_threads.discard(threading.get_ident())
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        log.info('Sampling profiler started (every %.0f ms)', self.interval * 1000)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+        self._thread = None
+        self._request_threads.clear()
+        log.info('Sampling profiler stopped after %d samples', self.samples)
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+
+    def collapsed(self):
+        """``frame;frame;frame count`` lines, root first"""
+        with self._lock:
+            return ''.join(f'{stack} {count}\n' for stack, count in self._stacks.most_common())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            stacks = []
+            for ident in list(self._request_threads):
+                frame = frames.get(ident)
+                if frame is not None:
+                    stacks.append(_collapse(frame))
+            if not stacks:
+                continue
+            with self._lock:
+                self.samples += 1
+                for stack in stacks:
+                    if stack in self._stacks or len(self._stacks) < self.max_stacks:
+                        self._stacks[stack] += 1
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+_listener = [None]
+
+
+def configure_logging(level='INFO'):
+    """Route the process's log records through a queue to a stderr handler on its own thread"""
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _listener[0] is not None:
+        return
+    records = queue.SimpleQueue()
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    listener = logging.handlers.QueueListener(records, stream, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    root.addHandler(logging.handlers.QueueHandler(records))
+    _listener[0] = listener
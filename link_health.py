@@ -0,0 +1,253 @@
+"""Concurrent health checks for the stored link and gear URLs.
+
+``LinkChecker`` requests each distinct URL from a thread pool, at most
+``per_host`` at a time per host, following redirects by hand so the status,
+final URL, number of hops and latency of every chain are recorded. ``HEAD``
+is tried first; servers that refuse it get a ``GET`` whose body is never read.
+Results are stored one row per target in the ``LinkHealth`` table, which the
+admin dashboard shows.
+
+With ``LINK_HEALTH_REWRITE`` on, :func:`redirect_select` makes the tracking
+redirects send visitors straight to a healthy chain's final URL instead of
+through its intermediate hops.
+"""
+import http.client
+import logging
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import and_, delete, func, insert, select, tuple_
+
+import outbound_http
+from outbound_http import REDIRECT_STATUSES
+
+log = logging.getLogger(__name__)
+
+# Servers that answer HEAD with these usually serve GET fine
+HEAD_REFUSED = (403, 405, 501)
+
+
+class LinkCheckError(Exception):
+    pass
+
+
+class CheckResult:
+    """Outcome of requesting one URL and following its redirects"""
+    __slots__ = ('status', 'final_url', 'redirects', 'latency_ms', 'error')
+
+    def __init__(self, status, final_url, redirects, latency_ms, error=None):
+        self.status = status
+        self.final_url = final_url
+        self.redirects = redirects
+        self.latency_ms = latency_ms
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.status is not None and 200 <= self.status < 300
+
+
+class LinkChecker:
+    """Checks URLs from a thread pool with a per-host concurrency limit"""
+
+    def __init__(self, workers=16, per_host=2, timeout=5.0, max_redirects=5, allow_private=False,
+                 user_agent='dc-gaming-linktree link checker'):
+        self.workers = workers
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.allow_private = allow_private
+        self.user_agent = user_agent
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def check_many(self, urls):
+        """``{url: CheckResult}`` for the distinct checkable URLs in ``urls``"""
+        urls = [url for url in dict.fromkeys(urls) if is_checkable(url)]
+        if not urls:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(urls)), thread_name_prefix='link-check') as pool:
+            return dict(zip(urls, pool.map(self.check, urls)))
+
+    def check(self, url):
+        start = time.perf_counter()
+        current, hops = url, 0
+        try:
+            while True:
+                parts = urllib.parse.urlsplit(current)
+                if parts.scheme not in ('http', 'https') or not parts.hostname:
+                    raise LinkCheckError(f'cannot check {parts.scheme or "relative"} URLs')
+                with self._host_slot(parts.netloc.lower()):
+                    status, location = self._request(parts, 'HEAD')
+                    if status in HEAD_REFUSED:
+                        status, location = self._request(parts, 'GET')
+                if status not in REDIRECT_STATUSES or not location:
+                    return CheckResult(status, current, hops, _elapsed_ms(start))
+                hops += 1
+                if hops > self.max_redirects:
+                    raise LinkCheckError(f'more than {self.max_redirects} redirects')
+                current = urllib.parse.urljoin(current, location)
+        except (LinkCheckError, OSError, http.client.HTTPException, ValueError) as e:
+            return CheckResult(None, current, hops, _elapsed_ms(start), str(e) or type(e).__name__)
+
+    def _request(self, parts, method):
+        # Pinned to an address checked against allow_private, like the image cache
+        conn = outbound_http.connection(parts, self.timeout, self.allow_private)
+        try:
+            conn.request(method, outbound_http.request_path(parts),
+                         headers={'User-Agent': self.user_agent, 'Accept': '*/*'})
+            response = conn.getresponse()
+            return response.status, response.getheader('Location')
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _host_slot(self, host):
+        # host -> [semaphore, threads holding or waiting for it]; the entry goes
+        # once nobody uses it, so checking many hosts does not grow the dict
+        with self._lock:
+            entry = self._hosts.get(host)
+            if entry is None:
+                entry = self._hosts[host] = [threading.BoundedSemaphore(self.per_host), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._hosts[host]
+
+
+class BackgroundRuns:
+    """Runs checks off the request thread, one at a time, without queueing duplicates"""
+
+    def __init__(self):
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args):
+        """Queue ``fn(*args)`` unless a run for ``key`` is already queued; returns whether it was"""
+        with self._lock:
+            if key in self._pending:
+                return False
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='link-health')
+            self._pending.add(key)
+        self._executor.submit(self._run, key, fn, *args)
+        return True
+
+    def is_pending(self, key):
+        return key in self._pending
+
+    def _run(self, key, fn, *args):
+        try:
+            fn(*args)
+        except Exception:
+            log.exception("Link health run %s failed", key)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def is_checkable(url):
+    return bool(url) and urllib.parse.urlsplit(url).scheme in ('http', 'https')
+
+
+def _elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def load_targets(session, models, owner=None, ids=None):
+    """``(kind, id, url)`` for every target of ``models`` ({kind: model}), optionally one owner's or some ids"""
+    targets = []
+    for kind, model in models.items():
+        statement = select(model.id, model.url).order_by(model.id)
+        if owner is not None:
+            statement = statement.where(model.user_id == owner)
+        if ids is not None:
+            statement = statement.where(model.id.in_(ids.get(kind, ())))
+        targets.extend((kind, id, url) for id, url in session.execute(statement))
+    return targets
+
+
+def save_results(session, LinkHealth, targets, results):
+    """Replace the stored results of ``targets``; unchecked (non-HTTP) targets are left alone"""
+    table = LinkHealth.__table__
+    now = datetime.utcnow()
+    rows = []
+    for kind, id, url in targets:
+        result = results.get(url)
+        if result is None:
+            continue
+        rows.append({
+            'target_type': kind, 'target_id': id, 'url': url, 'status': result.status,
+            'final_url': result.final_url[:2000], 'redirects': result.redirects, 'latency_ms': result.latency_ms,
+            'error': result.error[:200] if result.error else None, 'checked_at': now,
+        })
+    if not rows:
+        return 0
+    keys = [(row['target_type'], row['target_id']) for row in rows]
+    for offset in range(0, len(keys), 500):
+        session.execute(delete(table).where(
+            tuple_(table.c.target_type, table.c.target_id).in_(keys[offset:offset + 500])))
+    session.execute(insert(table), rows)
+    return len(rows)
+
+
+def prune(session, LinkHealth, models):
+    """Drop the results of deleted targets"""
+    for kind, model in models.items():
+        session.execute(delete(LinkHealth.__table__).where(LinkHealth.target_type == kind,
+                                                           LinkHealth.target_id.not_in(select(model.id))))
+
+
+def health_by_target(session, LinkHealth, kind, ids):
+    """``{id: LinkHealth}`` for the given targets of one kind"""
+    if not ids:
+        return {}
+    rows = session.execute(select(LinkHealth).where(LinkHealth.target_type == kind,
+                                                     LinkHealth.target_id.in_(ids))).scalars()
+    return {row.target_id: row for row in rows}
+
+
+def redirect_select(model, LinkHealth, kind, rewrite=False):
+    """``(id, url, owner)`` rows for the redirect caches.
+
+    With ``rewrite``, a target whose current URL was last seen redirecting to
+    a healthy page resolves to that page directly.
+    """
+    if not rewrite:
+        return select(model.id, model.url, model.user_id)
+    health = LinkHealth.__table__
+    shortcut = and_(health.c.target_type == kind, health.c.target_id == model.id, health.c.url == model.url,
+                    health.c.redirects > 0, health.c.status >= 200, health.c.status < 300)
+    return (select(model.id, func.coalesce(health.c.final_url, model.url), model.user_id)
+            .select_from(model.__table__).outerjoin(health, shortcut))
+
+
+def summary(targets, results):
+    """Counts of healthy, redirecting and broken targets for a finished run"""
+    counts = {'ok': 0, 'redirected': 0, 'broken': 0, 'skipped': 0}
+    for _, _, url in targets:
+        result = results.get(url)
+        if result is None:
+            counts['skipped'] += 1
+        elif not result.ok:
+            counts['broken'] += 1
+        elif result.redirects:
+            counts['redirected'] += 1
+        else:
+            counts['ok'] += 1
+    return counts
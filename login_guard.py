@@ -0,0 +1,210 @@
+"""Password verification off the request threads, and login rate limiting.
+
+``PasswordVerifier`` runs the password KDF in a small, bounded thread pool.
+hashlib's scrypt and PBKDF2 release the GIL, so at most ``workers`` cores are
+ever spent hashing, and a login storm queues (or is turned away) instead of
+starving the public routes. A successful login whose stored hash uses another
+method or cost is rehashed to the configured one.
+
+``RateLimiter`` is a token bucket per key (client IP, username). Buckets live
+in process memory by default; pass a ``RedisBackend`` to share them between
+workers.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_HASH_METHOD = 'scrypt:32768:8:1'
+
+log = logging.getLogger(__name__)
+
+
+class LoginBusy(RuntimeError):
+    """Too many password checks are queued; the client should retry later."""
+
+
+class PasswordVerifier:
+    """Checks passwords in a bounded worker pool"""
+
+    def __init__(self, workers=2, max_queued=16, timeout=10.0, method=DEFAULT_HASH_METHOD):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.method = method
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self._dummy_hash = None
+        self.in_flight = 0
+
+    def configure(self, workers, max_queued, timeout, method):
+        """Apply settings; takes effect before the first check"""
+        self.workers, self.max_queued, self.timeout, self.method = workers, max_queued, timeout, method
+
+    def verify(self, stored_hash, password):
+        """``(ok, new_hash)``; new_hash is set when the stored hash should be replaced.
+
+        ``stored_hash=None`` (an unknown user) still costs one hash, so response
+        times do not reveal which usernames exist.
+        """
+        return self._run(self._check, stored_hash, password or '')
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _run(self, fn, *args):
+        executor, slots = self._pool()
+        if not slots.acquire(blocking=False):
+            raise LoginBusy('Too many logins in progress')
+        with self._lock:
+            self.in_flight += 1
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException:
+            self._release(slots)
+            raise
+        # The slot is freed when the hash finishes, not when the caller stops waiting:
+        # a check that timed out keeps its worker busy until then
+        future.add_done_callback(lambda future: self._release(slots))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise LoginBusy('Password check timed out')
+
+    def _release(self, slots):
+        with self._lock:
+            self.in_flight -= 1
+        slots.release()
+
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._slots = threading.BoundedSemaphore(self.workers + self.max_queued)
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password')
+        return self._executor, self._slots
+
+    def _check(self, stored_hash, password):
+        if stored_hash is None:
+            if self._dummy_hash is None:
+                self._dummy_hash = generate_password_hash('not a password', self.method)
+            check_password_hash(self._dummy_hash, password)
+            return False, None
+        if not check_password_hash(stored_hash, password):
+            return False, None
+        if self.needs_rehash(stored_hash):
+            return True, generate_password_hash(password, self.method)
+        return True, None
+
+    def needs_rehash(self, stored_hash):
+        return stored_hash.split('$', 1)[0] != _normalized_method(self.method)
+
+
+def _normalized_method(method):
+    """The prefix werkzeug writes for ``method``, e.g. 'scrypt' -> 'scrypt:32768:8:1'"""
+    name, _, params = method.partition(':')
+    if name == 'scrypt':
+        n, r, p = (params.split(':') + ['', '', ''])[:3]
+        return f'scrypt:{n or 2 ** 15}:{r or 8}:{p or 1}'
+    if name == 'pbkdf2':
+        digest, _, iterations = params.partition(':')
+        return f'pbkdf2:{digest or "sha256"}:{iterations or 600000}'
+    return method
+
+
+def tune_scrypt(target_seconds=0.25, r=8, p=1):
+    """The largest power-of-two scrypt cost whose hash takes at most ``target_seconds`` here"""
+    n = 2 ** 14
+    while True:
+        start = time.perf_counter()
+        hashlib.scrypt(b'password', salt=b'tuning-salt-0000', n=n * 2, r=r, p=p, maxmem=132 * n * 2 * r * p)
+        if time.perf_counter() - start > target_seconds or n >= 2 ** 20:
+            return f'scrypt:{n}:{r}:{p}'
+        n *= 2
+
+
+# Rate limiting
+
+class MemoryBackend:
+    """Token buckets in a bounded dict; each worker process has its own"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, cost=1):
+        """Spend ``cost`` tokens if available; returns 0, or seconds until they are"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= max(cost, 1):
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (max(cost, 1) - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class RedisBackend:
+    """Token buckets in Redis, shared by every worker (needs the redis package)"""
+
+    SCRIPT = """
+    local capacity, rate, cost, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    local need = math.max(cost, 1)
+    local wait = 0
+    if tokens >= need then tokens = tokens - cost else wait = (need - tokens) / rate end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, url, prefix='linktree:ratelimit:'):
+        import redis
+
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url)
+        self._take = self._redis.register_script(self.SCRIPT)
+
+    def take(self, key, capacity, rate, cost=1):
+        return float(self._take(keys=[self.prefix + key], args=[capacity, rate, cost, time.time()]))
+
+
+class RateLimiter:
+    """Token bucket: ``burst`` attempts at once, refilled at ``per_minute``"""
+
+    def __init__(self, per_minute=5.0, burst=10, backend=None):
+        self.per_minute = per_minute
+        self.burst = burst
+        self.backend = backend or MemoryBackend()
+
+    def hit(self, key, cost=1):
+        """Spend ``cost`` tokens from ``key``'s bucket; 0 if allowed, else seconds to wait.
+
+        ``cost=0`` only checks that a token is left.
+        """
+        if self.per_minute <= 0:
+            return 0.0
+        try:
+            return self.backend.take(key, self.burst, self.per_minute / 60.0, cost)
+        except Exception:
+            # A shared backend outage must not lock everyone out
+            log.exception("Rate limit backend failed; allowing %s", key)
+            return 0.0
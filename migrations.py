@@ -0,0 +1,109 @@
+"""Bring an existing database's schema up to date with models.py.
+
+``db.create_all()`` creates missing tables but never touches existing ones,
+so databases created before a column, index or constraint was added to a
+model need this. Every step is idempotent; ``flask migrate-db`` (and
+``init-db``) can be run any number of times.
+"""
+from collections import Counter
+
+from sqlalchemy import bindparam, func, inspect, select, update
+from sqlalchemy.schema import CreateColumn
+
+
+class MigrationError(RuntimeError):
+    """The data has to be fixed by hand before the schema can be changed."""
+
+
+def migrate(db, models, log=print):
+    """Create missing tables and columns, backfill data the new constraints need, then create missing indexes"""
+    with db.engine.begin() as conn:
+        for model in models:
+            table = model.__table__
+            if not inspect(conn).has_table(table.name):
+                log(f"Creating table {table.name}")
+                table.create(conn)
+                continue
+            added = _add_missing_columns(conn, table, log)
+            if 'created_at' in table.c and not table.c.created_at.nullable:
+                _backfill_created_at(conn, table, log)
+            if 'user_id' in added:
+                _backfill_owner(conn, table, log)
+            if 'position' in added:
+                _backfill_positions(conn, table, log)
+            existing = {index['name'] for index in inspect(conn).get_indexes(table.name)}
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                if index.name in existing:
+                    continue
+                if index.unique:
+                    _check_unique(conn, table, index)
+                log(f"Creating index {index.name} on {table.name}")
+                index.create(conn)
+
+
+def _add_missing_columns(conn, table, log):
+    existing = {column['name'] for column in inspect(conn).get_columns(table.name)}
+    added = []
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        if not column.nullable and column.server_default is None:
+            raise MigrationError(f"Cannot add {table.name}.{column.name}: a NOT NULL column needs a server_default")
+        log(f"Adding column {column.name} to {table.name}")
+        table_name = conn.dialect.identifier_preparer.format_table(table)
+        conn.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {CreateColumn(column).compile(dialect=conn.dialect)}")
+        added.append(column.name)
+    return added
+
+
+def _backfill_owner(conn, table, log):
+    """Rows from before a table had owners belong to the first user (the only one, back then)"""
+    foreign_keys = list(table.c.user_id.foreign_keys)
+    if not foreign_keys:
+        return
+    owner = conn.execute(select(func.min(foreign_keys[0].column))).scalar()
+    if owner is None:
+        return
+    result = conn.execute(update(table).where(table.c.user_id.is_(None)).values(user_id=owner))
+    log(f"Assigned {result.rowcount} {table.name} rows to user {owner}")
+
+
+def _backfill_positions(conn, table, log):
+    """Number existing rows newest first (per owner), the order they were shown in before"""
+    owners = [table.c.user_id] if 'user_id' in table.c else []
+    rows = conn.execute(select(table.c.id, *owners)
+                        .order_by(*owners, table.c.created_at.desc(), table.c.id.desc())).all()
+    positions, counters = [], Counter()
+    for row in rows:
+        owner = tuple(row[1:])
+        positions.append({'_id': row.id, '_position': counters[owner]})
+        counters[owner] += 1
+    if positions:
+        conn.execute(update(table).where(table.c.id == bindparam('_id')).values(position=bindparam('_position')),
+                     positions)
+    log(f"Numbered {len(positions)} {table.name} rows newest first")
+
+
+def _backfill_created_at(conn, table, log):
+    """Rows without created_at sort last (as they did before), with their ids as tiebreak"""
+    if not conn.execute(select(func.count()).select_from(table).where(table.c.created_at.is_(None))).scalar():
+        return
+    oldest = conn.execute(select(func.min(table.c.created_at))).scalar()
+    result = conn.execute(
+        update(table).where(table.c.created_at.is_(None)).values(created_at=oldest or func.current_timestamp())
+    )
+    log(f"Backfilled created_at on {result.rowcount} {table.name} rows")
+
+
+def _check_unique(conn, table, index):
+    columns = list(index.columns)
+    duplicates = conn.execute(
+        select(*columns, func.count()).group_by(*columns).having(func.count() > 1).limit(20)
+    ).all()
+    if duplicates:
+        names = ', '.join(column.name for column in columns)
+        rows = '; '.join(', '.join(repr(value) for value in row[:-1]) for row in duplicates)
+        raise MigrationError(
+            f"Cannot create {index.name}: {table.name} has duplicate ({names}) values: {rows}. "
+            f"Rename or delete the duplicates and run the migration again."
+        )
@@ -0,0 +1,157 @@
+"""Database models shared by the app, CLI commands and scripts."""
+from datetime import datetime
+
+from flask_login import UserMixin
+from flask_sqlalchemy import SQLAlchemy
+
+db = SQLAlchemy()
+
+class User(UserMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)
+    links = db.relationship('Link', backref='user', lazy=True)
+
+    def __repr__(self):
+        return f'<User {self.username}>'
+
+class Link(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(100), nullable=False)
+    url = db.Column(db.String(500), nullable=False)
+    icon = db.Column(db.String(1000))
+    clicks = db.Column(db.Integer, default=0)
+    # Bot, prefetch and duplicate clicks, not counted in clicks (click_filter.py)
+    filtered_clicks = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Display order, ascending; new links get a position above the current top
+    position = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+
+    # Existing databases get these from 'flask migrate-db' (migrations.py)
+    __table_args__ = (
+        db.Index('uq_link_user_title', 'user_id', 'title', unique=True),
+        db.Index('ix_link_user_position', 'user_id', 'position', 'id'),
+        db.Index('ix_link_position', 'position', 'id'),
+        db.Index('ix_link_created', 'created_at', 'id'),
+    )
+
+class Gear(db.Model):
+    """Model for gear items."""
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text, nullable=False)
+    price = db.Column(db.String(20), nullable=False)
+    url = db.Column(db.String(500), nullable=False)
+    image = db.Column(db.String(500), nullable=False)
+    clicks = db.Column(db.Integer, default=0)
+    filtered_clicks = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # Nullable only for rows older than the column; migrations.py assigns them to the first user
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+
+    __table_args__ = (
+        db.Index('ix_gear_created', 'created_at', 'id'),
+        db.Index('ix_gear_user_created', 'user_id', 'created_at', 'id'),
+    )
+
+    def to_dict(self):
+        """Convert gear item to dictionary."""
+        return {
+            'id': self.id,
+            'title': self.title,
+            'description': self.description,
+            'price': self.price,
+            'url': self.url,
+            'image': self.image,
+            'clicks': self.clicks,
+            'filtered_clicks': self.filtered_clicks,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class ClickEvent(db.Model):
+    """Raw click event, kept until rolled up and past retention"""
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    target_type = db.Column(db.String(10), nullable=False)
+    target_id = db.Column(db.Integer, nullable=False)
+    referrer = db.Column(db.String(500))
+    ua_class = db.Column(db.String(10))
+    rolled_up = db.Column(db.Boolean, default=False, nullable=False, index=True)
+
+class ClickRollup(db.Model):
+    """Click count for one target in one minute/hour/day bucket"""
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(6), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    target_type = db.Column(db.String(10), nullable=False)
+    target_id = db.Column(db.Integer, nullable=False)
+    clicks = db.Column(db.Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'target_type', 'target_id', 'bucket_start', name='uq_click_rollup_bucket'),
+        db.Index('ix_click_rollup_series', 'granularity', 'bucket_start'),
+    )
+
+class LinkHealth(db.Model):
+    """Latest check of one link/gear URL, written by 'flask check-links' (link_health.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    target_type = db.Column(db.String(10), nullable=False)
+    target_id = db.Column(db.Integer, nullable=False)
+    # The target's URL when checked; an edited URL makes the row stale
+    url = db.Column(db.String(500), nullable=False)
+    status = db.Column(db.Integer)  # None: no response (see error)
+    final_url = db.Column(db.String(2000))
+    redirects = db.Column(db.Integer, default=0, nullable=False)
+    latency_ms = db.Column(db.Float)
+    error = db.Column(db.String(200))
+    checked_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('target_type', 'target_id', name='uq_link_health_target'),
+    )
+
+    @property
+    def ok(self):
+        return self.status is not None and 200 <= self.status < 300
+
+    def to_dict(self):
+        return {
+            'target_type': self.target_type,
+            'target_id': self.target_id,
+            'url': self.url,
+            'status': self.status,
+            'ok': self.ok,
+            'final_url': self.final_url,
+            'redirects': self.redirects,
+            'latency_ms': self.latency_ms,
+            'error': self.error,
+            'checked_at': self.checked_at.isoformat() if self.checked_at else None
+        }
+
+class Preferences(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    site_title = db.Column(db.String(100), default='DC Gaming')
+    site_description = db.Column(db.String(200), default='Your gaming destination')
+    profile_image = db.Column(db.String(500))
+    background_color = db.Column(db.String(7), default='#000000')
+    accent_color = db.Column(db.String(7), default='#E50914')
+    text_color = db.Column(db.String(7), default='#ffffff')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_preferences_user', 'user_id'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'site_title': self.site_title,
+            'site_description': self.site_description,
+            'profile_image': self.profile_image,
+            'background_color': self.background_color,
+            'accent_color': self.accent_color,
+            'text_color': self.text_color
+        }
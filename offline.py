@@ -0,0 +1,71 @@
+"""Service worker, redirect manifest and click beacons for the public pages.
+
+Public pages register ``/sw.js``, which serves them from the browser's cache
+while fetching a fresh copy in the background, so a repeat visit renders
+without waiting on the network (or with no network at all). Each creator's
+``/api/targets`` manifest maps link and gear ids to their destinations. With
+it, the page script sends a tracked click straight to the destination instead
+of through ``/track/<id>``. It records the click with ``navigator.sendBeacon``
+to ``POST /api/clicks``, which takes a batch, since clicks made offline are
+queued and sent together.
+
+The manifest's ``version`` is a hash of the targets and of everything the
+creator's pages render (titles, order, gear details, preferences), so any
+edit that changes a page changes it. It does not depend on the process that
+rendered it. The service worker drops its cached pages when the version
+changes.
+"""
+import hashlib
+import json
+
+MAX_BEACON_CLICKS = 100
+MAX_BEACON_BYTES = 16 * 1024
+KINDS = ('link', 'gear')
+
+
+class BeaconError(ValueError):
+    pass
+
+
+def manifest(targets, pages=None):
+    """The manifest document for ``{kind: {id: url}}``.
+
+    Its version is a hash of the targets and of ``pages``, the JSON-serialisable
+    data the creator's pages are rendered from.
+    """
+    data = {kind: {str(id): url for id, url in sorted(targets.get(kind, {}).items())} for kind in KINDS}
+    encoded = json.dumps([data, pages], sort_keys=True, separators=(',', ':'), default=str).encode()
+    return {'version': hashlib.sha1(encoded).hexdigest()[:16], **data}
+
+
+def parse_beacon(body, max_clicks=MAX_BEACON_CLICKS):
+    """``[(kind, id)]`` from a beacon body: ``{"clicks": [{"type": "link", "id": 2}, ...]}``.
+
+    sendBeacon posts strings as text/plain, so the content type is not checked.
+    """
+    if len(body) > MAX_BEACON_BYTES:
+        raise BeaconError('Beacon too large')
+    try:
+        clicks = json.loads(body)['clicks']
+    except (ValueError, TypeError, KeyError):
+        raise BeaconError('Expected {"clicks": [...]}')
+    if not isinstance(clicks, list):
+        raise BeaconError('clicks must be a list')
+    if len(clicks) > max_clicks:
+        raise BeaconError(f'At most {max_clicks} clicks per beacon')
+    parsed = []
+    for click in clicks:
+        if not isinstance(click, dict) or click.get('type', 'link') not in KINDS:
+            raise BeaconError('Each click needs a type of link or gear')
+        id = click.get('id')
+        if not isinstance(id, int) or isinstance(id, bool) or id < 1:
+            raise BeaconError('Each click needs a numeric id')
+        parsed.append((click.get('type', 'link'), id))
+    return parsed
+
+
+def cache_version(asset_files, source):
+    """Names the service worker's caches; changes with the asset build or the worker itself"""
+    digest = hashlib.sha1(json.dumps(asset_files, sort_keys=True).encode())
+    digest.update(source.encode())
+    return digest.hexdigest()[:12]
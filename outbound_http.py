@@ -0,0 +1,79 @@
+"""HTTP connections to creator-supplied URLs, pinned to a checked address.
+
+The image cache and the link checker request URLs that creators typed in, so
+those requests must not reach loopback, private or link-local addresses (the
+cloud metadata service at 169.254.169.254 included). :func:`connection`
+resolves the host once, checks every address it resolves to, and connects to
+that checked address; a second lookup that answers differently (DNS
+rebinding) is never made. Redirects are not followed here: callers follow
+them hop by hop, getting a new checked connection for each.
+"""
+import http.client
+import ipaddress
+import socket
+import ssl
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+
+class AddressError(OSError):
+    """The host cannot be resolved, or resolves to an address requests may not reach"""
+
+
+def is_public(address):
+    return ipaddress.ip_address(address.split('%', 1)[0]).is_global
+
+
+def resolve(host, port, allow_private=False):
+    """The address to connect to for ``host``; every address it resolves to must be public unless allowed"""
+    try:
+        addresses = [info[4][0] for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)]
+    except socket.gaierror as e:
+        raise AddressError(f'cannot resolve {host}: {str(e)}')
+    if not addresses:
+        raise AddressError(f'cannot resolve {host}')
+    if not allow_private:
+        for address in addresses:
+            if not is_public(address):
+                raise AddressError(f'{host} resolves to a non-public address')
+    return addresses[0]
+
+
+class PinnedHTTPConnection(http.client.HTTPConnection):
+    """Sends ``Host: host`` but connects to ``address``"""
+
+    def __init__(self, host, address, **kwargs):
+        super().__init__(host, **kwargs)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address, self.port), self.timeout, self.source_address)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+class PinnedHTTPSConnection(http.client.HTTPSConnection):
+    """Connects to ``address``; SNI and certificate checks still use ``host``"""
+
+    def __init__(self, host, address, **kwargs):
+        super().__init__(host, **kwargs)
+        self.address = address
+
+    def connect(self):
+        sock = socket.create_connection((self.address, self.port), self.timeout, self.source_address)
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+def connection(parts, timeout, allow_private=False):
+    """An HTTP(S) connection for ``urlsplit()`` parts, pinned to a checked address"""
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise AddressError(f'cannot request {parts.scheme or "relative"} URLs')
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    address = resolve(parts.hostname, port, allow_private)
+    if parts.scheme == 'https':
+        return PinnedHTTPSConnection(parts.hostname, address, port=port, timeout=timeout,
+                                     context=ssl.create_default_context())
+    return PinnedHTTPConnection(parts.hostname, address, port=port, timeout=timeout)
+
+
+def request_path(parts):
+    return (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
@@ -0,0 +1,148 @@
+"""Rendered-response cache for the public pages.
+
+Entries are keyed by route within a namespace (the creator whose page it
+is) and tagged with a content version. Admin writes bump their namespace's
+version, which invalidates that creator's pages only; ``bump()`` without a
+namespace invalidates everything. The TTL bounds how long a page edited
+through another worker can be served.
+"""
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import Response, request
+
+
+class CachedPage:
+    __slots__ = ('body', 'mimetype', 'etag', 'last_modified', 'version', 'expires', 'headers')
+
+    def __init__(self, body, mimetype, etag, last_modified, version, expires, headers=None):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = etag
+        self.last_modified = last_modified
+        self.version = version
+        self.expires = expires
+        self.headers = headers or {}
+
+
+class PageCache:
+    """LRU cache of rendered responses bounded by entry count and total bytes."""
+
+    def __init__(self, max_entries=64, max_bytes=4 * 1024 * 1024, ttl=60.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.version = 0
+        self.last_modified = self._now()
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        # namespace -> (version, last_modified), and the keys cached under it
+        self._namespaces = {}
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def bump(self, namespace=None):
+        """Mark cached content stale after an admin edit: one namespace's, or all of it."""
+        with self._lock:
+            if namespace is None:
+                self.version += 1
+                self.last_modified = self._now()
+                self._entries.clear()
+                self._namespaces.clear()
+                self._keys.clear()
+                self._size = 0
+                return
+            version, _ = self._namespaces.get(namespace, (0, None))
+            self._namespaces[namespace] = (version + 1, self._now())
+            for key in self._keys.pop(namespace, ()):
+                self._size -= len(self._entries.pop((namespace, key)).body)
+
+    def get(self, key, namespace=None):
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None or entry.version != self._version(namespace) or entry.expires <= time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end((namespace, key))
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, mimetype, headers=None, namespace=None):
+        etag = hashlib.sha1(body).hexdigest()
+        with self._lock:
+            _, changed = self._namespaces.get(namespace, (0, None))
+            last_modified = max(self.last_modified, changed) if changed else self.last_modified
+            entry = CachedPage(body, mimetype, etag, last_modified, self._version(namespace),
+                               time.monotonic() + self.ttl, headers)
+            if len(body) > self.max_bytes:
+                return entry
+            old = self._entries.pop((namespace, key), None)
+            if old is not None:
+                self._size -= len(old.body)
+            self._entries[(namespace, key)] = entry
+            self._keys.setdefault(namespace, set()).add(key)
+            self._size += len(body)
+            while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+                (evicted_namespace, evicted_key), evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.body)
+                keys = self._keys[evicted_namespace]
+                keys.discard(evicted_key)
+                if not keys:
+                    del self._keys[evicted_namespace]
+            return entry
+
+    def _version(self, namespace):
+        return self.version, self._namespaces.get(namespace, (0, None))[0]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'version': self.version,
+                'entries': len(self._entries),
+                'namespaces': len(self._keys),
+                'bytes': self._size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def cached(self, key):
+        """Decorator that serves a view from the cache with ETag/Last-Modified."""
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                return self.serve(key, lambda: view(*args, **kwargs))
+            return wrapper
+        return decorator
+
+    def serve(self, key, render, namespace=None):
+        """The cached response for ``key``, calling ``render()`` on a miss"""
+        entry = self.get(key, namespace)
+        if entry is None:
+            response = render()
+            if not isinstance(response, Response):
+                response = Response(response)
+            if response.status_code != 200 or response.direct_passthrough:
+                return response
+            entry = self.put(key, response.get_data(), response.mimetype, namespace=namespace)
+        return self.respond(entry)
+
+    @staticmethod
+    def respond(entry):
+        """Response for a cached entry, 304 when the request's validators match"""
+        response = Response(entry.body, mimetype=entry.mimetype, headers=entry.headers)
+        response.set_etag(entry.etag)
+        response.last_modified = entry.last_modified
+        return response.make_conditional(request)
+
+    @staticmethod
+    def _now():
+        # HTTP dates have one-second resolution
+        return datetime.now(timezone.utc).replace(microsecond=0)
@@ -0,0 +1,138 @@
+"""Keyset-paginated, column-only JSON for the public /api endpoints.
+
+Rows come back in the order the creator's page shows them: links by
+(position, id), gear newest first by (created_at, id). The next page starts
+strictly after the last row of the current one, so paging clients never skip
+or repeat a row when new ones are added. Only the requested columns are
+selected; no ORM objects are built.
+
+Query parameters:
+
+- ``limit``: rows per page (default 100, at most 500)
+- ``cursor``: opaque value from the previous page's ``Link: rel="next"``
+- ``fields``: comma-separated subset of the resource's fields
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from urllib.parse import urlencode
+
+from sqlalchemy import and_, or_, select
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+
+class ApiError(ValueError):
+    """Bad query parameters; reported to the client as a 400."""
+
+
+class Resource:
+    """A model exposed through the public API, the fields it may return and the column its pages are keyed on"""
+    __slots__ = ('name', 'model', 'fields', 'default_fields', 'sort_key', 'descending')
+
+    def __init__(self, name, model, fields, default_fields=None, sort_key='created_at', descending=True):
+        self.name = name
+        self.model = model
+        self.fields = tuple(fields)
+        self.default_fields = tuple(default_fields or fields)
+        # Rows are ordered by (sort_key, id), both descending or both ascending
+        self.sort_key = sort_key
+        self.descending = descending
+
+
+def dumps(obj):
+    """Serialize to JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+
+def parse_query(resource, args):
+    """Validate ``limit``/``cursor``/``fields`` and return them normalised"""
+    fields = args.get('fields')
+    if fields:
+        fields = tuple(dict.fromkeys(name.strip() for name in fields.split(',') if name.strip()))
+        unknown = [name for name in fields if name not in resource.fields]
+        if unknown or not fields:
+            raise ApiError(f"Unknown field(s) {', '.join(unknown)}; expected {', '.join(resource.fields)}")
+    else:
+        fields = resource.default_fields
+
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError('limit must be an integer')
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ApiError(f'limit must be between 1 and {MAX_LIMIT}')
+
+    cursor = args.get('cursor')
+    return fields, limit, decode_cursor(resource, cursor) if cursor else None
+
+
+def cache_key(resource, fields, limit, cursor):
+    return f"api:{resource.name}:{','.join(fields)}:{limit}:{encode_cursor(*cursor) if cursor else ''}"
+
+
+def encode_cursor(key, id):
+    raw = f"{key.isoformat() if isinstance(key, datetime) else key}|{id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(resource, value):
+    python_type = getattr(resource.model, resource.sort_key).type.python_type
+    parse = datetime.fromisoformat if python_type is datetime else python_type
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode()
+        key, id = raw.split('|')
+        return parse(key), int(id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ApiError('Invalid cursor')
+
+
+def select_page(resource, fields, limit, cursor=None, owner=None):
+    """One column-only SELECT for a page of ``owner``'s rows, plus one row to detect a next page"""
+    model = resource.model
+    sort_key = getattr(model, resource.sort_key)
+    # The sort key and id are always selected so the next cursor can be built
+    columns = [getattr(model, name) for name in fields if name not in (resource.sort_key, 'id')]
+    statement = select(sort_key, model.id, *columns)
+    if owner is not None:
+        statement = statement.where(model.user_id == owner)
+    if cursor is not None:
+        key, id = cursor
+        if resource.descending:
+            statement = statement.where(or_(sort_key < key, and_(sort_key == key, model.id < id)))
+        else:
+            statement = statement.where(or_(sort_key > key, and_(sort_key == key, model.id > id)))
+    # Served by a scan of the (user_id, sort_key, id) index, backwards when descending
+    if resource.descending:
+        return statement.order_by(sort_key.desc(), model.id.desc()).limit(limit + 1)
+    return statement.order_by(sort_key, model.id).limit(limit + 1)
+
+
+def render_page(resource, fields, rows, limit, path):
+    """JSON body and response headers for the rows from :func:`select_page`"""
+    items = []
+    for row in rows[:limit]:
+        mapping = row._mapping
+        item = {}
+        for name in fields:
+            value = mapping[name]
+            item[name] = value.isoformat() if isinstance(value, datetime) else value
+        items.append(item)
+
+    headers = {'Cache-Control': 'no-cache'}
+    if len(rows) > limit:
+        last = rows[limit - 1]._mapping
+        query = {'cursor': encode_cursor(last[resource.sort_key], last['id']), 'limit': limit}
+        if fields != resource.default_fields:
+            query['fields'] = ','.join(fields)
+        headers['Link'] = f'<{path}?{urlencode(query)}>; rel="next"'
+    return dumps(items), headers
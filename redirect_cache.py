@@ -0,0 +1,109 @@
+"""In-memory id -> redirect target map for the tracking routes.
+
+The whole table is loaded in one column-only query the first time it is
+needed and then served from memory. Admin writes invalidate it directly; the
+TTL bounds how stale another worker process can be. Ids that do not exist are
+remembered until the next reload too, so requests for them (scanners walking
+/track/<id>) do not each cost a query.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class RedirectTarget:
+    """The only bits of a Link/Gear row a redirect needs."""
+    __slots__ = ('url', 'is_gear_page', 'owner')
+
+    def __init__(self, url, is_gear_page=False, owner=None):
+        self.url = url
+        self.is_gear_page = is_gear_page
+        # The creator's user id: their gear page, and which of their caches a click invalidates
+        self.owner = owner
+
+
+class RedirectCache:
+    """Lazily warmed id -> RedirectTarget table with a TTL fallback.
+
+    ``load_all`` returns an iterable of ``(id, url, owner)`` rows for the whole
+    table and ``load_one`` returns the ``(url, owner)`` row for a single id (or
+    ``None``). At most ``max_misses`` unknown ids are remembered.
+    """
+
+    def __init__(self, load_all, load_one, ttl=60.0, max_misses=10000):
+        self.load_all = load_all
+        self.load_one = load_one
+        self.ttl = ttl
+        self.max_misses = max_misses
+        self._targets = {}
+        self._misses = OrderedDict()
+        self._expires = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, id):
+        """Return the RedirectTarget for ``id``, or ``None`` if it does not exist."""
+        if self.is_stale():
+            self.warm()
+        target = self._targets.get(id)
+        if target is None:
+            if id in self._misses:
+                return None
+            # Rows added by another worker since our last warm
+            row = self.load_one(id)
+            if row is None:
+                self.put_missing(id)
+                return None
+            target = self.put(id, *row)
+        return target
+
+    def warm(self):
+        """Reload the whole table in one query."""
+        with self._lock:
+            if not self.is_stale():
+                return
+            self.fill(self.load_all())
+
+    def is_stale(self):
+        return time.monotonic() >= self._expires
+
+    def peek(self, id):
+        """Return a cached target without touching the database (``None`` on a miss)."""
+        return self._targets.get(id)
+
+    def is_missing(self, id):
+        """Whether ``id`` was looked up since the last reload and does not exist."""
+        return id in self._misses
+
+    def fill(self, rows):
+        """Replace the table with ``(id, url, owner)`` rows, e.g. loaded by an async caller."""
+        self._targets = {id: self._make_target(url, owner) for id, url, owner in rows}
+        self._misses = OrderedDict()
+        self._expires = time.monotonic() + self.ttl
+
+    def put(self, id, url, owner=None):
+        target = self._make_target(url, owner)
+        self._targets[id] = target
+        self._misses.pop(id, None)
+        return target
+
+    def put_missing(self, id):
+        """Remember that ``id`` does not exist, until the next reload."""
+        with self._lock:
+            self._misses[id] = True
+            while len(self._misses) > self.max_misses:
+                self._misses.popitem(last=False)
+
+    def invalidate(self, id=None):
+        """Drop one entry, or everything when ``id`` is None."""
+        if id is None:
+            self._expires = 0.0
+        else:
+            self._targets.pop(id, None)
+            self._misses.pop(id, None)
+
+    def __len__(self):
+        return len(self._targets)
+
+    @staticmethod
+    def _make_target(url, owner=None):
+        return RedirectTarget(url, is_gear_page=(url == '/gear'), owner=owner)
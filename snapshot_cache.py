@@ -0,0 +1,84 @@
+"""Per-process snapshots of the logged-in user and their preferences.
+
+Flask-Login's user loader and the preferences context processor run on every
+authenticated request. Both read through a SnapshotCache so a page load does
+not pay for them again until an admin write invalidates the entry (or the TTL
+expires, for writes made through another worker).
+"""
+import hashlib
+import threading
+import time
+
+from flask_login import UserMixin
+
+_MISSING = object()
+
+
+class UserSnapshot(UserMixin):
+    """Detached stand-in for ``User`` carrying only what requests read"""
+
+    def __init__(self, id, username):
+        self.id = id
+        self.username = username
+
+    def __repr__(self):
+        return f'<User {self.username}>'
+
+
+class PreferencesSnapshot:
+    """Read-only copy of a Preferences row plus its precomputed theme stylesheet"""
+    __slots__ = ('site_title', 'site_description', 'profile_image', 'background_color',
+                 'accent_color', 'text_color', 'data', 'theme_css', 'theme_etag')
+
+    def __init__(self, data):
+        self.data = data
+        for field in ('site_title', 'site_description', 'profile_image',
+                      'background_color', 'accent_color', 'text_color'):
+            setattr(self, field, data.get(field))
+        self.theme_css = render_theme_css(self)
+        self.theme_etag = hashlib.sha1(self.theme_css.encode()).hexdigest()[:16]
+
+    def to_dict(self):
+        return dict(self.data)
+
+
+def render_theme_css(preferences):
+    """CSS custom properties that used to be rendered inline in base.html"""
+    background = preferences.background_color if preferences else '#000000'
+    accent = preferences.accent_color if preferences else '#E50914'
+    text = preferences.text_color if preferences else '#ffffff'
+    return (
+        ':root {\n'
+        f'    --primary-color: {background};\n'
+        '    --secondary-color: #1a1a1a;\n'
+        f'    --accent-color: {accent};\n'
+        f'    --text-color: {text};\n'
+        '}\n'
+    )
+
+
+class SnapshotCache:
+    """Key -> value cache filled by a loader, with explicit invalidation and a TTL."""
+
+    def __init__(self, loader, ttl=60.0):
+        self.loader = loader
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        value = self.loader(key)
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+        return value
+
+    def invalidate(self, key=_MISSING):
+        with self._lock:
+            if key is _MISSING:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
@@ -0,0 +1,134 @@
+"""Pre-render the public linktree into a static, CDN-friendly build.
+
+Each build lives in ``<output>/<build id>/`` where the build id is a hash of
+one creator's link/gear/preferences rows (the one served at ``/``, by
+default), the templates and the static assets, so an
+unchanged site is never re-rendered. Assets are copied with content-hashed
+file names, and ``redirects.json`` lists the click-tracking paths that still
+have to be proxied to the Flask app.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+from flask import render_template, url_for
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _walk(folder):
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for name in sorted(files):
+            # Precompressed copies from 'flask compress-static' are served by the app only
+            if name.endswith(('.br', '.gz')):
+                continue
+            path = os.path.join(root, name)
+            yield os.path.relpath(path, folder).replace(os.sep, '/'), path
+
+
+def _fingerprinted(name, digest):
+    base, ext = os.path.splitext(name)
+    return f'{base}.{digest[:10]}{ext}'
+
+
+def site_data(Link, Gear, Preferences, owner):
+    """Everything ``owner``'s public pages render, as plain JSON-able rows"""
+    links = Link.query.filter_by(user_id=owner).order_by(Link.position, Link.id).all()
+    gear_items = Gear.query.filter_by(user_id=owner).order_by(Gear.created_at.desc()).all()
+    preferences = Preferences.query.filter_by(user_id=owner).order_by(Preferences.id).all()
+    return {
+        'links': [{'id': l.id, 'title': l.title, 'url': l.url, 'icon': l.icon} for l in links],
+        'gear': [{k: v for k, v in g.to_dict().items() if k not in ('clicks', 'filtered_clicks', 'created_at')} for g in gear_items],
+        'preferences': [p.to_dict() for p in preferences],
+    }, links, gear_items
+
+
+def export_site(app, Link, Gear, Preferences, owner, output='build', force=False, profile=None):
+    """Render ``owner``'s public pages into ``output``. Returns ``(build_dir, rendered)``."""
+    static_folder = app.static_folder
+    template_folder = os.path.join(app.root_path, app.template_folder)
+
+    with app.app_context():
+        data, links, gear_items = site_data(Link, Gear, Preferences, owner)
+
+    assets = {name: _hash_file(path) for name, path in _walk(static_folder)}
+    templates = {name: _hash_file(os.path.join(template_folder, name)) for name in ('index.html', 'gear.html')}
+    fingerprint = hashlib.sha256(
+        json.dumps({'data': data, 'assets': assets, 'templates': templates}, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    build_id = fingerprint[:16]
+    build_dir = os.path.join(output, build_id)
+
+    if os.path.exists(os.path.join(build_dir, 'build.json')) and not force:
+        print(f"Static build {build_id} is up to date")
+        _point_current(output, build_id)
+        return build_dir, False
+
+    tmp_dir = build_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    asset_map = {}
+    for name, path in _walk(static_folder):
+        # cache/ is content-addressed already, and bundles refer to their fonts by name
+        target = 'static/' + (name if name.startswith('cache/') else _fingerprinted(name, assets[name]))
+        os.makedirs(os.path.join(tmp_dir, os.path.dirname(target)), exist_ok=True)
+        shutil.copyfile(path, os.path.join(tmp_dir, target))
+        asset_map[name] = target
+
+    def static_url_for(endpoint, **values):
+        if endpoint == 'static':
+            return '/' + asset_map[values['filename']]
+        if endpoint == 'main.index':
+            return '/'
+        if endpoint == 'main.gear':
+            return '/gear/'
+        # Tracking routes stay dynamic and are proxied to the app
+        return url_for(endpoint, **values)
+
+    redirects = {}
+    with app.test_request_context('/'):
+        pages = {
+            'index.html': render_template('index.html', links=links, profile=profile, url_for=static_url_for),
+            'gear/index.html': render_template('gear.html', gear_items=gear_items, profile=profile,
+                                               url_for=static_url_for),
+        }
+        for link in data['links']:
+            redirects[url_for('main.track_click', id=link['id'])] = link['url']
+        for item in data['gear']:
+            redirects[url_for('main.track_gear_click', id=item['id'])] = item['url']
+
+    for name, html in pages.items():
+        path = os.path.join(tmp_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(html)
+
+    with open(os.path.join(tmp_dir, 'redirects.json'), 'w') as f:
+        json.dump(redirects, f, indent=2, sort_keys=True)
+    with open(os.path.join(tmp_dir, 'build.json'), 'w') as f:
+        json.dump({'build_id': build_id, 'pages': sorted(pages), 'assets': asset_map}, f, indent=2, sort_keys=True)
+
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.replace(tmp_dir, build_dir)
+    _point_current(output, build_id)
+    print(f"Static build {build_id} written to {build_dir}")
+    return build_dir, True
+
+
+def _point_current(output, build_id):
+    """Atomically repoint ``<output>/current`` at the given build"""
+    link = os.path.join(output, 'current')
+    tmp_link = link + '.tmp'
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(build_id, tmp_link)
+    os.replace(tmp_link, link)
@@ -0,0 +1,83 @@
+// Generated by the app (see offline.py); caches are named after the asset build so a new build starts clean
+const VERSION = {{ cache_version|tojson }};
+const PAGES = `pages-${VERSION}`;
+const ASSETS = `assets-${VERSION}`;
+// First path segments that are not creator pages
+const RESERVED = new Set({{ reserved|tojson }});
+const STATIC_PREFIX = {{ static_prefix|tojson }};
+const TARGETS_SUFFIX = '/api/targets';
+
+self.addEventListener('install', () => self.skipWaiting());
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys()
+            .then(names => Promise.all(names.filter(name => name !== PAGES && name !== ASSETS)
+                                            .map(name => caches.delete(name))))
+            .then(() => self.clients.claim())
+    );
+});
+
+// '/', '/gear', '/<username>' and '/<username>/gear'
+function isPublicPage(path) {
+    const segments = path.split('/').filter(Boolean);
+    if (segments.length === 0 || (segments.length === 1 && segments[0] === 'gear')) {
+        return true;
+    }
+    return !RESERVED.has(segments[0].toLowerCase())
+        && (segments.length === 1 || (segments.length === 2 && segments[1] === 'gear'));
+}
+
+// The creator's pages a manifest belongs to, so they can be dropped when it changes
+function pagesOf(targetsPath) {
+    const prefix = targetsPath.slice(0, -TARGETS_SUFFIX.length);
+    return [prefix || '/', `${prefix}/gear`];
+}
+
+// Serve the cached copy at once and refresh it for the next visit
+function staleWhileRevalidate(event, cacheName) {
+    return caches.open(cacheName).then(cache => cache.match(event.request).then(cached => {
+        const fresh = fetch(event.request).then(response => {
+            // A redirected response cannot answer a navigation later
+            if (response.ok && !response.redirected) {
+                cache.put(event.request, response.clone());
+            }
+            return response;
+        });
+        if (cached) {
+            event.waitUntil(fresh.catch(() => {}));
+            return cached;
+        }
+        return fresh;
+    }));
+}
+
+// Always ask for the latest manifest; a new version means the cached pages are out of date
+function networkFirst(request, path) {
+    return caches.open(PAGES).then(cache => fetch(request).then(response => {
+        if (!response.ok) {
+            return response;
+        }
+        return cache.match(request).then(cached => response.clone().json().then(manifest => {
+            const stale = cached ? cached.json().then(old => old.version !== manifest.version) : false;
+            return Promise.resolve(stale).then(changed => changed
+                ? Promise.all(pagesOf(path).map(page => cache.delete(page)))
+                : null);
+        })).then(() => cache.put(request, response.clone())).then(() => response);
+    }).catch(() => cache.match(request).then(cached => cached || Response.error())));
+}
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    const url = new URL(request.url);
+    if (request.method !== 'GET' || url.origin !== self.location.origin) {
+        return;
+    }
+    if (request.mode === 'navigate' && !url.search && isPublicPage(url.pathname)) {
+        event.respondWith(staleWhileRevalidate(event, PAGES));
+    } else if (url.pathname.endsWith(TARGETS_SUFFIX) && url.pathname.split('/').length <= 4) {
+        event.respondWith(networkFirst(request, url.pathname));
+    } else if (url.pathname.startsWith(STATIC_PREFIX)) {
+        event.respondWith(staleWhileRevalidate(event, ASSETS));
+    }
+});
@@ -0,0 +1,117 @@
+"""Username -> user id lookups for the per-creator public pages.
+
+Every ``/<username>`` request needs the owner's id before anything else, so
+the whole (id, username) table is loaded in one column-only query and kept in
+memory, like the redirect cache. Usernames that do not exist are remembered
+too (bounded), so probing random paths does not reach the database. Creating
+or renaming a user invalidates the directory; the TTL bounds how long another
+worker can miss it.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# First path segments that belong to the app, so no creator page can use them
+RESERVED = frozenset({'admin', 'api', 'debug', 'gear', 'metrics', 'static', 'sw.js', 'theme.css', 'track'})
+USERNAME_RE = re.compile(r'^[A-Za-z0-9_][A-Za-z0-9_.-]{0,79}$')
+
+
+def validate_username(username):
+    """The reason ``username`` cannot have a public page, or None"""
+    if not USERNAME_RE.match(username or ''):
+        return 'Usernames are 1-80 letters, digits, "_", "." or "-"'
+    if username.lower() in RESERVED:
+        return f'"{username}" is reserved'
+    return None
+
+
+class TenantDirectory:
+    """Lazily loaded username <-> id map with a TTL and a bounded negative cache.
+
+    ``load_all`` returns ``(id, username)`` rows for every user and
+    ``load_one`` the id for one username (or ``None``).
+    """
+
+    def __init__(self, load_all, load_one, ttl=60.0, default=None, max_misses=10000):
+        self.load_all = load_all
+        self.load_one = load_one
+        self.ttl = ttl
+        # Username served at / and /gear; None means the first user
+        self.default = default
+        self.max_misses = max_misses
+        self._ids = {}
+        self._names = {}
+        self._first = None
+        self._misses = OrderedDict()
+        self._expires = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, username):
+        """The user id for ``username``, or None if there is no such creator"""
+        if self.is_stale():
+            self.warm()
+        id = self._ids.get(username)
+        if id is not None or username in self._misses:
+            return id
+        # Users added by another worker since our last warm
+        id = self.load_one(username)
+        if id is None:
+            with self._lock:
+                self._misses[username] = True
+                while len(self._misses) > self.max_misses:
+                    self._misses.popitem(last=False)
+            return None
+        self._ids[username] = id
+        self._names[id] = username
+        return id
+
+    def peek(self, username):
+        """The cached id without touching the database; None on a miss or while stale"""
+        return None if self.is_stale() else self._ids.get(username)
+
+    def username(self, user_id):
+        if self.is_stale():
+            self.warm()
+        return self._names.get(user_id)
+
+    def default_id(self):
+        """The user whose pages are served at / and /gear"""
+        if self.is_stale():
+            self.warm()
+        if self.default:
+            return self.get(self.default)
+        return self._first
+
+    def peek_default(self):
+        """``default_id()`` without touching the database; None while stale"""
+        if self.is_stale():
+            return None
+        return self._ids.get(self.default) if self.default else self._first
+
+    def is_default(self, user_id):
+        return user_id is not None and user_id == self.default_id()
+
+    def warm(self):
+        with self._lock:
+            if not self.is_stale():
+                return
+            self.fill(self.load_all())
+
+    def fill(self, rows):
+        """Replace the directory with ``(id, username)`` rows"""
+        rows = list(rows)
+        self._ids = {username: id for id, username in rows}
+        self._names = {id: username for id, username in rows}
+        self._first = min(self._names, default=None)
+        self._misses = OrderedDict()
+        self._expires = time.monotonic() + self.ttl
+
+    def is_stale(self):
+        return time.monotonic() >= self._expires
+
+    def invalidate(self):
+        self._expires = 0.0
+
+    def __len__(self):
+        return len(self._ids)
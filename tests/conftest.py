@@ -0,0 +1,63 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StandIn(ThreadingHTTPServer):
+    """Local HTTP server answering from ``routes``: path -> (status, headers, body) or a callable returning one"""
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.routes = {}
+        self.requests = []
+        self._lock = threading.Lock()
+
+    @property
+    def base(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def url(self, path):
+        return self.base + path
+
+    def record(self, method, path):
+        with self._lock:
+            self.requests.append((method, path))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _answer(self, body_allowed):
+        self.server.record(self.command, self.path)
+        route = self.server.routes.get(self.path, (404, {}, b''))
+        status, headers, body = route(self) if callable(route) else route
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body_allowed:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self._answer(True)
+
+    def do_HEAD(self):
+        self._answer(False)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stand_in():
+    server = StandIn()
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,39 @@
+import pytest
+
+import admin_batch
+import app as linktree
+from models import db, Link
+
+
+@pytest.fixture
+def flask_app(tmp_path):
+    app = linktree.create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "batch.db"}'})
+    with app.app_context():
+        linktree.init_db()
+        yield app
+    linktree.app_state(app).click_buffer.stop()
+
+
+def positions():
+    return [link.id for link in Link.query.filter_by(user_id=1).order_by(Link.position, Link.id)]
+
+
+def test_partial_reorder_keeps_the_other_links_below(flask_app):
+    before = positions()
+    assert len(before) >= 4
+    moved = [before[-1], before[1]]
+    admin_batch.apply(db.session, linktree.BATCH_TARGETS, [{'op': 'reorder', 'ids': moved}], 1)
+    db.session.commit()
+
+    after = positions()
+    assert after == moved + [id for id in before if id not in moved]
+    # Every link has its own position
+    assert sorted(link.position for link in Link.query.filter_by(user_id=1)) == list(range(len(before)))
+
+
+def test_reorder_rejects_links_of_another_user(flask_app):
+    other = Link(title='Other', url='https://example.com', user_id=2, position=0)
+    db.session.add(other)
+    db.session.commit()
+    with pytest.raises(admin_batch.BatchError, match='not found'):
+        admin_batch.apply(db.session, linktree.BATCH_TARGETS, [{'op': 'reorder', 'ids': [other.id]}], 1)
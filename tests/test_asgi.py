@@ -0,0 +1,100 @@
+import asyncio
+import os
+
+import pytest
+
+import app as linktree
+import asgi
+from asgi import AsyncLinktree
+
+
+@pytest.fixture
+def flask_app(tmp_path):
+    app = linktree.create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "asgi.db"}',
+                               'ADMIN_PASSWORD': 'pw', 'CLICK_DEDUP_WINDOW': 0})
+    with app.app_context():
+        linktree.init_db()
+    yield app
+    linktree.app_state(app).click_buffer.stop()
+
+
+def call(application, path, method='GET', headers=()):
+    """Run one request through the ASGI app; returns (status, headers, body)"""
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    async def run():
+        try:
+            scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'headers': list(headers),
+                     'client': ('127.0.0.1', 50000), 'http_version': '1.1', 'scheme': 'http', 'root_path': '',
+                     'server': ('testserver', 80)}
+            await application(scope, receive, send)
+        finally:
+            if application.engine is not None:
+                await application.engine.dispose()
+                application.engine = None
+
+    asyncio.run(run())
+    start = next(message for message in messages if message['type'] == 'http.response.start')
+    body = b''.join(message.get('body', b'') for message in messages if message['type'] == 'http.response.body')
+    return start['status'], dict(start['headers']), body
+
+
+@pytest.mark.parametrize('path', ['/api/links', '/track/2', '/track/999'])
+def test_head_has_no_body(flask_app, path):
+    application = AsyncLinktree(flask_app)
+    get_status, get_headers, get_body = call(application, path)
+    head_status, head_headers, head_body = call(application, path, 'HEAD')
+    assert head_status == get_status
+    assert head_body == b''
+    assert head_headers[b'content-length'] == get_headers[b'content-length'] == str(len(get_body)).encode()
+
+
+def test_head_of_a_cached_page_has_no_body(flask_app):
+    flask_app.test_client().get('/')
+    status, headers, body = call(AsyncLinktree(flask_app), '/', 'HEAD')
+    assert status == 200 and body == b''
+    assert int(headers[b'content-length']) > 0
+
+
+def test_async_engine_uses_the_db_profile(flask_app):
+    application = AsyncLinktree(flask_app)
+    engine = application._create_engine()
+    try:
+        pool = engine.sync_engine.pool
+        assert pool.size() == linktree.db_profiles.PROFILES[flask_app.config['DB_PROFILE']]['pool_size']
+    finally:
+        asyncio.run(engine.dispose())
+
+    # Warms the creator directory, so the async path serves the next request
+    flask_app.test_client().get('/')
+    status, _, _ = call(application, '/api/links')
+    assert status == 200
+    stats = linktree.app_state(flask_app).async_pool_metrics.snapshot()
+    assert stats['checkouts'] > 0 and stats['checked_out'] == 0
+
+
+def session_headers(flask_app, cookie):
+    return {'cookie': f'{flask_app.config["SESSION_COOKIE_NAME"]}={cookie}', 'user-agent': 'pytest'}
+
+
+def test_session_user_goes_through_flask_login(flask_app):
+    # init_db seeds the admin with $ADMIN_PASSWORD, 'admin' when unset
+    client = flask_app.test_client()
+    response = client.post('/admin/login', data={'username': 'admin', 'password': os.environ.get('ADMIN_PASSWORD', 'admin')},
+                           headers={'User-Agent': 'pytest'})
+    assert response.status_code == 302
+    cookie = client.get_cookie(flask_app.config['SESSION_COOKIE_NAME']).value
+    scope = {'path': '/admin/clicks/stream', 'method': 'GET', 'client': ('127.0.0.1', 50000)}
+    assert asgi._session_user(flask_app, scope, session_headers(flask_app, cookie)) == 1
+
+    # A validly signed session for a user that does not exist is not trusted
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    forged = serializer.dumps({'_user_id': '999', '_fresh': True})
+    assert asgi._session_user(flask_app, scope, session_headers(flask_app, forged)) is None
+    assert asgi._session_user(flask_app, scope, {}) is None
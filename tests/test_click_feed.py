@@ -0,0 +1,29 @@
+import pytest
+
+from click_feed import ClickFeed, FeedFull
+
+
+def test_threaded_streams_are_capped():
+    feed = ClickFeed(max_subscribers=10, max_threaded=2)
+    first = feed.subscribe(1, threaded=True)
+    feed.subscribe(2, threaded=True)
+    with pytest.raises(FeedFull):
+        feed.subscribe(1, threaded=True)
+    # Streams served on an event loop only count against max_subscribers
+    feed.subscribe(1)
+    feed.unsubscribe(first)
+    feed.unsubscribe(first)
+    assert feed.threaded_count() == 1
+    feed.subscribe(1, threaded=True)
+    feed.stop()
+    assert feed.threaded_count() == 0 and feed.subscriber_count() == 0
+
+
+def test_stream_releases_its_thread_slot():
+    feed = ClickFeed(max_threaded=1)
+    stream = feed.stream(feed.subscribe(1, threaded=True), initial={})
+    assert next(stream) == 'retry: 3000\n\n'
+    stream.close()
+    assert feed.threaded_count() == 0
+    feed.subscribe(1, threaded=True)
+    feed.stop()
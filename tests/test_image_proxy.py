@@ -0,0 +1,114 @@
+import io
+import ipaddress
+import socket
+
+import pytest
+from PIL import Image
+
+import outbound_http
+from image_proxy import ImageFetchError, RemoteImageCache
+
+
+def png_bytes():
+    buffer = io.BytesIO()
+    Image.new('RGB', (4, 4), 'red').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+PNG = ({'Content-Type': 'image/png'}, png_bytes())
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return RemoteImageCache(str(tmp_path), allow_private=True)
+
+
+@pytest.fixture
+def loopback_is_public(monkeypatch):
+    """Treat the stand-in server's 127.0.0.1 as a public address, and nothing else private"""
+    monkeypatch.setattr(outbound_http, 'is_public',
+                        lambda address: address == '127.0.0.1' or ipaddress.ip_address(address).is_global)
+
+
+def test_fetch_stores_image(stand_in, cache, tmp_path):
+    stand_in.routes['/a.png'] = (200, *PNG)
+    name = cache.fetch(stand_in.url('/a.png'))
+    assert name.endswith('.png')
+    assert (tmp_path / 'cache' / 'remote' / name).read_bytes() == PNG[1]
+    # A second fetch is served from the ref file
+    assert cache.fetch(stand_in.url('/a.png')) == name
+    assert stand_in.requests == [('GET', '/a.png')]
+
+
+def test_fetch_follows_redirects(stand_in, cache):
+    stand_in.routes['/old'] = (302, {'Location': '/a.png'}, b'')
+    stand_in.routes['/a.png'] = (200, *PNG)
+    assert cache.fetch(stand_in.url('/old')).endswith('.png')
+    assert stand_in.requests == [('GET', '/old'), ('GET', '/a.png')]
+
+
+def test_fetch_rejects_non_images_and_errors(stand_in, cache):
+    stand_in.routes['/page'] = (200, {'Content-Type': 'text/html'}, b'<html></html>')
+    with pytest.raises(ImageFetchError, match='not an image'):
+        cache.fetch(stand_in.url('/page'))
+    with pytest.raises(ImageFetchError, match='HTTP 404'):
+        cache.fetch(stand_in.url('/missing.png'))
+
+
+def test_failed_urls_are_retried_after_the_ttl_and_bounded(stand_in, tmp_path):
+    cache = RemoteImageCache(str(tmp_path), allow_private=True, max_attempts=2, failure_ttl=60, max_failed=2)
+    missing = stand_in.url('/missing.png')
+    for _ in range(2):
+        cache.submit(missing).result()
+    assert cache.submit(missing) is None
+
+    failures, failed_at = cache._failed[missing]
+    cache._failed[missing] = (failures, failed_at - 60)
+    cache.submit(missing).result()
+    assert cache._failed[missing][0] == 1
+
+    for i in range(3):
+        cache.submit(stand_in.url(f'/missing/{i}.png')).result()
+    assert len(cache._failed) == 2 and missing not in cache._failed
+    cache.shutdown()
+
+
+def test_fetch_limits_redirects(stand_in, cache):
+    stand_in.routes['/loop'] = (302, {'Location': '/loop'}, b'')
+    with pytest.raises(ImageFetchError, match='redirects'):
+        cache.fetch(stand_in.url('/loop'))
+    assert len(stand_in.requests) == cache.max_redirects + 1
+
+
+def test_private_addresses_are_refused(stand_in, tmp_path):
+    stand_in.routes['/a.png'] = (200, *PNG)
+    with pytest.raises(outbound_http.AddressError, match='non-public'):
+        RemoteImageCache(str(tmp_path)).fetch(stand_in.url('/a.png'))
+    assert stand_in.requests == []
+
+
+@pytest.mark.parametrize('target', ['http://169.254.169.254/latest/meta-data/', 'http://10.0.0.1/a.png',
+                                    'http://127.0.0.2/a.png'])
+def test_redirect_to_private_address_is_refused(stand_in, tmp_path, loopback_is_public, target):
+    stand_in.routes['/a.png'] = (302, {'Location': target}, b'')
+    with pytest.raises(outbound_http.AddressError, match='non-public'):
+        RemoteImageCache(str(tmp_path)).fetch(stand_in.url('/a.png'))
+    assert stand_in.requests == [('GET', '/a.png')]
+
+
+def test_connects_to_the_address_it_checked(stand_in, tmp_path, loopback_is_public, monkeypatch):
+    """A name that resolves to a public address once and a private one after (DNS rebinding)"""
+    answers = iter(['127.0.0.1', '10.0.0.1'])
+    real_getaddrinfo = socket.getaddrinfo
+
+    def rebinding_getaddrinfo(host, port, *args, **kwargs):
+        if host != 'images.example':
+            return real_getaddrinfo(host, port, *args, **kwargs)
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (next(answers), port))]
+
+    monkeypatch.setattr(socket, 'getaddrinfo', rebinding_getaddrinfo)
+    stand_in.routes['/a.png'] = (200, *PNG)
+    port = stand_in.server_address[1]
+    assert RemoteImageCache(str(tmp_path)).fetch(f'http://images.example:{port}/a.png').endswith('.png')
+    # Resolved once; the second (private) answer was never asked for
+    assert next(answers) == '10.0.0.1'
@@ -0,0 +1,146 @@
+import socket
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+import link_health
+import outbound_http
+from link_health import LinkChecker
+from models import db, Link, LinkHealth, User
+
+OK = (200, {'Content-Type': 'text/html'}, b'ok')
+
+
+@pytest.fixture
+def checker():
+    return LinkChecker(workers=8, per_host=2, timeout=5, allow_private=True)
+
+
+def test_redirect_hops_are_counted(stand_in, checker):
+    stand_in.routes['/a'] = (301, {'Location': '/b'}, b'')
+    stand_in.routes['/b'] = (302, {'Location': stand_in.url('/c')}, b'')
+    stand_in.routes['/c'] = OK
+    result = checker.check(stand_in.url('/a'))
+    assert result.ok and result.status == 200
+    assert result.redirects == 2
+    assert result.final_url == stand_in.url('/c')
+    assert result.error is None
+
+
+def test_head_refused_falls_back_to_get(stand_in, checker):
+    stand_in.routes['/no-head'] = lambda request: OK if request.command == 'GET' else (405, {}, b'')
+    result = checker.check(stand_in.url('/no-head'))
+    assert result.status == 200
+    assert stand_in.requests == [('HEAD', '/no-head'), ('GET', '/no-head')]
+
+
+def test_broken_link(stand_in, checker):
+    result = checker.check(stand_in.url('/missing'))
+    assert result.status == 404 and not result.ok
+
+
+def test_max_redirects(stand_in):
+    stand_in.routes['/loop'] = (302, {'Location': '/loop'}, b'')
+    result = LinkChecker(max_redirects=3, allow_private=True).check(stand_in.url('/loop'))
+    assert result.status is None
+    assert result.error == 'more than 3 redirects'
+    assert result.redirects == 4
+    assert len(stand_in.requests) == 4
+
+
+def test_per_host_limit(stand_in, checker):
+    active, peak, lock = [0], [0], threading.Lock()
+
+    def slow(request):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.1)
+        with lock:
+            active[0] -= 1
+        return OK
+
+    for i in range(8):
+        stand_in.routes[f'/slow/{i}'] = slow
+    results = checker.check_many(stand_in.url(f'/slow/{i}') for i in range(8))
+    assert len(results) == 8 and all(result.ok for result in results.values())
+    assert peak[0] == checker.per_host
+    # Idle hosts are forgotten
+    assert checker._hosts == {}
+
+
+def test_private_addresses_are_refused(stand_in):
+    result = LinkChecker().check(stand_in.url('/'))
+    assert result.status is None and 'non-public' in result.error
+    assert stand_in.requests == []
+
+
+def test_redirect_to_private_address_is_refused(stand_in, monkeypatch):
+    monkeypatch.setattr(outbound_http, 'is_public', lambda address: address == '127.0.0.1')
+    stand_in.routes['/out'] = (302, {'Location': 'http://169.254.169.254/latest/meta-data/'}, b'')
+    result = LinkChecker().check(stand_in.url('/out'))
+    assert result.status is None and 'non-public' in result.error
+    assert result.redirects == 1
+    assert stand_in.requests == [('HEAD', '/out')]
+
+
+def test_connects_to_the_address_it_checked(stand_in, monkeypatch):
+    monkeypatch.setattr(outbound_http, 'is_public', lambda address: address == '127.0.0.1')
+    lookups = []
+    real_getaddrinfo = socket.getaddrinfo
+
+    def rebinding_getaddrinfo(host, port, *args, **kwargs):
+        if host != 'links.example':
+            return real_getaddrinfo(host, port, *args, **kwargs)
+        lookups.append(host)
+        # Public for the first lookup of each request, private for any lookup after it
+        address = '127.0.0.1' if len(lookups) % 2 else '10.0.0.1'
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (address, port))]
+
+    monkeypatch.setattr(socket, 'getaddrinfo', rebinding_getaddrinfo)
+    stand_in.routes['/'] = OK
+    result = LinkChecker().check(f'http://links.example:{stand_in.server_address[1]}/')
+    assert result.status == 200
+    assert lookups == ['links.example']
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(id=1, username='creator', password_hash='x'))
+        db.session.commit()
+        yield app
+
+
+def test_redirect_select_rewrites_healthy_chains_only(app, stand_in, checker):
+    stand_in.routes['/moved'] = (301, {'Location': '/new-home'}, b'')
+    stand_in.routes['/new-home'] = OK
+    stand_in.routes['/moved-away'] = (301, {'Location': '/gone'}, b'')
+    stand_in.routes['/direct'] = OK
+    urls = {'healthy': '/moved', 'broken': '/moved-away', 'direct': '/direct', 'edited': '/moved'}
+    for id, (title, path) in enumerate(urls.items(), 1):
+        db.session.add(Link(id=id, user_id=1, title=title, url=stand_in.url(path)))
+    db.session.commit()
+
+    targets = link_health.load_targets(db.session, {'link': Link})
+    link_health.save_results(db.session, LinkHealth, targets, checker.check_many(url for _, _, url in targets))
+    # Edited after the check, so its stored result no longer applies
+    db.session.get(Link, 4).url = stand_in.url('/moved?edited')
+    db.session.commit()
+
+    rewritten = {id: url for id, url, _ in db.session.execute(
+        link_health.redirect_select(Link, LinkHealth, 'link', rewrite=True))}
+    assert rewritten == {
+        1: stand_in.url('/new-home'),
+        2: stand_in.url('/moved-away'),
+        3: stand_in.url('/direct'),
+        4: stand_in.url('/moved?edited'),
+    }
+    unchanged = {id: url for id, url, _ in db.session.execute(link_health.redirect_select(Link, LinkHealth, 'link'))}
+    assert unchanged[1] == stand_in.url('/moved')
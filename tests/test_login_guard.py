@@ -0,0 +1,42 @@
+import threading
+import time
+
+import pytest
+
+from login_guard import LoginBusy, PasswordVerifier
+
+
+def wait_idle(verifier):
+    deadline = time.monotonic() + 5
+    while verifier.in_flight and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_timed_out_check_keeps_its_slot_until_it_finishes():
+    verifier = PasswordVerifier(workers=1, max_queued=1, timeout=0.05)
+    release = threading.Event()
+    with pytest.raises(LoginBusy, match='timed out'):
+        verifier._run(release.wait, 5)
+    # Still hashing: the queue slot is free, the worker's is not
+    assert verifier.in_flight == 1
+    with pytest.raises(LoginBusy, match='timed out'):
+        verifier._run(release.wait, 5)
+    # That one never started, so cancelling it freed its slot
+    assert verifier.in_flight == 1
+    release.set()
+    wait_idle(verifier)
+    assert verifier._run(lambda: 'done') == 'done'
+    verifier.stop()
+
+
+def test_slots_bound_running_and_queued_checks():
+    verifier = PasswordVerifier(workers=1, max_queued=0, timeout=0.05)
+    release = threading.Event()
+    with pytest.raises(LoginBusy, match='timed out'):
+        verifier._run(release.wait, 5)
+    with pytest.raises(LoginBusy, match='in progress'):
+        verifier._run(lambda: 'done')
+    release.set()
+    wait_idle(verifier)
+    assert verifier._run(lambda: 'done') == 'done'
+    verifier.stop()
@@ -0,0 +1,41 @@
+import re
+
+import pytest
+
+import admin_batch
+import app as linktree
+from models import db, Link
+
+
+@pytest.fixture
+def flask_app(tmp_path):
+    app = linktree.create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "api.db"}'})
+    with app.app_context():
+        linktree.init_db()
+    yield app
+    linktree.app_state(app).click_buffer.stop()
+
+
+def all_pages(client, url):
+    ids = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        ids += [item['id'] for item in response.get_json()]
+        next_page = re.search(r'<([^>]+)>; rel="next"', response.headers.get('Link', ''))
+        url = next_page.group(1) if next_page else None
+    return ids
+
+
+def test_links_are_paged_in_page_order(flask_app):
+    with flask_app.app_context():
+        ids = [link.id for link in Link.query.filter_by(user_id=1)]
+        admin_batch.apply(db.session, linktree.BATCH_TARGETS, [{'op': 'reorder', 'ids': ids[1:] + ids[:1]}], 1)
+        db.session.commit()
+        page_order = [link.id for link in Link.query.filter_by(user_id=1).order_by(Link.position, Link.id)]
+    assert page_order == ids[1:] + ids[:1]
+    assert all_pages(flask_app.test_client(), '/api/links?limit=1') == page_order
+
+
+def test_bad_cursor_is_rejected(flask_app):
+    assert flask_app.test_client().get('/api/links?cursor=bad').status_code == 400
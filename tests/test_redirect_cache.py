@@ -0,0 +1,46 @@
+from redirect_cache import RedirectCache
+
+
+def make_cache(rows, **kwargs):
+    lookups = []
+
+    def load_one(id):
+        lookups.append(id)
+        return next(((url, owner) for row_id, url, owner in rows if row_id == id), None)
+
+    return RedirectCache(load_all=lambda: list(rows), load_one=load_one, **kwargs), lookups
+
+
+def test_unknown_ids_are_looked_up_once():
+    cache, lookups = make_cache([(1, 'https://a.example/', 1)])
+    assert cache.get(1).url == 'https://a.example/'
+    assert cache.get(2) is None
+    assert cache.get(2) is None
+    assert lookups == [2]
+    assert cache.is_missing(2)
+
+
+def test_created_ids_are_not_hidden_by_a_miss():
+    rows = [(1, 'https://a.example/', 1)]
+    cache, lookups = make_cache(rows)
+    assert cache.get(2) is None
+    rows.append((2, 'https://b.example/', 1))
+    cache.invalidate(2)
+    assert cache.get(2).url == 'https://b.example/'
+    assert lookups == [2, 2]
+
+
+def test_misses_are_forgotten_on_reload():
+    cache, lookups = make_cache([], ttl=0)
+    assert cache.get(5) is None
+    # A zero TTL reloads the table on every get, which forgets the miss
+    assert cache.get(5) is None
+    assert lookups == [5, 5]
+
+
+def test_misses_are_bounded():
+    cache, _ = make_cache([], max_misses=2)
+    for id in (1, 2, 3):
+        cache.get(id)
+    assert not cache.is_missing(1)
+    assert cache.is_missing(2) and cache.is_missing(3)